@@ -1,19 +1,63 @@
-from importlib.metadata import PackageNotFoundError
-from calmapp import App
-from calmapp import plugins
+"""
+Public names are imported lazily, on first access - `import bot_lib` itself is cheap.
+This matters for cold starts of serverless and webhook workers.
+"""
 
-from .core import BotManager, setup_dispatcher, BotConfig
-from .handlers import Handler, HandlerDisplayMode
+from typing import TYPE_CHECKING
 
-try:
-    import importlib.metadata
+# name -> module it's imported from
+_LAZY_IMPORTS = {
+    "App": "calmapp",
+    "plugins": "calmapp",
+    "BotManager": "bot_lib.core.bot_manager",
+    "setup_dispatcher": "bot_lib.core.bot_manager",
+    "BotConfig": "bot_lib.core.bot_manager",
+    "Handler": "bot_lib.handlers.handler",
+    "HandlerDisplayMode": "bot_lib.handlers.handler",
+}
 
-    __version__ = importlib.metadata.version(__package__ or __name__)
-    del importlib
-except PackageNotFoundError:
-    import toml
-    from pathlib import Path
+__all__ = [*_LAZY_IMPORTS, "__version__"]
 
-    path = Path(__file__).parent.parent / "pyproject.toml"
-    __version__ = toml.load(path)["tool"]["poetry"]["version"]
-    del toml, Path, path
+if TYPE_CHECKING:
+    from calmapp import App, plugins
+
+    from .core import BotManager, setup_dispatcher, BotConfig
+    from .handlers import Handler, HandlerDisplayMode
+
+
+def _get_version() -> str:
+    from importlib.metadata import PackageNotFoundError, version
+
+    try:
+        return version(__package__ or __name__)
+    except PackageNotFoundError:
+        # running from source
+        import tomllib
+        from pathlib import Path
+
+        path = Path(__file__).parent.parent / "pyproject.toml"
+        with open(path, "rb") as f:
+            return tomllib.load(f)["tool"]["poetry"]["version"]
+
+
+def __getattr__(name: str):
+    if name == "__version__":
+        value = _get_version()
+    elif name in _LAZY_IMPORTS:
+        import importlib
+
+        module = importlib.import_module(_LAZY_IMPORTS[name])
+        try:
+            value = getattr(module, name)
+        except AttributeError:
+            # a submodule, like `from calmapp import plugins`
+            value = importlib.import_module(f"{module.__name__}.{name}")
+    else:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    # cache - next access doesn't go through __getattr__
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted({*globals(), *__all__})
@@ -1 +1,50 @@
-from .bot_manager import BotManager, setup_dispatcher, BotConfig
+# imported lazily - see bot_lib/__init__.py
+from typing import TYPE_CHECKING
+
+_LAZY_IMPORTS = {
+    "BotManager": "bot_lib.core.bot_manager",
+    "setup_dispatcher": "bot_lib.core.bot_manager",
+    "BotConfig": "bot_lib.core.bot_manager",
+    "OutboundScheduler": "bot_lib.core.rate_limiter",
+    "TokenBucket": "bot_lib.core.rate_limiter",
+    "DownloadedFile": "bot_lib.core.downloads",
+    "DownloadError": "bot_lib.core.downloads",
+    "LargeFileDownloader": "bot_lib.core.downloads",
+    "FileCache": "bot_lib.core.downloads",
+    "TTLCache": "bot_lib.core.cache",
+    "MessageHistoryWriter": "bot_lib.core.history_writer",
+    "UpdateCodec": "bot_lib.core.history_codec",
+    "AppFunctionRunner": "bot_lib.core.app_runner",
+    "cpu_bound": "bot_lib.core.app_runner",
+    "ShardedDispatcher": "bot_lib.core.sharding",
+    "ChatScheduler": "bot_lib.core.chat_scheduler",
+    "release_chat_turn": "bot_lib.core.chat_scheduler",
+}
+
+__all__ = list(_LAZY_IMPORTS)
+
+if TYPE_CHECKING:
+    from .bot_manager import BotManager, setup_dispatcher, BotConfig
+    from .rate_limiter import OutboundScheduler, TokenBucket
+    from .downloads import DownloadedFile, DownloadError, LargeFileDownloader
+    from .downloads import FileCache
+    from .cache import TTLCache
+    from .history_writer import MessageHistoryWriter
+    from .history_codec import UpdateCodec
+    from .app_runner import AppFunctionRunner, cpu_bound
+    from .sharding import ShardedDispatcher
+    from .chat_scheduler import ChatScheduler, release_chat_turn
+
+
+def __getattr__(name: str):
+    if name not in _LAZY_IMPORTS:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    import importlib
+
+    value = getattr(importlib.import_module(_LAZY_IMPORTS[name]), name)
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted({*globals(), *__all__})
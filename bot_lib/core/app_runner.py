@@ -0,0 +1,143 @@
+"""
+Run app functions without blocking the event loop
+
+Handlers call app functions - some are async, some are plain functions doing
+DB queries or file parsing. A sync function called inside a coroutine freezes
+every chat served by the process, so AppFunctionRunner runs them in a pool:
+- async functions - awaited directly
+- sync functions - in a thread pool
+- sync functions marked with @cpu_bound - in a process pool (must be picklable)
+Each command (key) has its own concurrency limit, pooled calls can have a timeout.
+"""
+
+import asyncio
+import inspect
+import os
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from functools import partial
+from typing import Callable, Dict, Hashable, Optional
+
+CPU_BOUND_ATTR = "_bot_lib_cpu_bound"
+
+
+def cpu_bound(func: Callable) -> Callable:
+    """
+    Mark a sync app function to be run in a process pool - e.g. heavy parsing
+    The function and its arguments are pickled, so prefer module-level functions or static methods
+    """
+    setattr(func, CPU_BOUND_ATTR, True)
+    return func
+
+
+def is_cpu_bound(func: Callable) -> bool:
+    # bound methods delegate attribute access to the function
+    return getattr(func, CPU_BOUND_ATTR, False)
+
+
+class AppFunctionRunner:
+    """
+    Usage:
+        runner = AppFunctionRunner(max_threads=8, command_concurrency=4)
+        result = await runner.run(app.get_stats, args=(user,), key="get_stats")
+    """
+
+    def __init__(
+        self,
+        max_threads: int = 8,
+        max_processes: Optional[int] = None,
+        command_concurrency: int = 4,
+        timeout: Optional[float] = None,
+    ):
+        """
+        :param max_threads: thread pool size for sync functions
+        :param max_processes: process pool size for @cpu_bound functions. Defaults to the number of CPUs
+        :param command_concurrency: max parallel calls per key (command). 0 - unlimited
+        :param timeout: max duration of sync calls, seconds. None (default) - no timeout.
+            Async functions (e.g. long LLM calls) are not limited by default.
+            Note: a timed out sync call keeps running in its worker - only the handler stops waiting.
+            It keeps its command_concurrency slot until it finishes
+        """
+        self.max_threads = max_threads
+        self.max_processes = max_processes or os.cpu_count() or 1
+        self.command_concurrency = command_concurrency
+        self.timeout = timeout
+        self._thread_pool: Optional[ThreadPoolExecutor] = None
+        self._process_pool: Optional[ProcessPoolExecutor] = None
+        self._semaphores: Dict[Hashable, asyncio.Semaphore] = {}
+
+    def _get_semaphore(self, key: Hashable) -> Optional[asyncio.Semaphore]:
+        if not self.command_concurrency:
+            return None
+        semaphore = self._semaphores.get(key)
+        if semaphore is None:
+            semaphore = self._semaphores[key] = asyncio.Semaphore(self.command_concurrency)
+        return semaphore
+
+    def _get_executor(self, func: Callable):
+        if is_cpu_bound(func):
+            if self._process_pool is None:
+                self._process_pool = ProcessPoolExecutor(max_workers=self.max_processes)
+            return self._process_pool
+        if self._thread_pool is None:
+            self._thread_pool = ThreadPoolExecutor(max_workers=self.max_threads, thread_name_prefix="app")
+        return self._thread_pool
+
+    async def _call_async(self, func: Callable, args: tuple, kwargs: dict, timeout: Optional[float]):
+        if timeout is None:
+            return await func(*args, **kwargs)
+        return await asyncio.wait_for(func(*args, **kwargs), timeout)
+
+    async def _wait_pooled(self, future: asyncio.Future, timeout: Optional[float]):
+        # shield - on timeout the future keeps tracking the worker, which can't be stopped
+        result = await asyncio.wait_for(asyncio.shield(future), timeout if timeout is not None else self.timeout)
+        if inspect.isawaitable(result):
+            # sync function returning a coroutine - e.g. a wrapped async one. Await it on the loop
+            result = await result
+        return result
+
+    async def run(
+        self,
+        func: Callable,
+        args: tuple = (),
+        kwargs: dict = None,
+        key: Hashable = None,
+        timeout: float = None,
+    ):
+        """
+        Call the app function off the event loop
+        The function arguments are passed as args / kwargs - they may come from user input,
+        so they never mix with the runner's own parameters
+        :param key: concurrency limit key, e.g. command name. Defaults to the function name
+        :param timeout: max call duration, seconds. Defaults to the runner timeout for sync functions,
+            async functions have no timeout unless it's set here
+        :raises asyncio.TimeoutError: if the call takes longer than the timeout
+        """
+        if kwargs is None:
+            kwargs = {}
+        if key is None:
+            key = getattr(func, "__qualname__", None) or repr(func)
+        semaphore = self._get_semaphore(key)
+        if semaphore is not None:
+            await semaphore.acquire()
+        future = None
+        try:
+            if inspect.iscoroutinefunction(func):
+                return await self._call_async(func, args, kwargs, timeout)
+            loop = asyncio.get_running_loop()
+            future = loop.run_in_executor(self._get_executor(func), partial(func, *args, **kwargs))
+            return await self._wait_pooled(future, timeout)
+        finally:
+            if semaphore is not None:
+                if future is not None and not future.done():
+                    # timed out or cancelled - the worker is still busy, so is the slot
+                    future.add_done_callback(lambda _: semaphore.release())
+                else:
+                    semaphore.release()
+
+    def shutdown(self, wait: bool = False):
+        if self._thread_pool is not None:
+            self._thread_pool.shutdown(wait=wait, cancel_futures=True)
+            self._thread_pool = None
+        if self._process_pool is not None:
+            self._process_pool.shutdown(wait=wait, cancel_futures=True)
+            self._process_pool = None
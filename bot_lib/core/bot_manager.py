@@ -8,6 +8,9 @@ from aiogram.types import Update
 from loguru import logger
 from typing_extensions import deprecated
 
+from bot_lib.core.chat_scheduler import ChatScheduler
+from bot_lib.core.history_codec import UpdateCodec
+from bot_lib.core.history_writer import MessageHistoryWriter
 from bot_lib.handlers.basic_handler import BasicHandler
 from bot_lib.handlers.handler import HandlerDisplayMode
 from calmapp import App
@@ -20,20 +23,40 @@ class BotManager:
         BasicHandler,
     ]
 
-    def __init__(self, app: App = None, handlers: tuple = None):
+    # message history is saved in batches, in the background - see MessageHistoryWriter
+    HISTORY_BATCH_SIZE = 100
+    HISTORY_FLUSH_INTERVAL = 1.0  # seconds
+    HISTORY_MAX_QUEUE_SIZE = 10_000
+    HISTORY_STOP_TIMEOUT = 10.0  # seconds to flush the queue on shutdown, None - no limit
+
+    # updates of a chat are processed in order, different chats in parallel - see ChatScheduler
+    CHAT_SCHEDULER_ENABLED = True
+    CHAT_SCHEDULER_MAX_WORKERS = 100
+    CHAT_SCHEDULER_MAX_CHAT_QUEUE = None  # max updates waiting per chat, None - unlimited (nothing is dropped)
+    CHAT_SCHEDULER_OVERFLOW_POLICY = "drop_oldest"
+
+    def __init__(self, app: App = None, handlers: tuple = None, history_codec: UpdateCodec = None):
+        """
+        :param handlers: Handler classes, or names of beta handlers - see bot_lib.handlers.beta
+        :param history_codec: compact serialization for message history, e.g. UpdateCodec(pack=True).
+            If not set - full update dumps are stored
+        """
         if app is None:
             app = self.DEFAULT_APP()
         self.app: App = app
         if handlers is None:
             handlers = self.DEFAULT_HANDLERS
         self.handlers = handlers
+        self.history_codec = history_codec
+        self.history_writer = None
+        self.chat_scheduler = None
 
     def setup_dispatcher(self, dispatcher, extra_handlers=None):
         dispatcher["app"] = self.app
 
         # todo: use "instantiate_classes" method that I wrote somewhere..
         # todo: pass plugins? or just assign to dispatcher? nah, i can use via App
-        handlers = [handler() for handler in self.handlers]
+        handlers = [self._resolve_handler(handler)() for handler in self.handlers]
         if extra_handlers:
             handlers += extra_handlers
 
@@ -41,16 +64,45 @@ class BotManager:
         self._setup_set_bot_commands(dispatcher, commands)
         self._setup_print_bot_url(dispatcher)
 
+        if self.CHAT_SCHEDULER_ENABLED:
+            # registered first: the order is fixed before any other middleware can wait
+            self.chat_scheduler = ChatScheduler(
+                max_workers=self.CHAT_SCHEDULER_MAX_WORKERS,
+                max_chat_queue=self.CHAT_SCHEDULER_MAX_CHAT_QUEUE,
+                overflow_policy=self.CHAT_SCHEDULER_OVERFLOW_POLICY,
+            )
+            dispatcher.update.outer_middleware.register(self.chat_scheduler)
+
         if self.app.config.plugin_flags.enable_message_history:
+            self.history_writer = MessageHistoryWriter(
+                self.app.message_history,
+                batch_size=self.HISTORY_BATCH_SIZE,
+                flush_interval=self.HISTORY_FLUSH_INTERVAL,
+                max_queue_size=self.HISTORY_MAX_QUEUE_SIZE,
+                codec=self.history_codec,
+                stop_timeout=self.HISTORY_STOP_TIMEOUT,
+            )
+            dispatcher.startup.register(self.history_writer.start)
+            dispatcher.shutdown.register(self.history_writer.stop)
             dispatcher.update.outer_middleware.register(self.message_history_middleware)
 
+    @staticmethod
+    def _resolve_handler(handler) -> type:
+        # beta handlers can be passed by name - they're imported only here
+        if isinstance(handler, str):
+            from bot_lib.handlers.beta import load_handler
+
+            return load_handler(handler)
+        return handler
+
     async def message_history_middleware(
         self,
         handler: Callable[[Update, Dict[str, Any]], Awaitable[Any]],
         event: Update,
         data: Dict[str, Any],
     ) -> Any:
-        await self.app.message_history.save_update(event.model_dump(exclude_none=True))
+        # saved in the background - the handler doesn't wait for the history store
+        await self.history_writer.put(event)
         return await handler(event, data)
 
     # todo: split this even more
@@ -59,6 +111,7 @@ class BotManager:
         commands = []
         for handler in handlers:
             dispatcher.startup.register(handler.on_startup)
+            dispatcher.shutdown.register(handler.on_shutdown)
 
             router = handler.get_router()
             handler.setup_router(router)
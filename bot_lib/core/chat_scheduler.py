@@ -0,0 +1,205 @@
+"""
+Per-chat ordered, cross-chat concurrent update processing
+
+aiogram runs the handlers of all updates concurrently, so several quick messages
+from one user can be processed out of order (multi-message mode, get_info_from_user).
+ChatScheduler runs the updates of each chat one by one, in the order they were
+received, and updates of different chats in parallel - up to max_workers at a time.
+
+A handler that waits for the next update of its own chat (e.g. asks the user a
+question) must call release_chat_turn() first, otherwise it waits forever.
+Note that a long handler - e.g. transcribing a 10 minute voice message - holds its
+chat's turn: later updates of the chat, commands included, wait until it's done.
+Call release_chat_turn() in such handlers if the chat should stay responsive.
+"""
+
+import asyncio
+import contextvars
+from collections import deque
+from dataclasses import dataclass
+from functools import partial
+from typing import Any, Awaitable, Callable, Deque, Dict, Hashable, Optional, TypeVar
+
+from aiogram.types import Update
+from loguru import logger
+
+T = TypeVar("T")
+
+OVERFLOW_POLICIES = ("drop_oldest", "drop_newest")
+
+
+class _Turn:
+    """A running update: holds its chat's turn and a worker slot until released"""
+
+    __slots__ = ("scheduler", "key", "holds_worker", "released")
+
+    def __init__(self, scheduler: "ChatScheduler", key: Optional[Hashable]):
+        self.scheduler = scheduler
+        self.key = key
+        self.holds_worker = False
+        self.released = False
+
+    def release(self):
+        if self.released:
+            return
+        self.released = True
+        if self.holds_worker:
+            self.scheduler._release_worker()
+        if self.key is not None:
+            self.scheduler._pass_turn(self.key)
+
+
+# turns held by the current task - nested if several schedulers are stacked (e.g. sharded workers)
+_current_turns: contextvars.ContextVar[tuple] = contextvars.ContextVar("bot_lib_chat_turns", default=())
+
+
+def release_chat_turn():
+    """
+    Let the next updates of this chat run, and free the worker slot
+    Call before waiting for the next message of the same chat - e.g. an answer to a question.
+    Also useful in long handlers (voice transcription, long app calls): otherwise every later
+    update of the chat, commands included, waits for the handler to finish
+    """
+    for turn in _current_turns.get():
+        turn.release()
+
+
+@dataclass
+class ChatSchedulerStats:
+    processed: int = 0
+    dropped: int = 0
+    max_queue_latency: float = 0.0
+
+
+class ChatScheduler:
+    """
+    Usage:
+        scheduler = ChatScheduler(max_workers=100)
+        dispatcher.update.outer_middleware.register(scheduler)
+        # or directly
+        await scheduler.run(chat_id, process_update)
+    """
+
+    def __init__(
+        self,
+        max_workers: int = 100,
+        max_chat_queue: Optional[int] = None,
+        overflow_policy: str = "drop_oldest",
+        latency_window: int = 1000,
+    ):
+        """
+        :param max_workers: max updates processed at the same time, across all chats
+        :param max_chat_queue: max updates waiting in a single chat. None - unlimited
+        :param overflow_policy: when a chat queue is full - "drop_oldest" waiting update or "drop_newest" (incoming)
+        :param latency_window: number of recent queue latencies kept for the percentiles
+        """
+        if overflow_policy not in OVERFLOW_POLICIES:
+            raise ValueError(f"Unknown overflow policy: {overflow_policy}, expected one of {OVERFLOW_POLICIES}")
+        self.max_workers = max_workers
+        self.max_chat_queue = max_chat_queue
+        self.overflow_policy = overflow_policy
+        # chat -> updates waiting for their turn. A chat is in the dict while one of its updates runs
+        self._chats: Dict[Hashable, Deque[asyncio.Future]] = {}
+        self._workers = asyncio.Semaphore(max_workers)
+        self._active_workers = 0
+        self._latencies: Deque[float] = deque(maxlen=latency_window)
+        self.stats = ChatSchedulerStats()
+
+    @property
+    def queue_depth(self) -> int:
+        return sum(len(waiters) for waiters in self._chats.values())
+
+    def get_stats(self) -> dict:
+        latencies = sorted(self._latencies)
+
+        def percentile(p):
+            return latencies[min(int(len(latencies) * p), len(latencies) - 1)] if latencies else 0.0
+
+        return {
+            "queue_depth": self.queue_depth,
+            "active_chats": len(self._chats),
+            "active_workers": self._active_workers,
+            "processed": self.stats.processed,
+            "dropped": self.stats.dropped,
+            "queue_latency_p50": percentile(0.5),
+            "queue_latency_p99": percentile(0.99),
+            "max_queue_latency": self.stats.max_queue_latency,
+        }
+
+    async def _acquire_chat(self, key: Hashable) -> bool:
+        """Wait for the chat's turn. :return: False if the update was dropped"""
+        waiters = self._chats.get(key)
+        if waiters is None:
+            self._chats[key] = deque()
+            return True
+        if self.max_chat_queue is not None and len(waiters) >= self.max_chat_queue:
+            self.stats.dropped += 1
+            if self.overflow_policy == "drop_newest":
+                return False
+            waiters.popleft().set_result(False)
+
+        waiter = asyncio.get_running_loop().create_future()
+        waiters.append(waiter)
+        try:
+            return await waiter
+        except asyncio.CancelledError:
+            if waiter.done() and not waiter.cancelled() and waiter.result():
+                # got the turn, but won't use it
+                self._pass_turn(key)
+            elif waiter in waiters:
+                waiters.remove(waiter)
+            raise
+
+    def _pass_turn(self, key: Hashable):
+        waiters = self._chats[key]
+        while waiters:
+            waiter = waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(True)
+                return
+        del self._chats[key]
+
+    def _release_worker(self):
+        self._active_workers -= 1
+        self._workers.release()
+
+    async def run(self, key: Optional[Hashable], func: Callable[[], Awaitable[T]]) -> Optional[T]:
+        """
+        Run func in the key's turn
+        :param key: chat id. None - no ordering, only the worker limit applies
+        :return: func result, None if the update was dropped on overflow
+        """
+        loop = asyncio.get_running_loop()
+        queued_at = loop.time()
+        if key is not None and not await self._acquire_chat(key):
+            logger.warning(f"Chat {key} queue is full ({self.max_chat_queue}), update dropped ({self.overflow_policy})")
+            return None
+
+        turn = _Turn(self, key)
+        try:
+            await self._workers.acquire()
+            turn.holds_worker = True
+            self._active_workers += 1
+
+            latency = loop.time() - queued_at
+            self._latencies.append(latency)
+            self.stats.max_queue_latency = max(self.stats.max_queue_latency, latency)
+
+            token = _current_turns.set(_current_turns.get() + (turn,))
+            try:
+                return await func()
+            finally:
+                _current_turns.reset(token)
+                self.stats.processed += 1
+        finally:
+            turn.release()
+
+    async def __call__(
+        self,
+        handler: Callable[[Update, Dict[str, Any]], Awaitable[Any]],
+        event: Update,
+        data: Dict[str, Any],
+    ) -> Any:
+        # update outer middleware. event_chat is set by aiogram's UserContextMiddleware
+        chat = data.get("event_chat")
+        return await self.run(chat.id if chat is not None else None, partial(handler, event, data))
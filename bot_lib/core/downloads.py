@@ -0,0 +1,367 @@
+"""
+Large file downloads over MTProto (pyrogram)
+
+The Bot API can only download files up to 20 MB, bigger files are downloaded
+with a pyrogram client. Starting a client means a login and an auth handshake,
+so LargeFileDownloader starts it once and reuses it for all downloads.
+"""
+
+import asyncio
+import inspect
+import io
+import mmap
+import os
+import re
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from dataclasses import dataclass
+from pathlib import Path
+from typing import TYPE_CHECKING, Any, AsyncIterator, Awaitable, Callable, Dict, Iterator, Optional
+
+from loguru import logger
+
+if TYPE_CHECKING:
+    import pyrogram
+
+
+DEFAULT_CHUNK_SIZE = 1024 * 1024
+
+
+class DownloadedFile(io.BufferedReader):
+    """
+    Read-only binary file object for a downloaded file - data is read from disk on demand
+    With delete=True the file is removed when the object is closed or garbage collected.
+
+    Usage:
+        with await handler.download_large_file(chat_id, message_id) as file:
+            async for chunk in file:
+                ...
+    """
+
+    def __init__(self, path, delete: bool = True, chunk_size: int = DEFAULT_CHUNK_SIZE):
+        super().__init__(io.FileIO(path, "rb"))
+        self.path = Path(path)
+        self.delete = delete
+        self.chunk_size = chunk_size
+
+    def close(self):
+        if self.closed:
+            return
+        try:
+            super().close()
+        finally:
+            if self.delete:
+                self.path.unlink(missing_ok=True)
+
+    def iter_chunks(self, chunk_size: int = None) -> Iterator[bytes]:
+        """Read the file chunk by chunk, from the current position"""
+        chunk_size = chunk_size or self.chunk_size
+        while chunk := self.read(chunk_size):
+            yield chunk
+
+    async def aiter_chunks(self, chunk_size: int = None) -> AsyncIterator[bytes]:
+        """Read the file chunk by chunk without blocking the event loop"""
+        chunk_size = chunk_size or self.chunk_size
+        while chunk := await asyncio.to_thread(self.read, chunk_size):
+            yield chunk
+
+    def __aiter__(self):
+        return self.aiter_chunks()
+
+    def mmap(self) -> mmap.mmap:
+        """Memory-mapped read-only view of the whole file - pages are loaded lazily by the OS"""
+        return mmap.mmap(self.fileno(), 0, access=mmap.ACCESS_READ)
+
+
+@dataclass
+class DownloadProgress:
+    chat_id: str
+    message_id: int
+    current: int = 0
+    total: int = 0
+
+    @property
+    def fraction(self) -> float:
+        return self.current / self.total if self.total else 0.0
+
+
+# progress callback: (current_bytes, total_bytes) -> None, sync or async
+ProgressCallback = Callable[[int, int], None]
+
+
+class DownloadError(Exception):
+    """The download stopped without a file - e.g. the client was stopped or the transfer failed"""
+
+
+class LargeFileDownloader:
+    """
+    Long-lived MTProto download service with bounded concurrency
+
+    Usage:
+        downloader = LargeFileDownloader(lambda: pyrogram.Client(...), max_concurrent_downloads=2)
+        path = await downloader.download(chat_id, message_id, "/tmp/file.mp4")
+        ...
+        await downloader.stop()
+    """
+
+    def __init__(self, client_factory: Callable[[], "pyrogram.Client"], max_concurrent_downloads: int = 2):
+        """
+        :param client_factory: creates the (not yet started) pyrogram client. Called once, on the first download
+        :param max_concurrent_downloads: how many files are downloaded at the same time
+        """
+        self._client_factory = client_factory
+        self._client: Optional["pyrogram.Client"] = None
+        self._start_lock = asyncio.Lock()
+        self._semaphore = asyncio.Semaphore(max_concurrent_downloads)
+        self._tasks: Dict[str, asyncio.Task] = {}
+        self.progress: Dict[str, DownloadProgress] = {}
+
+    async def _get_client(self) -> "pyrogram.Client":
+        async with self._start_lock:
+            if self._client is None:
+                client = self._client_factory()
+                if not client.is_connected:
+                    await client.start()
+                self._client = client
+        return self._client
+
+    async def download(
+        self,
+        chat_id,
+        message_id: int,
+        file_path,
+        progress_callback: ProgressCallback = None,
+        download_id: str = None,
+    ) -> str:
+        """
+        Download the file attached to the message
+        :param chat_id: chat id or username
+        :param file_path: where to save the file
+        :param progress_callback: called with (current, total) bytes as the download goes
+        :param download_id: id to track progress / cancel the download. Generated if not provided
+        :return: path of the downloaded file
+        :raises DownloadError: if pyrogram didn't save the file
+        :raises asyncio.CancelledError: if the download was cancelled
+        """
+        if download_id is None:
+            download_id = uuid.uuid4().hex
+        task = asyncio.create_task(self._download(download_id, chat_id, message_id, file_path, progress_callback))
+        self._tasks[download_id] = task
+        try:
+            return await task
+        finally:
+            self._tasks.pop(download_id, None)
+            self.progress.pop(download_id, None)
+
+    async def _download(self, download_id, chat_id, message_id, file_path, progress_callback):
+        progress = DownloadProgress(chat_id=chat_id, message_id=message_id)
+        self.progress[download_id] = progress
+
+        async def on_progress(current, total):
+            progress.current, progress.total = current, total
+            if progress_callback is not None:
+                result = progress_callback(current, total)
+                if inspect.isawaitable(result):
+                    await result
+
+        async with self._semaphore:
+            client = await self._get_client()
+            message = await client.get_messages(chat_id, message_ids=message_id)
+            if message is None or message.empty or not message.media:
+                raise ValueError(f"No file found in message {message_id} of chat {chat_id}")
+            logger.debug(f"Downloading file from message {message_id} of chat {chat_id}")
+            # pyrogram resolves relative paths against its own downloads dir
+            result = await message.download(file_name=str(Path(file_path).absolute()), progress=on_progress)
+            if result is None:
+                # pyrogram returns None instead of raising
+                raise DownloadError(f"Download {download_id} from message {message_id} of chat {chat_id} failed")
+            return result
+
+    @property
+    def active_downloads(self) -> int:
+        return len(self._tasks)
+
+    def cancel(self, download_id: str) -> bool:
+        """Cancel the download. Returns False if there is no such download in progress"""
+        task = self._tasks.get(download_id)
+        if task is None:
+            return False
+        return task.cancel()
+
+    async def stop(self):
+        """Cancel all downloads and stop the client"""
+        for task in list(self._tasks.values()):
+            task.cancel()
+        if self._tasks:
+            await asyncio.gather(*self._tasks.values(), return_exceptions=True)
+        if self._client is not None and self._client.is_connected:
+            await self._client.stop()
+        self._client = None
+
+
+@dataclass
+class FileCacheStats:
+    hits: int = 0
+    misses: int = 0
+    inflight_joins: int = 0  # requests that waited for a download already in progress
+    evictions: int = 0
+
+    @property
+    def hit_rate(self) -> float:
+        total = self.hits + self.misses + self.inflight_joins
+        return (self.hits + self.inflight_joins) / total if total else 0.0
+
+
+class FileCache:
+    """
+    On-disk cache of downloaded files, keyed by Telegram file_unique_id
+    (same for the same file in all chats - e.g. a forwarded voice note)
+
+    - LRU eviction by total size and by age (last access)
+    - single-flight: concurrent requests for the same file share one download
+    - files in use (being fetched or opened) are never evicted. A file bigger than
+      max_size_bytes stays until it's no longer in use and the next eviction runs
+
+    Usage:
+        with await cache.open(file_unique_id, download) as file:
+            data = file.read()
+    """
+
+    PART_SUFFIX = ".part"
+    key_re = re.compile(r"[^A-Za-z0-9_-]")
+
+    def __init__(self, cache_dir, max_size_bytes: int = 1024**3, max_age_seconds: float = 7 * 24 * 3600):
+        self.cache_dir = Path(cache_dir)
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        self.max_size_bytes = max_size_bytes
+        self.max_age_seconds = max_age_seconds
+        self._inflight: Dict[str, asyncio.Task] = {}
+        # path -> number of users. Eviction runs in a thread, hence the lock
+        self._pins: Dict[Path, int] = {}
+        self._pins_lock = threading.Lock()
+        self.stats = FileCacheStats()
+
+    def _get_path(self, key: str) -> Path:
+        return self.cache_dir / self.key_re.sub("_", key)
+
+    @contextmanager
+    def _pinned(self, path: Path):
+        with self._pins_lock:
+            self._pins[path] = self._pins.get(path, 0) + 1
+        try:
+            yield
+        finally:
+            with self._pins_lock:
+                self._pins[path] -= 1
+                if not self._pins[path]:
+                    del self._pins[path]
+
+    def _lookup(self, path: Path) -> bool:
+        try:
+            mtime = path.stat().st_mtime
+        except FileNotFoundError:
+            return False
+        if time.time() - mtime > self.max_age_seconds:
+            return False
+        # mtime is the last access time for LRU
+        os.utime(path)
+        return True
+
+    async def open(self, key: str, download: Callable[[Path], Awaitable[Any]]) -> DownloadedFile:
+        """
+        Get the cached file, download it if it's not cached
+        The file is opened before it can be evicted - an open file stays readable after eviction
+        :param key: file_unique_id
+        :param download: coroutine function saving the file to the given path
+        """
+        path = self._get_path(key)
+        with self._pinned(path):
+            await self._fetch(key, path, download)
+            return DownloadedFile(path, delete=False)
+
+    async def get_or_download(self, key: str, download: Callable[[Path], Awaitable[Any]]) -> Path:
+        """
+        Same as open, but returns the path of the cached file
+        Note: the file may be evicted by a later download - prefer open()
+        """
+        path = self._get_path(key)
+        with self._pinned(path):
+            await self._fetch(key, path, download)
+        return path
+
+    async def _fetch(self, key: str, path: Path, download: Callable[[Path], Awaitable[Any]]):
+        if self._lookup(path):
+            self.stats.hits += 1
+            return
+        task = self._inflight.get(key)
+        if task is None:
+            self.stats.misses += 1
+            # a task of its own - the download doesn't depend on the caller that started it
+            task = asyncio.create_task(self._download(key, path, download))
+            self._inflight[key] = task
+        else:
+            self.stats.inflight_joins += 1
+        # shield - a cancelled caller shouldn't cancel the shared download
+        await asyncio.shield(task)
+
+    async def _download(self, key: str, path: Path, download: Callable[[Path], Awaitable[Any]]):
+        part_path = path.with_name(f"{path.name}.{uuid.uuid4().hex}{self.PART_SUFFIX}")
+        try:
+            await download(part_path)
+            os.replace(part_path, path)
+        except BaseException:
+            part_path.unlink(missing_ok=True)
+            raise
+        finally:
+            del self._inflight[key]
+        # the new file is pinned by the callers - it survives this eviction
+        await asyncio.to_thread(self.evict)
+
+    def evict(self):
+        """
+        Remove expired files, then least recently used ones until the cache fits into max_size_bytes
+        Files in use are skipped
+        """
+        now = time.time()
+        entries = []
+        for path in self.cache_dir.iterdir():
+            if path.name.endswith(self.PART_SUFFIX):
+                continue
+            try:
+                stat = path.stat()
+            except FileNotFoundError:
+                continue
+            if now - stat.st_mtime > self.max_age_seconds and self._remove(path):
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+        total_size = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total_size <= self.max_size_bytes:
+                break
+            if self._remove(path):
+                total_size -= size
+
+    def _remove(self, path: Path) -> bool:
+        """:return: False if the file is in use"""
+        with self._pins_lock:
+            if path in self._pins:
+                return False
+            path.unlink(missing_ok=True)
+        self.stats.evictions += 1
+        return True
+
+    @property
+    def size_bytes(self) -> int:
+        return sum(p.stat().st_size for p in self.cache_dir.iterdir() if not p.name.endswith(self.PART_SUFFIX))
+
+    def get_stats(self) -> dict:
+        return {
+            "hits": self.stats.hits,
+            "misses": self.stats.misses,
+            "inflight_joins": self.stats.inflight_joins,
+            "evictions": self.stats.evictions,
+            "hit_rate": self.stats.hit_rate,
+            "inflight": len(self._inflight),
+        }
@@ -0,0 +1,242 @@
+"""
+Compact serialization of updates for message history
+
+A full update dump repeats the same user and chat objects in every message.
+UpdateCodec stores:
+- only the configured fields of each update type (projection)
+- users and chats by id, with the full records emitted only when new or changed
+- optionally packed with msgpack
+
+UpdateCodec.decode() rebuilds aiogram Update objects back from the records.
+"""
+
+import json
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Mapping, Optional, Tuple, Union
+
+from aiogram.types import Update
+
+from bot_lib.core.cache import TTLCache
+
+# pydantic include specs - see BaseModel.model_dump(include=...)
+REF_FIELDS = {"id"}
+MESSAGE_FIELDS = {
+    "message_id": True,
+    "message_thread_id": True,
+    "date": True,
+    "edit_date": True,
+    "media_group_id": True,
+    "chat": REF_FIELDS,
+    "from_user": REF_FIELDS,
+    "sender_chat": REF_FIELDS,
+    "forward_origin": True,
+    "reply_to_message": {"message_id": True, "date": True, "chat": REF_FIELDS, "from_user": REF_FIELDS},
+    "text": True,
+    "caption": True,
+    "voice": {"file_id", "file_unique_id", "duration", "mime_type", "file_size"},
+    "audio": {"file_id", "file_unique_id", "duration", "mime_type", "file_size", "file_name"},
+    "document": {"file_id", "file_unique_id", "mime_type", "file_size", "file_name"},
+    "photo": {"__all__": {"file_id", "file_unique_id", "width", "height", "file_size"}},
+    "video": {"file_id", "file_unique_id", "duration", "width", "height", "mime_type", "file_size"},
+    "video_note": {"file_id", "file_unique_id", "duration", "length", "file_size"},
+    "sticker": {"file_id", "file_unique_id", "type", "width", "height", "is_animated", "is_video", "emoji"},
+    "location": True,
+    "contact": True,
+}
+CALLBACK_QUERY_FIELDS = {
+    "id": True,
+    "from_user": REF_FIELDS,
+    "chat_instance": True,
+    "data": True,
+    "message": {"message_id": True, "date": True, "chat": REF_FIELDS},
+}
+DEFAULT_FIELDS = {
+    "message": MESSAGE_FIELDS,
+    "edited_message": MESSAGE_FIELDS,
+    "channel_post": MESSAGE_FIELDS,
+    "edited_channel_post": MESSAGE_FIELDS,
+    "business_message": MESSAGE_FIELDS,
+    "edited_business_message": MESSAGE_FIELDS,
+    "callback_query": CALLBACK_QUERY_FIELDS,
+}
+
+USER_KEYS = ("from_user", "from")
+CHAT_KEYS = ("chat", "sender_chat")
+
+
+@dataclass
+class EncodedUpdate:
+    update_id: int
+    data: Union[dict, bytes]
+    # full user / chat records - only the new or changed ones
+    users: List[dict] = field(default_factory=list)
+    chats: List[dict] = field(default_factory=list)
+    # (kind, id) -> previous signature of the emitted records - see UpdateCodec.rollback
+    ref_changes: List[Tuple[Tuple[str, int], Optional[int]]] = field(default_factory=list)
+
+    def to_record(self, embed_refs: bool = True) -> dict:
+        """
+        Record for the history store
+        :param embed_refs: store new users / chats inside the record (if the store has no separate tables)
+        """
+        if isinstance(self.data, bytes):
+            record = {"update_id": self.update_id, "data": self.data}
+        else:
+            record = dict(self.data)
+        if embed_refs:
+            if self.users:
+                record["_users"] = self.users
+            if self.chats:
+                record["_chats"] = self.chats
+        return record
+
+
+class UpdateCodec:
+    """
+    Encode updates for message history - projection, user / chat normalization, packing
+
+    Usage:
+        codec = UpdateCodec(pack=True)
+        encoded = codec.encode(update)
+        try:
+            save(encoded)
+        except Exception:
+            codec.rollback([encoded])  # re-emit its users / chats next time
+            raise
+        ...
+        update = codec.decode(encoded.data, users={u["id"]: u for u in users}, chats=...)
+    """
+
+    def __init__(
+        self,
+        fields: Optional[Dict[str, Any]] = None,
+        pack: bool = False,
+        known_refs_cache_size: int = 100_000,
+        known_refs_ttl: float = 24 * 3600,
+    ):
+        """
+        :param fields: update type -> pydantic include spec of the fields to keep.
+            Update types not listed are stored in full. Defaults to DEFAULT_FIELDS
+        :param pack: pack records with msgpack (requires msgpack)
+        :param known_refs_cache_size: how many user / chat records to remember for deduplication
+        :param known_refs_ttl: re-emit the user / chat record after this time, seconds
+        """
+        self.fields = DEFAULT_FIELDS if fields is None else fields
+        self.pack = pack
+        if pack:
+            import msgpack  # noqa: F401 - fail early if not installed
+
+        # (kind, id) -> hash of the last emitted record
+        self._known_refs = TTLCache(maxsize=known_refs_cache_size, ttl=known_refs_ttl)
+
+    def encode(self, update: Update) -> EncodedUpdate:
+        event_type = update.event_type
+        include = {"update_id": True, event_type: self.fields.get(event_type, True)}
+        data = update.model_dump(include=include, exclude_none=True, mode="json")
+
+        encoded = EncodedUpdate(update_id=update.update_id, data=data)
+        if event_type in self.fields:
+            # full records of the users / chats that were projected to ids
+            self._collect_refs(update.event, encoded)
+
+        if self.pack:
+            import msgpack
+
+            encoded.data = msgpack.packb(data)
+        return encoded
+
+    def rollback(self, encoded: List[EncodedUpdate]):
+        """
+        Forget the users / chats emitted by these updates - call when their write failed,
+        so the records are emitted again with the next updates
+        """
+        for item in reversed(encoded):
+            for key, previous in reversed(item.ref_changes):
+                if previous is None:
+                    self._known_refs.pop(key)
+                else:
+                    self._known_refs[key] = previous
+            item.ref_changes = []
+
+    def _collect_refs(self, event, encoded: EncodedUpdate, nested: bool = False):
+        if event is None:
+            return
+        for key, kind, target in (
+            ("from_user", "user", encoded.users),
+            ("chat", "chat", encoded.chats),
+            ("sender_chat", "chat", encoded.chats),
+        ):
+            obj = getattr(event, key, None)
+            if obj is None or not hasattr(obj, "id"):
+                continue
+            known = self._known_refs.get((kind, obj.id))
+            if nested and known is not None:
+                # nested messages (replies) may carry partial objects - don't let them replace full ones
+                continue
+            record = obj.model_dump(exclude_none=True, mode="json")
+            signature = hash(json.dumps(record, sort_keys=True))
+            if known != signature:
+                # recorded right away - the next updates of the batch don't repeat it
+                encoded.ref_changes.append(((kind, obj.id), known))
+                self._known_refs[(kind, obj.id)] = signature
+                target.append(record)
+        for key in ("reply_to_message", "message"):
+            child = getattr(event, key, None)
+            if child is not None and child is not event:
+                self._collect_refs(child, encoded, nested=True)
+
+    def decode(
+        self,
+        data: Union[dict, bytes],
+        users: Optional[Mapping[int, dict]] = None,
+        chats: Optional[Mapping[int, dict]] = None,
+        strict: bool = False,
+    ) -> Update:
+        """
+        Rebuild the aiogram Update from an encoded record
+        A record holds only the users / chats that were new or changed at the time, so decoding
+        a record on its own gives stubs (first_name="", no username) for the rest - pass the
+        user / chat tables or the records of the earlier updates' refs
+        :param data: EncodedUpdate.data or a record from EncodedUpdate.to_record()
+        :param users: user id -> user record. Missing users are replaced with stubs
+        :param chats: chat id -> chat record. Missing chats are replaced with stubs
+        :param strict: raise KeyError for a missing user / chat instead of a stub
+        """
+        if isinstance(data, bytes):
+            data = self._unpack(data)
+        elif isinstance(data, Mapping) and isinstance(data.get("data"), bytes):
+            embedded = {key: data[key] for key in ("_users", "_chats") if key in data}
+            data = {**self._unpack(data["data"]), **embedded}
+        record = dict(data)
+
+        users = dict(users or {})
+        chats = dict(chats or {})
+        users.update({user["id"]: user for user in record.pop("_users", [])})
+        chats.update({chat["id"]: chat for chat in record.pop("_chats", [])})
+        return Update.model_validate(self._resolve_refs(record, users, chats, strict))
+
+    @staticmethod
+    def _unpack(data: bytes) -> dict:
+        import msgpack
+
+        return msgpack.unpackb(data)
+
+    def _resolve_refs(self, value, users: Mapping[int, dict], chats: Mapping[int, dict], strict: bool = False):
+        if isinstance(value, list):
+            return [self._resolve_refs(item, users, chats, strict) for item in value]
+        if not isinstance(value, dict):
+            return value
+        result = {}
+        for key, item in value.items():
+            if key in USER_KEYS and isinstance(item, dict) and item.keys() == {"id"}:
+                if strict and item["id"] not in users:
+                    raise KeyError(f"User {item['id']} is not in the users table")
+                item = users.get(item["id"]) or {"id": item["id"], "is_bot": False, "first_name": ""}
+            elif key in CHAT_KEYS and isinstance(item, dict) and item.keys() == {"id"}:
+                if strict and item["id"] not in chats:
+                    raise KeyError(f"Chat {item['id']} is not in the chats table")
+                item = chats.get(item["id"]) or {"id": item["id"], "type": "private" if item["id"] > 0 else "supergroup"}
+            else:
+                item = self._resolve_refs(item, users, chats, strict)
+            result[key] = item
+        return result
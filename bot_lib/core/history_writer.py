@@ -0,0 +1,166 @@
+"""
+Write-behind queue for message history
+
+The history middleware only puts the update into a queue, so handlers don't wait
+for the history store. A background task serializes the updates and saves them
+in batches - by size or by time, whichever comes first.
+"""
+
+import asyncio
+from typing import List, Optional
+
+from aiogram.types import Update
+from loguru import logger
+
+from bot_lib.core.history_codec import EncodedUpdate, UpdateCodec
+
+
+class MessageHistoryWriter:
+    """
+    Batches updates and saves them to the message history store in the background
+
+    The store needs an async save_update(data: dict) method. If it also has
+    save_updates(data: List[dict]) - it's used for bulk inserts.
+    With a codec, users and chats go to save_users / save_chats if the store has them,
+    otherwise they are embedded into the update records.
+    When the queue is full, put() waits - backpressure for a slow store.
+    """
+
+    def __init__(
+        self,
+        store,
+        batch_size: int = 100,
+        flush_interval: float = 1.0,
+        max_queue_size: int = 10_000,
+        codec: Optional[UpdateCodec] = None,
+        stop_timeout: Optional[float] = 10.0,
+    ):
+        """
+        :param store: message history store, e.g. app.message_history
+        :param batch_size: max updates per write
+        :param flush_interval: max time an update waits in the queue before a write, seconds
+        :param max_queue_size: queued updates limit - put() waits when it's reached
+        :param codec: compact update serialization. If not set - full update dumps are stored
+        :param stop_timeout: how long stop() waits for the queued updates to be saved, seconds.
+            None - wait until all are saved
+        """
+        self.store = store
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_queue_size = max_queue_size
+        self.codec = codec
+        self.stop_timeout = stop_timeout
+        self._queue: Optional[asyncio.Queue] = None
+        self._task: Optional[asyncio.Task] = None
+        # set on put() and stop() - wakes the writer waiting for more updates of a batch
+        self._wakeup: Optional[asyncio.Event] = None
+        self._stopping = False
+        self._backpressure = False
+        self.written = 0
+        self.failed = 0
+
+    @property
+    def queue_size(self) -> int:
+        return self._queue.qsize() if self._queue is not None else 0
+
+    async def start(self):
+        if self._task is None:
+            self._queue = asyncio.Queue(maxsize=self.max_queue_size)
+            self._wakeup = asyncio.Event()
+            self._stopping = False
+            self._task = asyncio.create_task(self._run())
+
+    async def put(self, update: Update):
+        """Queue the update for saving. Waits only if the queue is full"""
+        if self._task is None:
+            await self.start()
+        if self._queue.full():
+            if not self._backpressure:
+                self._backpressure = True
+                logger.warning(f"Message history queue is full ({self.max_queue_size}), waiting for the store")
+        else:
+            self._backpressure = False
+        await self._queue.put(update)
+        self._wakeup.set()
+
+    async def stop(self):
+        """
+        Flush all queued updates and stop the background task
+        Waits at most stop_timeout - a stuck store must not block the shutdown
+        """
+        if self._task is None:
+            return
+        # write the queued updates right away, without waiting for full batches
+        self._stopping = True
+        self._wakeup.set()
+        try:
+            await asyncio.wait_for(self._queue.join(), self.stop_timeout)
+        except asyncio.TimeoutError:
+            logger.error(
+                f"Message history was not flushed in {self.stop_timeout}s, "
+                f"dropping {self.queue_size} queued updates and the batch being written"
+            )
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self._queue.get()]
+            deadline = loop.time() + self.flush_interval
+            while len(batch) < self.batch_size:
+                if not self._queue.empty():
+                    batch.append(self._queue.get_nowait())
+                    continue
+                timeout = deadline - loop.time()
+                if self._stopping or timeout <= 0:
+                    break
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout)
+                except asyncio.TimeoutError:
+                    break
+            try:
+                await self._write(batch)
+            finally:
+                for _ in batch:
+                    self._queue.task_done()
+
+    async def _serialize(self, batch: List[Update], encoded: List[EncodedUpdate]) -> List[dict]:
+        """:param encoded: filled with the encoded updates - to roll them back if the write fails"""
+        if self.codec is None:
+            return [update.model_dump(exclude_none=True) for update in batch]
+
+        for update in batch:
+            encoded.append(self.codec.encode(update))
+        separate_tables = hasattr(self.store, "save_users") and hasattr(self.store, "save_chats")
+        if separate_tables:
+            users = [user for item in encoded for user in item.users]
+            chats = [chat for item in encoded for chat in item.chats]
+            if users:
+                await self.store.save_users(users)
+            if chats:
+                await self.store.save_chats(chats)
+        return [item.to_record(embed_refs=not separate_tables) for item in encoded]
+
+    async def _write(self, batch: List[Update]):
+        encoded = []
+        try:
+            records = await self._serialize(batch, encoded)
+            save_updates = getattr(self.store, "save_updates", None)
+            if save_updates is not None:
+                await save_updates(records)
+            else:
+                await asyncio.gather(*(self.store.save_update(record) for record in records))
+            self.written += len(batch)
+        except Exception as e:
+            # history is best-effort - never break the writer loop
+            self.failed += len(batch)
+            if encoded:
+                # the users / chats of the batch weren't stored - emit them with the next updates
+                self.codec.rollback(encoded)
+            logger.error(f"Failed to save {len(batch)} updates to message history: {e}")
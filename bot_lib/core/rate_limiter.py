@@ -0,0 +1,230 @@
+"""
+Outbound rate limiting for Telegram sends
+
+Telegram flood limits (approximate, see
+https://core.telegram.org/bots/faq#my-bot-is-hitting-limits-how-do-i-avoid-this):
+- about 30 messages per second in total
+- about 1 message per second in a single private chat
+- about 20 messages per minute in a single group
+
+OutboundScheduler queues the sends: it keeps per-chat order, waits on token buckets
+(global + per-chat) and retries requests that failed with TelegramRetryAfter after
+the requested delay. A TelegramRetryAfter pauses both the chat and all other sends.
+"""
+
+import asyncio
+import time
+import weakref
+from collections import defaultdict
+from dataclasses import dataclass
+from typing import Awaitable, Callable, Dict, TypeVar, Union
+
+from aiogram import Bot
+from aiogram.exceptions import TelegramRetryAfter
+from loguru import logger
+
+T = TypeVar("T")
+
+DEFAULT_GLOBAL_RATE = 30  # messages per second
+DEFAULT_PRIVATE_CHAT_RATE = 1  # messages per second
+DEFAULT_GROUP_CHAT_RATE = 20 / 60  # messages per second
+
+
+class TokenBucket:
+    """
+    Classic token bucket: `rate` tokens per second, at most `capacity` tokens stored.
+    acquire() waits until a token is available. Waiters are served in FIFO order.
+    """
+
+    def __init__(self, rate: float, capacity: float = 1):
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = float(capacity)
+        self._updated = time.monotonic()
+        self._blocked_until = 0.0
+        self._lock = asyncio.Lock()
+
+    def _refill(self, now: float):
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def block(self, seconds: float):
+        """Stop handing out tokens for the given time (e.g. retry_after from Telegram)"""
+        now = time.monotonic()
+        self._refill(now)
+        self._tokens = 0
+        self._blocked_until = max(self._blocked_until, now + seconds)
+
+    @property
+    def idle(self) -> bool:
+        """Bucket is full and nobody is waiting - can be safely dropped"""
+        now = time.monotonic()
+        self._refill(now)
+        return not self._lock.locked() and now >= self._blocked_until and self._tokens >= self.capacity
+
+    async def acquire(self) -> float:
+        """Take a token, waiting if necessary. Returns the time spent waiting"""
+        start = time.monotonic()
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                if now < self._blocked_until:
+                    await asyncio.sleep(self._blocked_until - now)
+                    continue
+                self._refill(now)
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return time.monotonic() - start
+                await asyncio.sleep((1 - self._tokens) / self.rate)
+
+
+@dataclass
+class SchedulerStats:
+    sent: int = 0
+    failed: int = 0
+    retries: int = 0
+    total_wait: float = 0.0
+    max_wait: float = 0.0
+
+    @property
+    def avg_wait(self) -> float:
+        processed = self.sent + self.failed
+        return self.total_wait / processed if processed else 0.0
+
+
+class OutboundScheduler:
+    """
+    Queue for outbound bot api calls with global and per-chat rate limits
+
+    Usage:
+        scheduler = OutboundScheduler()
+        message = await scheduler.submit(chat_id, lambda: bot.send_message(chat_id, text))
+    """
+
+    # drop idle per-chat buckets when there are more than this many of them
+    MAX_IDLE_CHAT_BUCKETS = 10_000
+
+    def __init__(
+        self,
+        global_rate: float = DEFAULT_GLOBAL_RATE,
+        private_chat_rate: float = DEFAULT_PRIVATE_CHAT_RATE,
+        group_chat_rate: float = DEFAULT_GROUP_CHAT_RATE,
+        private_chat_burst: int = 3,
+        group_chat_burst: int = 3,
+        max_retries: int = 3,
+    ):
+        self.private_chat_rate = private_chat_rate
+        self.group_chat_rate = group_chat_rate
+        self.private_chat_burst = private_chat_burst
+        self.group_chat_burst = group_chat_burst
+        self.max_retries = max_retries
+
+        self._global_bucket = TokenBucket(global_rate, capacity=global_rate)
+        self._chat_buckets: Dict[int, TokenBucket] = {}
+        self._chat_locks: Dict[int, asyncio.Lock] = defaultdict(asyncio.Lock)
+        self._chat_queue_depth: Dict[int, int] = defaultdict(int)
+        self.stats = SchedulerStats()
+
+    @staticmethod
+    def is_private_chat(chat_id: Union[int, str]) -> bool:
+        # private chats have positive ids, groups and channels - negative
+        if isinstance(chat_id, str):
+            # "@channelname" - only channels and supergroups have usernames usable as chat_id
+            return False
+        return chat_id > 0
+
+    def _get_chat_bucket(self, chat_id: int) -> TokenBucket:
+        bucket = self._chat_buckets.get(chat_id)
+        if bucket is None:
+            if len(self._chat_buckets) > self.MAX_IDLE_CHAT_BUCKETS:
+                self._drop_idle_buckets()
+            if self.is_private_chat(chat_id):
+                bucket = TokenBucket(self.private_chat_rate, capacity=self.private_chat_burst)
+            else:
+                bucket = TokenBucket(self.group_chat_rate, capacity=self.group_chat_burst)
+            self._chat_buckets[chat_id] = bucket
+        return bucket
+
+    def _drop_idle_buckets(self):
+        for chat_id in [c for c, b in self._chat_buckets.items() if b.idle and not self._chat_queue_depth.get(c)]:
+            del self._chat_buckets[chat_id]
+            self._chat_locks.pop(chat_id, None)
+
+    @property
+    def queue_depth(self) -> int:
+        """Total number of sends currently waiting or in flight"""
+        return sum(self._chat_queue_depth.values())
+
+    def chat_queue_depth(self, chat_id: int) -> int:
+        return self._chat_queue_depth.get(chat_id, 0)
+
+    def get_stats(self) -> dict:
+        return {
+            "queue_depth": self.queue_depth,
+            "active_chats": len(self._chat_queue_depth),
+            "sent": self.stats.sent,
+            "failed": self.stats.failed,
+            "retries": self.stats.retries,
+            "avg_wait": self.stats.avg_wait,
+            "max_wait": self.stats.max_wait,
+        }
+
+    async def submit(self, chat_id: int, send: Callable[[], Awaitable[T]]) -> T:
+        """
+        Wait for the rate limits and run the send function.
+        Sends to the same chat are executed one by one, in submission order.
+        :param chat_id: target chat - used for per-chat limits and ordering
+        :param send: function creating the api call coroutine. Called again on retry
+        """
+        start = time.monotonic()
+        self._chat_queue_depth[chat_id] += 1
+        waited = None
+        try:
+            async with self._chat_locks[chat_id]:
+                for attempt in range(self.max_retries + 1):
+                    await self._get_chat_bucket(chat_id).acquire()
+                    await self._global_bucket.acquire()
+                    if waited is None:
+                        waited = time.monotonic() - start
+                    try:
+                        result = await send()
+                    except TelegramRetryAfter as e:
+                        if attempt >= self.max_retries:
+                            raise
+                        self.stats.retries += 1
+                        logger.warning(f"Flood control in chat {chat_id}, retrying in {e.retry_after} seconds")
+                        self._get_chat_bucket(chat_id).block(e.retry_after)
+                        # the flood wait may be bot-wide (global limit) - Telegram doesn't say which,
+                        # so pause all sends rather than keep hitting it
+                        self._global_bucket.block(e.retry_after)
+                        continue
+                    self.stats.sent += 1
+                    return result
+        except BaseException:
+            self.stats.failed += 1
+            raise
+        finally:
+            if waited is None:
+                waited = time.monotonic() - start
+            self.stats.total_wait += waited
+            self.stats.max_wait = max(self.stats.max_wait, waited)
+            self._chat_queue_depth[chat_id] -= 1
+            if not self._chat_queue_depth[chat_id]:
+                del self._chat_queue_depth[chat_id]
+
+
+# global limits are per bot token - so all handlers of the same bot share one scheduler
+_schedulers: "weakref.WeakKeyDictionary[Bot, OutboundScheduler]" = weakref.WeakKeyDictionary()
+
+
+def get_send_scheduler(bot: Bot, **kwargs) -> OutboundScheduler:
+    """
+    Get the outbound scheduler for the bot, create one if missing
+    :param bot: aiogram Bot instance
+    :param kwargs: OutboundScheduler settings - only used when the scheduler is created
+    """
+    scheduler = _schedulers.get(bot)
+    if scheduler is None:
+        scheduler = OutboundScheduler(**kwargs)
+        _schedulers[bot] = scheduler
+    return scheduler
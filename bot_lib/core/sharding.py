@@ -0,0 +1,233 @@
+"""
+Sharded multi-process update processing
+
+One front end receives the updates (polling, webhook or any async iterable) and
+routes them by chat_id to N worker processes. Each worker runs its own
+dispatcher - e.g. the full BotManager.setup_dispatcher stack. All updates of
+a chat go to the same worker, so per-chat in-memory state of the handlers
+(messages_stack, errors, user inputs) keeps working, and a busy bot uses N cores.
+
+Within a worker, updates of one chat are processed one by one, in the order
+they were received. Different chats are processed concurrently - see ChatScheduler.
+
+Usage:
+    def setup(shard: int):
+        dp = Dispatcher()
+        BotManager(app=App()).setup_dispatcher(dp)
+        return dp, create_bot()
+
+    sharded = ShardedDispatcher(setup, num_workers=4)
+    asyncio.run(sharded.run(polling_source(create_bot())))
+
+Notes:
+- `setup` is called in each worker. With the "spawn" start method it must be picklable (module-level)
+- the outbound global rate limit is split between the workers, unless TELEGRAM_BOT_RATE_LIMIT_GLOBAL is set
+- a handler waiting for the next update of its chat must call release_chat_turn() first
+"""
+
+import asyncio
+import multiprocessing
+import os
+import queue
+from functools import partial
+from typing import Any, AsyncIterable, Callable, Dict, Iterable, List, Optional, Tuple, Union
+
+from aiogram.dispatcher.dispatcher import DEFAULT_BACKOFF_CONFIG
+from aiogram.utils.backoff import Backoff, BackoffConfig
+from loguru import logger
+
+from bot_lib.core.chat_scheduler import ChatScheduler
+from bot_lib.core.rate_limiter import DEFAULT_GLOBAL_RATE
+
+SetupFunction = Callable[[int], Tuple[Any, Any]]  # shard index -> (Dispatcher, Bot)
+
+_STOP = None
+
+
+def get_update_chat_id(update: Dict[str, Any]) -> Optional[int]:
+    """Chat id of a raw update - the chat of the message, or the user for queries without one"""
+    for key, event in update.items():
+        if not isinstance(event, dict):
+            continue
+        chat = event.get("chat")
+        if chat is None and isinstance(event.get("message"), dict):
+            # callback queries
+            chat = event["message"].get("chat")
+        if chat is not None:
+            return chat["id"]
+        user = event.get("from") or event.get("user")
+        if user is not None:
+            return user["id"]
+    return None
+
+
+def get_shard(update: Dict[str, Any], num_shards: int) -> int:
+    chat_id = get_update_chat_id(update)
+    if chat_id is None:
+        # no chat - e.g. poll updates. Ordering doesn't matter, spread them
+        return update.get("update_id", 0) % num_shards
+    return chat_id % num_shards
+
+
+async def polling_source(
+    bot, timeout: int = 30, allowed_updates: List[str] = None, backoff_config: BackoffConfig = None
+) -> AsyncIterable[dict]:
+    """
+    Raw updates from getUpdates long polling
+    Network and server errors are retried with a backoff, like aiogram's own polling
+    """
+    backoff = Backoff(config=backoff_config or DEFAULT_BACKOFF_CONFIG)
+    offset = None
+    failed = False
+    try:
+        while True:
+            try:
+                updates = await bot.get_updates(offset=offset, timeout=timeout, allowed_updates=allowed_updates)
+            except Exception as e:
+                failed = True
+                logger.error(f"Failed to fetch updates - {type(e).__name__}: {e}")
+                logger.warning(f"Sleep for {backoff.next_delay:.1f} seconds and try again (tries: {backoff.counter})")
+                await backoff.asleep()
+                continue
+            if failed:
+                logger.info(f"Connection established (tries: {backoff.counter})")
+                backoff.reset()
+                failed = False
+            for update in updates:
+                offset = update.update_id + 1
+                yield update.model_dump(mode="json", exclude_none=True, by_alias=True)
+    finally:
+        await bot.session.close()
+
+
+async def _process_update(dp, bot, update: dict):
+    try:
+        await dp.feed_raw_update(bot, update)
+    except Exception as e:
+        logger.exception(f"Failed to process update {update.get('update_id')}: {e}")
+
+
+async def _worker_loop(setup: SetupFunction, shard: int, updates: multiprocessing.Queue, max_concurrent_updates: int):
+    dp, bot = setup(shard)
+    workflow_data = {"dispatcher": dp, "bots": [bot], "bot": bot}
+    await dp.emit_startup(**workflow_data)
+    if any(isinstance(middleware, ChatScheduler) for middleware in dp.update.outer_middleware):
+        # the dispatcher orders the updates itself (BotManager.setup_dispatcher) - don't serialize twice
+        scheduler = None
+    else:
+        # the updates are already routed here by chat - nothing to drop
+        scheduler = ChatScheduler(max_workers=max_concurrent_updates, max_chat_queue=None)
+    tasks = set()
+    loop = asyncio.get_running_loop()
+    try:
+        while True:
+            try:
+                update = updates.get_nowait()
+            except queue.Empty:
+                update = await loop.run_in_executor(None, updates.get)
+            if update is _STOP:
+                break
+            # tasks start in creation order - so each chat's updates queue up in the order received
+            process = partial(_process_update, dp, bot, update)
+            if scheduler is None:
+                task = asyncio.create_task(process())
+            else:
+                task = asyncio.create_task(scheduler.run(get_update_chat_id(update), process))
+            tasks.add(task)
+            task.add_done_callback(tasks.discard)
+        while tasks:
+            await asyncio.gather(*tasks)
+    finally:
+        await dp.emit_shutdown(**workflow_data)
+        await bot.session.close()
+
+
+def _worker_main(
+    setup: SetupFunction,
+    shard: int,
+    num_workers: int,
+    updates: multiprocessing.Queue,
+    max_concurrent_updates: int,
+):
+    # outbound rate limits are per process - split the global one between the workers
+    os.environ.setdefault("TELEGRAM_BOT_RATE_LIMIT_GLOBAL", str(DEFAULT_GLOBAL_RATE / num_workers))
+    asyncio.run(_worker_loop(setup, shard, updates, max_concurrent_updates))
+
+
+class ShardedDispatcher:
+    def __init__(
+        self,
+        setup: SetupFunction,
+        num_workers: int = None,
+        queue_size: int = 10_000,
+        max_concurrent_updates: int = 100,
+        start_method: str = None,
+    ):
+        """
+        :param setup: called in each worker with the shard index, returns (Dispatcher, Bot)
+        :param num_workers: defaults to the number of CPUs
+        :param queue_size: max queued updates per worker - the front end waits when it's reached
+        :param max_concurrent_updates: max updates processed at the same time in each worker.
+            Not used if the worker's dispatcher has its own ChatScheduler - e.g. set up by BotManager
+        :param start_method: multiprocessing start method. Defaults to the platform default
+        """
+        self.setup = setup
+        self.num_workers = num_workers or os.cpu_count() or 1
+        self.queue_size = queue_size
+        self.max_concurrent_updates = max_concurrent_updates
+        self._context = multiprocessing.get_context(start_method)
+        self._queues: List[multiprocessing.Queue] = []
+        self._workers: List[multiprocessing.Process] = []
+        self.routed = [0] * self.num_workers
+
+    def start(self):
+        for shard in range(self.num_workers):
+            updates = self._context.Queue(maxsize=self.queue_size)
+            worker = self._context.Process(
+                target=_worker_main,
+                args=(self.setup, shard, self.num_workers, updates, self.max_concurrent_updates),
+                name=f"bot-shard-{shard}",
+                daemon=True,
+            )
+            worker.start()
+            self._queues.append(updates)
+            self._workers.append(worker)
+        logger.info(f"Started {self.num_workers} dispatcher workers")
+
+    async def feed_raw_update(self, update: dict):
+        """Route the update to its worker"""
+        shard = get_shard(update, self.num_workers)
+        updates = self._queues[shard]
+        try:
+            updates.put_nowait(update)
+        except queue.Full:
+            if not self._workers[shard].is_alive():
+                raise RuntimeError(f"Dispatcher worker {shard} is dead")
+            # backpressure - wait for the worker without blocking the event loop
+            await asyncio.get_running_loop().run_in_executor(None, updates.put, update)
+        self.routed[shard] += 1
+
+    async def stop(self, timeout: float = 30):
+        """Let the workers process the queued updates and stop them"""
+        loop = asyncio.get_running_loop()
+        for updates in self._queues:
+            await loop.run_in_executor(None, updates.put, _STOP)
+        for worker in self._workers:
+            await loop.run_in_executor(None, worker.join, timeout)
+            if worker.is_alive():
+                logger.warning(f"Dispatcher worker {worker.name} did not stop in {timeout}s, terminating")
+                worker.terminate()
+        self._queues, self._workers = [], []
+
+    async def run(self, source: Union[AsyncIterable[dict], Iterable[dict]]):
+        """Start the workers, route all updates from the source, then stop the workers"""
+        self.start()
+        try:
+            if hasattr(source, "__aiter__"):
+                async for update in source:
+                    await self.feed_raw_update(update)
+            else:
+                for update in source:
+                    await self.feed_raw_update(update)
+        finally:
+            await self.stop()
@@ -0,0 +1,82 @@
+"""
+aiohttp server for webhook delivery - see bot_lib.utils.run_webhook
+"""
+
+import asyncio
+import signal
+
+from aiogram.webhook.aiohttp_server import SimpleRequestHandler, setup_application
+from aiohttp import web
+from aiohttp.web_runner import GracefulExit
+from loguru import logger
+
+
+class DrainingRequestHandler(SimpleRequestHandler):
+    """Waits for the updates being processed in the background before closing the bot session"""
+
+    def __init__(self, *args, drain_timeout: float = 30, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.drain_timeout = drain_timeout
+
+    async def close(self):
+        tasks = set(self._background_feed_update_tasks)
+        if tasks:
+            logger.info(f"Waiting for {len(tasks)} updates in progress")
+            _, pending = await asyncio.wait(tasks, timeout=self.drain_timeout)
+            if pending:
+                logger.warning(f"{len(pending)} updates were not processed in {self.drain_timeout}s, cancelling")
+                for task in pending:
+                    task.cancel()
+        await super().close()
+
+
+def build_webhook_app(dp, bot, path: str, secret_token: str, drain_timeout: float):
+    app = web.Application()
+    DrainingRequestHandler(
+        dispatcher=dp,
+        bot=bot,
+        # respond to telegram right away, process the update in a background task
+        handle_in_background=True,
+        secret_token=secret_token,
+        drain_timeout=drain_timeout,
+    ).register(app, path=path)
+    # dispatcher startup / shutdown hooks
+    setup_application(app, dp, bot=bot)
+    return app
+
+
+def _handle_stop_signals(loop: asyncio.AbstractEventLoop):
+    """
+    The first SIGINT / SIGTERM starts the graceful shutdown, repeated ones are ignored.
+    On Ctrl+C a worker gets SIGINT from the terminal and SIGTERM from the parent process -
+    the second signal would otherwise abort the drain
+    """
+    stopping = False
+
+    def stop():
+        nonlocal stopping
+        if stopping:
+            logger.info("Already shutting down, waiting for the updates in progress")
+            return
+        stopping = True
+        raise GracefulExit()
+
+    for signum in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(signum, stop)
+
+
+def serve_webhook(dp, bot, host, port, path, secret_token, drain_timeout, reuse_port):
+    app = build_webhook_app(dp, bot, path=path, secret_token=secret_token, drain_timeout=drain_timeout)
+    loop = asyncio.new_event_loop()
+    _handle_stop_signals(loop)
+    # a stop signal stops accepting connections, then shutdown drains the updates in progress
+    web.run_app(
+        app,
+        host=host,
+        port=port,
+        reuse_port=reuse_port,
+        shutdown_timeout=drain_timeout,
+        print=None,
+        handle_signals=False,
+        loop=loop,
+    )
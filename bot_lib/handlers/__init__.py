@@ -1,3 +1,30 @@
-from .handler import Handler, HandlerDisplayMode
-from .basic_handler import BasicHandler
-from .dev_handler import DevHandler
+# imported lazily - see bot_lib/__init__.py
+from typing import TYPE_CHECKING
+
+_LAZY_IMPORTS = {
+    "Handler": "bot_lib.handlers.handler",
+    "HandlerDisplayMode": "bot_lib.handlers.handler",
+    "BasicHandler": "bot_lib.handlers.basic_handler",
+    "DevHandler": "bot_lib.handlers.dev_handler",
+}
+
+__all__ = list(_LAZY_IMPORTS)
+
+if TYPE_CHECKING:
+    from .handler import Handler, HandlerDisplayMode
+    from .basic_handler import BasicHandler
+    from .dev_handler import DevHandler
+
+
+def __getattr__(name: str):
+    if name not in _LAZY_IMPORTS:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    import importlib
+
+    value = getattr(importlib.import_module(_LAZY_IMPORTS[name]), name)
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted({*globals(), *__all__})
@@ -1,22 +1,84 @@
+"""
+Beta handlers - indexed without importing them
+
+Available handlers are found by file name in this package and by the
+"bot_lib.beta_handlers" entry point group (name = "package.module:HandlerClass").
+A handler module is imported only when it's accessed:
+    from bot_lib.handlers.beta import request_data_from_user
+    handler_class = load_handler("request_data_from_user")
+or registered with BotManager by name:
+    BotManager(handlers=[BasicHandler, "request_data_from_user"])
+"""
+
 import importlib
-from loguru import logger
-import sys
+from functools import lru_cache
 from pathlib import Path
+from typing import Dict, List
+
+ENTRY_POINT_GROUP = "bot_lib.beta_handlers"
+
+
+@lru_cache(maxsize=None)
+def _discover() -> Dict[str, str]:
+    """:return: handler name -> import path: "module" or "module:attribute". Cached"""
+    found = {}
+    for item in Path(__file__).resolve().parent.iterdir():
+        if item.name.startswith("_"):
+            continue
+        if (item.suffix == ".py") or (item.is_dir() and (item / "__init__.py").exists()):
+            found[item.stem] = f"{__name__}.{item.stem}"
+
+    from importlib.metadata import entry_points
+
+    for entry_point in entry_points(group=ENTRY_POINT_GROUP):
+        found.setdefault(entry_point.name, entry_point.value)
+    return found
+
+
+def available_handlers() -> List[str]:
+    return sorted(_discover())
+
+
+@lru_cache(maxsize=None)
+def load_handler(name: str) -> type:
+    """
+    Import the beta handler and return its Handler class
+    For modules - the single Handler subclass defined in the module
+    """
+    from bot_lib.handlers.handler import Handler
+
+    path = _discover().get(name)
+    if path is None:
+        raise ValueError(f"Unknown beta handler: {name}. Available: {available_handlers()}")
+    module_name, _, attribute = path.partition(":")
+    module = importlib.import_module(module_name)
+    if attribute:
+        return getattr(module, attribute)
+
+    handler_classes = [
+        value
+        for value in vars(module).values()
+        if isinstance(value, type)
+        and issubclass(value, Handler)
+        and value is not Handler
+        and value.__module__ == module.__name__
+    ]
+    if len(handler_classes) != 1:
+        raise ValueError(
+            f"Expected one Handler subclass in {module_name}, found {len(handler_classes)}. "
+            f"Register it with an entry point: {ENTRY_POINT_GROUP} = {{{name} = '{module_name}:HandlerClass'}}"
+        )
+    return handler_classes[0]
 
-# Initialize __all__ for wildcard imports
-__all__ = []
 
-# Directory of the current file
-dir_path = Path(__file__).resolve().parent
+def __getattr__(name: str):
+    path = _discover().get(name)
+    if path is None:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    module_name, _, attribute = path.partition(":")
+    module = importlib.import_module(module_name)
+    return getattr(module, attribute) if attribute else module
 
 
-# List everything in the directory
-for item in dir_path.iterdir():
-    if (item.suffix == ".py" and item.stem != "__init__") or item.is_dir():
-        try:
-            # Dynamically import the module
-            imported_module = importlib.import_module("." + item.stem, package="bot-lib.handlers.beta")
-            setattr(sys.modules[__name__], item.stem, imported_module)
-            __all__.append(item.stem)
-        except Exception as e:
-            logger.warning(f"Warning: Failed to import {item.stem}: {e}")
+def __dir__():
+    return sorted({*globals(), *_discover()})
@@ -6,6 +6,7 @@ from aiogram.fsm.state import StatesGroup, State
 from aiogram.types import Message
 
 from bot_lib import Handler, HandlerDisplayMode
+from bot_lib.core.chat_scheduler import release_chat_turn
 
 
 class CustomState(StatesGroup):
@@ -31,7 +32,8 @@ class ExtensionHandler(Handler):
         # Send the question
         await self.reply_safe(message, question)
 
-        # Wait for the input
+        # Wait for the input - let the next updates of this chat run, the answer is one of them
+        release_chat_turn()
         await self.user_inputs[chat_id]["event"].wait()
 
         # Get and clear the input
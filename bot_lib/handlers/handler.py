@@ -2,35 +2,44 @@ import asyncio
 import enum
 import os
 import re
-import subprocess
+import shutil
 import textwrap
-import traceback
 from datetime import datetime
-from io import BytesIO
 from pathlib import Path
-from tempfile import mkstemp
-from typing import Dict
+from typing import AsyncIterator, Dict
 from typing import TYPE_CHECKING, Union, Optional
 from typing import Type, List
 
 from aiogram import Bot, Router
 from aiogram.enums import ParseMode
+from aiogram.exceptions import TelegramBadRequest, TelegramRetryAfter
 from aiogram.types import Message, ErrorEvent
 from calmapp import App
 from calmlib.utils import get_logger
 from typing_extensions import deprecated
-from dotenv import load_dotenv
 from pydantic import SecretStr
 from pydantic_settings import BaseSettings
 
 if TYPE_CHECKING:
     from calmapp.app import App
 
+from bot_lib.core.app_runner import AppFunctionRunner
+from bot_lib.core.cache import TTLCache
+from bot_lib.core.downloads import DownloadedFile, FileCache, LargeFileDownloader, ProgressCallback
+from bot_lib.core.rate_limiter import (
+    DEFAULT_GLOBAL_RATE,
+    DEFAULT_PRIVATE_CHAT_RATE,
+    DEFAULT_GROUP_CHAT_RATE,
+    OutboundScheduler,
+    get_send_scheduler,
+)
 from bot_lib.migration_bot_base.core.telegram_bot import TelegramBot as OldTelegramBot
 from bot_lib.migration_bot_base.utils.text_utils import (
     MAX_TELEGRAM_MESSAGE_LENGTH,
+    ParseModeCache,
     split_long_message,
     escape_md,
+    utf16_len,
 )
 from bot_lib.utils import tools_dir
 
@@ -60,6 +69,40 @@ class HandlerConfig(BaseSettings):
     parse_mode: Optional[ParseMode] = None
     send_preview_for_long_messages: bool = False
 
+    # outbound rate limits - see bot_lib.core.rate_limiter
+    rate_limit_enabled: bool = True
+    rate_limit_global: float = DEFAULT_GLOBAL_RATE  # messages per second
+    rate_limit_private_chat: float = DEFAULT_PRIVATE_CHAT_RATE  # messages per second
+    rate_limit_group_chat: float = DEFAULT_GROUP_CHAT_RATE  # messages per second
+    rate_limit_max_retries: int = 3  # retries on TelegramRetryAfter
+    # when sending long messages in chunks - reply to the first chunk with the rest
+    reply_chunks_to_first: bool = False
+    # how many large files (> 20 MB, over MTProto) are downloaded at the same time
+    max_concurrent_large_downloads: int = 2
+    # cache downloaded files by file_unique_id, under downloads_dir
+    file_cache_enabled: bool = True
+    file_cache_max_size_mb: int = 1024
+    file_cache_max_age_days: float = 7
+    # cache extracted message parts (voice transcription, text files) - per message
+    message_parts_cache_size: int = 1000
+    message_parts_cache_ttl: float = 10 * 60  # seconds
+    # max parallel message part extractions (downloads, transcriptions)
+    message_extraction_concurrency: int = 4
+    # voice messages: long audio is split on silence and transcribed in parallel
+    voice_chunk_max_length: int = 60  # seconds
+    voice_min_silence_length: int = 500  # milliseconds
+    voice_transcription_concurrency: int = 4
+    # stream the transcript of long voice messages to the user as chunks complete -
+    # in handlers calling get_message_text(send_partial_transcripts=True)
+    send_partial_transcripts: bool = False
+    # stream_safe: min interval between edits of the streamed message, seconds
+    stream_edit_interval: float = 1.0
+    # app functions called by commands - see bot_lib.core.app_runner
+    app_thread_pool_size: int = 8
+    app_process_pool_size: Optional[int] = None  # for @cpu_bound functions, defaults to the number of CPUs
+    app_command_concurrency: int = 4  # max parallel calls per command, 0 - unlimited
+    app_command_timeout: Optional[float] = None  # seconds, sync functions only. None - no timeout
+
     model_config = {
         "env_prefix": "TELEGRAM_BOT_",
     }
@@ -78,6 +121,8 @@ class Handler(OldTelegramBot):  # todo: add abc.ABC back after removing OldTeleg
     set_commands = []  # list of tuples (app_func_name, handler_func_name)
 
     def _load_config(self, **kwargs):
+        from dotenv import load_dotenv
+
         load_dotenv()
         return self._config_class(**kwargs)
 
@@ -93,6 +138,21 @@ class Handler(OldTelegramBot):  # todo: add abc.ABC back after removing OldTeleg
 
         # Pyrogram
         self._pyrogram_client = None
+        self._large_file_downloader = None
+        self._file_cache = None
+
+        # which parse modes work for which chats / texts
+        self._parse_mode_cache = ParseModeCache()
+
+        # extracted message parts (audio transcription, documents) - see _get_message_part
+        self._message_parts_cache = TTLCache(
+            maxsize=self.config.message_parts_cache_size,
+            ttl=self.config.message_parts_cache_ttl,
+        )
+        self._extraction_semaphore = asyncio.Semaphore(self.config.message_extraction_concurrency)
+
+        # sync app functions run off the event loop - see run_app_function
+        self._app_runner = None
 
     @property
     def pyrogram_client(self):
@@ -120,6 +180,34 @@ class Handler(OldTelegramBot):  # todo: add abc.ABC back after removing OldTeleg
     def on_startup(self, bot: Bot):
         self.bot = bot
 
+    async def on_shutdown(self):
+        if self._large_file_downloader is not None:
+            await self._large_file_downloader.stop()
+        if self._app_runner is not None:
+            self._app_runner.shutdown()
+
+    @property
+    def app_runner(self) -> AppFunctionRunner:
+        if self._app_runner is None:
+            self._app_runner = AppFunctionRunner(
+                max_threads=self.config.app_thread_pool_size,
+                max_processes=self.config.app_process_pool_size,
+                command_concurrency=self.config.app_command_concurrency,
+                timeout=self.config.app_command_timeout,
+            )
+        return self._app_runner
+
+    async def run_app_function(self, func, args: tuple = (), kwargs: dict = None, key=None, timeout=None):
+        """
+        Call an app function without blocking the event loop
+        Async functions are awaited, sync ones run in a thread pool (process pool if marked @cpu_bound)
+        :param args: positional arguments of the function
+        :param kwargs: keyword arguments of the function - e.g. parsed from the user's message
+        :param key: per-command concurrency limit key. Defaults to the function name
+        :param timeout: overrides config.app_command_timeout, seconds
+        """
+        return await self.app_runner.run(func, args=args, kwargs=kwargs, key=key, timeout=timeout)
+
     @property
     @deprecated("Found old (pre-migration) style usage of _aiogram_bot. please rework and replace with self.bot")
     def _aiogram_bot(self):
@@ -156,7 +244,7 @@ class Handler(OldTelegramBot):  # todo: add abc.ABC back after removing OldTeleg
             text = self.strip_command(message.text)
             user = self.get_user(message)
             func = getattr(app, name)
-            result = func(text, user)
+            result = await self.run_app_function(func, args=(text, user), key=name)
             await message.answer(result)
 
         return handler
@@ -165,7 +253,7 @@ class Handler(OldTelegramBot):  # todo: add abc.ABC back after removing OldTeleg
         async def handler(message: Message, app: App):
             user = self.get_user(message)
             func = getattr(app, name)
-            result = func(user)
+            result = await self.run_app_function(func, args=(user,), key=name)
             await message.answer(result)
 
         return handler
@@ -179,17 +267,63 @@ class Handler(OldTelegramBot):  # todo: add abc.ABC back after removing OldTeleg
             return ""
         return text
 
-    async def get_message_text(self, message: Message, as_markdown=False, include_reply=False) -> str:
+    async def get_message_text(
+        self, message: Message, as_markdown=False, include_reply=False, send_partial_transcripts=False
+    ) -> str:
         """
         Extract text from the message - including text, caption, voice messages, and text files
         :param message: aiogram Message object
         :param as_markdown: extract text with markdown formatting
         :param include_reply: include text from the message this message is replying to
+        :param send_partial_transcripts: stream the transcript of a long voice message to the chat
+            as its chunks complete (if config.send_partial_transcripts is on).
+            Only for handlers replying to the message - filters must not post anything
         :return: extracted text concatenated from all sources
         """
-        result = await self._extract_message_text(message, as_markdown, include_reply, as_dict=True)
+        extraction = asyncio.ensure_future(
+            self._extract_message_text(message, as_markdown, include_reply, as_dict=True)
+        )
+        if send_partial_transcripts and self.config.send_partial_transcripts and (message.voice or message.audio):
+            try:
+                await self._stream_partial_transcript(message, extraction)
+            except Exception as e:
+                # best effort - the full text is still returned
+                self.logger.warning(f"Failed to stream the partial transcript: {e}")
+        result = await extraction
         return "\n\n".join(result.values())
 
+    def _voice_chunk_tasks(self, message: Message) -> asyncio.Future:
+        """Future of the transcription tasks of a long voice message - set when the audio is split"""
+        key = (message.chat.id, message.message_id, message.edit_date, "audio_chunks")
+        future = self._message_parts_cache.get(key)
+        if future is None:
+            future = asyncio.get_running_loop().create_future()
+            self._message_parts_cache[key] = future
+        return future
+
+    def _on_voice_chunks(self, message: Message, tasks):
+        future = self._voice_chunk_tasks(message)
+        if not future.done():
+            future.set_result(tasks)
+
+    async def _stream_partial_transcript(self, message: Message, extraction: asyncio.Future):
+        chunk_tasks = self._voice_chunk_tasks(message)
+        await asyncio.wait([extraction, chunk_tasks], return_when=asyncio.FIRST_COMPLETED)
+        if not chunk_tasks.done():
+            # transcribed in one piece - nothing to stream
+            return
+
+        async def transcript_in_order():
+            for task in chunk_tasks.result():
+                yield "\n\n".join(await task) + "\n\n"
+
+        await self.stream_safe(
+            message.chat.id,
+            transcript_in_order(),
+            reply_to_message_id=message.message_id,
+            parse_mode=None,
+        )
+
     async def _extract_message_text(
         self,
         message: Message,
@@ -210,29 +344,32 @@ class Handler(OldTelegramBot):  # todo: add abc.ABC back after removing OldTeleg
                 logger.warning("Markdown captions are not supported yet")
             result["caption"] = message.caption
 
+        # independent expensive parts are extracted concurrently
+        # the result keys order stays fixed: audio, document, reply_to
+        parts = {}
         # option 3: voice/video message
         if message.voice or message.audio:
             # todo: accept voice message? Seems to work
-            chunks = await self._process_voice_message(message)
-            result["audio"] = "\n\n".join(chunks)
+            parts["audio"] = self._get_message_part(message, "audio", self._extract_audio_text)
         # todo: accept files?
         if message.document and message.document.mime_type == "text/plain":
-            self.logger.info(f"Received text file: {message.document.file_name}")
-            file = await self._aiogram_bot.download(message.document.file_id)
-            content = file.read().decode("utf-8")
-            result["document"] = f"\n\n{content}"
+            parts["document"] = self._get_message_part(message, "document", self._extract_document_text)
         # todo: accept video messages?
         # if message.document:
 
         # todo: extract text from Replies? No, do that explicitly
         if include_reply and hasattr(message, "reply_to_message") and message.reply_to_message:
-            reply_text = await self._extract_message_text(
+            parts["reply_to"] = self._extract_message_text(
                 message.reply_to_message,
                 as_markdown=as_markdown,
                 include_reply=False,
                 as_dict=False,
             )
-            result["reply_to"] = f"\n\n{reply_text}"
+
+        if parts:
+            values = await asyncio.gather(*parts.values())
+            for key, value in zip(parts, values):
+                result[key] = value if key == "audio" else f"\n\n{value}"
 
         # option 4: content - only extract if explicitly asked?
         # support multi-message content extraction?
@@ -241,6 +378,45 @@ class Handler(OldTelegramBot):  # todo: add abc.ABC back after removing OldTeleg
             return result
         return "\n\n".join(result.values())
 
+    async def _extract_audio_text(self, message: Message) -> str:
+        chunks = await self._process_voice_message(message)
+        return "\n\n".join(chunks)
+
+    async def _extract_document_text(self, message: Message) -> str:
+        self.logger.info(f"Received text file: {message.document.file_name}")
+        file = await self.download_file(message, message.document)
+        try:
+            return file.read().decode("utf-8")
+        finally:
+            file.close()
+
+    async def _run_extraction(self, extract, message: Message) -> str:
+        # bound the number of parallel downloads / transcriptions
+        async with self._extraction_semaphore:
+            return await extract(message)
+
+    async def _get_message_part(self, message: Message, part: str, extract) -> str:
+        """
+        Extract a part of the message text (e.g. audio transcription) at most once per message
+        Filters and handlers processing the same update share the result,
+        concurrent calls share the same extraction.
+        :param part: part name - cache key
+        :param extract: coroutine function (message) -> str
+        """
+        key = (message.chat.id, message.message_id, message.edit_date, part)
+        future = self._message_parts_cache.get(key)
+        if future is None:
+            future = asyncio.ensure_future(self._run_extraction(extract, message))
+            self._message_parts_cache[key] = future
+        try:
+            # shield - a cancelled caller shouldn't cancel the extraction for others
+            return await asyncio.shield(future)
+        except Exception:
+            # allow a retry - unless a retry has already stored a new extraction
+            if self._message_parts_cache.get(key) is future:
+                self._message_parts_cache.pop(key)
+            raise
+
     def _get_short_description(self, name):
         desc = getattr(self, name).__doc__
         if desc is None or desc.strip() == "":
@@ -304,18 +480,18 @@ class Handler(OldTelegramBot):  # todo: add abc.ABC back after removing OldTeleg
         # if hashtag is recognized - parse it
         for hashtag in hashtags:
             if hashtag in self.recognized_hashtags:
-                self.logger.debug(f"Recognized hashtag: {hashtag}")
+                self.logger.debug("Recognized hashtag: {}", hashtag)
                 # todo: support combining multiple queues / tags
                 #  e.g. #idea #task -> queues = [ideas, tasks]
                 result.update(self.recognized_hashtags[hashtag])
             else:
-                self.logger.debug(f"Custom hashtag: {hashtag}")
+                self.logger.debug("Custom hashtag: {}", hashtag)
                 result[hashtag[1:]] = True
 
         # parse explicit keys like queue=...
         attributes = self.attribute_re.findall(text)
         for key, value in attributes:
-            self.logger.debug(f"Recognized attribute: {key}={value}")
+            self.logger.debug("Recognized attribute: {}={}", key, value)
             result[key] = value
 
         return result
@@ -347,8 +523,16 @@ class Handler(OldTelegramBot):  # todo: add abc.ABC back after removing OldTeleg
         escape_markdown=False,
         wrap=True,
         parse_mode=None,
+        reply_chunks_to_first: Optional[bool] = None,
         **kwargs,  # todo: add everywhere below to send
     ):
+        """
+        Send a message, handling long texts and markdown issues
+        Long texts are sent as a file (send_long_messages_as_files=True)
+        or as several messages - then the list of sent messages is returned
+        :param reply_chunks_to_first: send follow-up chunks of a long message as replies to the first one.
+            Defaults to config.reply_chunks_to_first
+        """
         # backward compat: check if chat_id and text are swapped
         if self._check_is_chat_id(text) and self._check_is_text(chat_id):
             # warning
@@ -369,7 +553,8 @@ class Handler(OldTelegramBot):  # todo: add abc.ABC back after removing OldTeleg
             message: Message = chat_id
             chat_id = message.chat.id
             reply_to_message_id = message.message_id
-        if isinstance(chat_id, str):
+        if isinstance(chat_id, str) and self._check_is_chat_id(chat_id):
+            # numeric string. Channel usernames ("@channelname") are passed as is
             chat_id = int(chat_id)
 
         if wrap:
@@ -385,7 +570,9 @@ class Handler(OldTelegramBot):  # todo: add abc.ABC back after removing OldTeleg
                     preview = text[: self.PREVIEW_CUTOFF]
                     if escape_markdown:
                         preview = escape_md(preview)
-                    await self.bot.send_message(
+                    await self._scheduled_send(
+                        chat_id,
+                        self.bot.send_message,
                         chat_id,
                         textwrap.dedent(
                             f"""
@@ -419,50 +606,123 @@ class Handler(OldTelegramBot):  # todo: add abc.ABC back after removing OldTeleg
                     **kwargs,
                 )
         else:  # not self.send_long_messages_as_files
-            for chunk in split_long_message(text):
-                if escape_markdown:
-                    chunk = escape_md(chunk)
-                return await self._send_with_parse_mode_fallback(
-                    chat_id,
-                    chunk,
-                    reply_to_message_id=reply_to_message_id,
-                    parse_mode=parse_mode,
-                    **kwargs,
-                )
-
-    async def _send_with_parse_mode_fallback(self, chat_id, text, reply_to_message_id=None, parse_mode=None, **kwargs):
-        """
-        Send message with parse_mode=None if parse_mode is not supported
-        """
-        if parse_mode is None:
-            parse_mode = self.config.parse_mode
-        try:
-            return await self.bot.send_message(
+            if escape_markdown:
+                chunks = [escape_md(chunk) for chunk in split_long_message(text)]
+            else:
+                # keep code blocks and formatting intact across chunks
+                chunks = split_long_message(text, parse_mode=parse_mode or self.config.parse_mode)
+            return await self._send_chunks(
                 chat_id,
-                text,
+                chunks,
                 reply_to_message_id=reply_to_message_id,
                 parse_mode=parse_mode,
+                reply_chunks_to_first=reply_chunks_to_first,
                 **kwargs,
             )
-        except Exception:
-            self.logger.warning(
-                f"Failed to send message with parse_mode={parse_mode}. "
-                f"Retrying with parse_mode=None"
-                f"Exception: {traceback.format_exc()}"
-                # todo , data=traceback.format_exc()
-            )
-            return await self.bot.send_message(
+
+    async def _send_chunks(
+        self,
+        chat_id,
+        chunks: List[str],
+        reply_to_message_id=None,
+        parse_mode=None,
+        reply_chunks_to_first=None,
+        **kwargs,
+    ) -> List[Message]:
+        """
+        Send all chunks of a long message, one by one
+        Sending them concurrently gains nothing: the scheduler sends to a chat one request at a time anyway,
+        and a failed chunk would not stop the following ones.
+        :param reply_chunks_to_first: send follow-up chunks as replies to the first chunk
+        :return: list of sent messages
+        """
+        if reply_chunks_to_first is None:
+            reply_chunks_to_first = self.config.reply_chunks_to_first
+
+        messages = []
+        for chunk in chunks:
+            message = await self._send_with_parse_mode_fallback(
                 chat_id,
-                text,
+                chunk,
                 reply_to_message_id=reply_to_message_id,
-                parse_mode=None,
+                parse_mode=parse_mode,
                 **kwargs,
             )
+            if reply_chunks_to_first and not messages:
+                reply_to_message_id = message.message_id
+            messages.append(message)
+        return messages
+
+    async def _send_with_parse_mode_fallback(self, chat_id, text, reply_to_message_id=None, parse_mode=None, **kwargs):
+        """
+        Send message with parse_mode=None if parse_mode is not supported
+        Texts that are predicted (or known from previous attempts) to fail are sent with parse_mode=None right away
+        Both attempts run as one scheduled send, so the retry keeps its place in the chat queue
+        """
+        if parse_mode is None:
+            parse_mode = self.config.parse_mode
+        if not self._parse_mode_cache.check(chat_id, text, parse_mode):
+            self.logger.debug("Text is not valid for parse_mode={}. Sending with parse_mode=None", parse_mode)
+            parse_mode = None
+
+        async def send():
+            try:
+                return await self.bot.send_message(
+                    chat_id,
+                    text,
+                    reply_to_message_id=reply_to_message_id,
+                    parse_mode=parse_mode,
+                    **kwargs,
+                )
+            except TelegramRetryAfter:
+                # flood control - handled by the scheduler, parse_mode is not the issue
+                raise
+            except Exception as e:
+                if parse_mode is None:
+                    raise
+                if isinstance(e, TelegramBadRequest) and "can't parse entities" in e.message:
+                    self._parse_mode_cache.mark_failed(chat_id, text, parse_mode)
+                # one line per minute is enough to notice the issue
+                self.logger.throttled(limit=1, period=60).warning(
+                    "Failed to send message with parse_mode={}. Retrying with parse_mode=None. Error: {}",
+                    parse_mode,
+                    e,
+                )
+                return await self.bot.send_message(
+                    chat_id,
+                    text,
+                    reply_to_message_id=reply_to_message_id,
+                    parse_mode=None,
+                    **kwargs,
+                )
+
+        return await self._scheduled_send(chat_id, send)
 
     @property
     def send_long_messages_as_files(self):
         return self.config.send_long_messages_as_files
 
+    @property
+    def send_scheduler(self) -> OutboundScheduler:
+        """Outbound rate limiter - shared between all handlers of the same bot"""
+        return get_send_scheduler(
+            self.bot,
+            global_rate=self.config.rate_limit_global,
+            private_chat_rate=self.config.rate_limit_private_chat,
+            group_chat_rate=self.config.rate_limit_group_chat,
+            max_retries=self.config.rate_limit_max_retries,
+        )
+
+    async def _scheduled_send(self, chat_id, method, *args, **kwargs):
+        """
+        Call the bot api method through the outbound scheduler (if rate limiting is enabled)
+        :param chat_id: target chat - for per-chat limits and ordering
+        :param method: bot api method, e.g. self.bot.send_message
+        """
+        if not self.config.rate_limit_enabled:
+            return await method(*args, **kwargs)
+        return await self.send_scheduler.submit(chat_id, lambda: method(*args, **kwargs))
+
     async def _send_as_file(self, chat_id, text, reply_to_message_id=None, filename=None, **kwargs):
         """
         Send text as a file to the chat
@@ -475,7 +735,182 @@ class Handler(OldTelegramBot):  # todo: add abc.ABC back after removing OldTeleg
         from aiogram.types.input_file import BufferedInputFile
 
         temp_file = BufferedInputFile(text.encode("utf-8"), filename)
-        await self.bot.send_document(chat_id, temp_file, reply_to_message_id=reply_to_message_id, **kwargs)
+        return await self._scheduled_send(
+            chat_id,
+            self.bot.send_document,
+            chat_id,
+            temp_file,
+            reply_to_message_id=reply_to_message_id,
+            **kwargs,
+        )
+
+    # region stream_safe - deliver text while it's being generated
+
+    STREAM_PLACEHOLDER = "..."
+
+    async def stream_safe(
+        self,
+        chat_id: int,
+        stream: AsyncIterator[str],
+        reply_to_message_id: Optional[int] = None,
+        parse_mode=None,
+        placeholder: str = None,
+        **kwargs,
+    ) -> List[Message]:
+        """
+        Send a text while it's being generated - e.g. LLM response tokens
+        Sends a placeholder right away, then edits it with the accumulated text
+        at most once per config.stream_edit_interval. When the text doesn't fit into
+        one message, continues in a new one. The final edit of each message is sent
+        with parse_mode (with plain-text fallback), intermediate edits - as plain text.
+
+        Example:
+            await self.stream_safe(message.chat.id, app.gpt.stream_text(prompt))
+
+        :param stream: async iterator of text pieces
+        :param kwargs: send_message options, e.g. reply_markup - applied to every sent message
+        :return: list of sent messages
+        """
+        if parse_mode is None:
+            parse_mode = self.config.parse_mode
+        if placeholder is None:
+            placeholder = self.STREAM_PLACEHOLDER
+
+        message = await self._scheduled_send(
+            chat_id,
+            self.bot.send_message,
+            chat_id,
+            placeholder,
+            reply_to_message_id=reply_to_message_id,
+            parse_mode=None,
+            **kwargs,
+        )
+        messages = [message]
+        # edits without reply_markup drop the keyboard
+        reply_markup = kwargs.get("reply_markup")
+        text = ""
+        shown_text = placeholder
+        last_edit = 0.0
+        pending_edit: Optional[asyncio.Task] = None
+        loop = asyncio.get_running_loop()
+
+        iterator = stream.__aiter__()
+        next_piece: Optional[asyncio.Future] = None
+        try:
+            while True:
+                if next_piece is None:
+                    next_piece = asyncio.ensure_future(iterator.__anext__())
+                # while the stream pauses (slow model, tool call) - show the buffered text when the interval is up
+                waiters = {next_piece}
+                timeout = None
+                if text.strip() and text != shown_text:
+                    if pending_edit is not None and not pending_edit.done():
+                        waiters.add(pending_edit)
+                    else:
+                        timeout = max(last_edit + self.config.stream_edit_interval - loop.time(), 0)
+                await asyncio.wait(waiters, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+                if next_piece.done():
+                    try:
+                        piece = next_piece.result()
+                    except StopAsyncIteration:
+                        break
+                    finally:
+                        next_piece = None
+                    text += piece
+                if utf16_len(text) > MAX_TELEGRAM_MESSAGE_LENGTH:
+                    if pending_edit is not None:
+                        await pending_edit
+                        pending_edit = None
+                    # finalize the current message and continue in a new one
+                    *full_chunks, text = split_long_message(text, parse_mode=parse_mode)
+                    for i, chunk in enumerate(full_chunks):
+                        if i == 0:
+                            await self._edit_with_parse_mode_fallback(message, chunk, parse_mode, reply_markup)
+                        else:
+                            message = await self._send_with_parse_mode_fallback(
+                                chat_id, chunk, parse_mode=parse_mode, **kwargs
+                            )
+                            messages.append(message)
+                    shown_text = text if text.strip() else placeholder
+                    message = await self._scheduled_send(
+                        chat_id, self.bot.send_message, chat_id, shown_text, parse_mode=None, **kwargs
+                    )
+                    messages.append(message)
+                    last_edit = loop.time()
+                    continue
+                # don't block reading the stream while the edit is in flight
+                if (
+                    (pending_edit is None or pending_edit.done())
+                    and loop.time() - last_edit >= self.config.stream_edit_interval
+                    and text.strip()
+                    and text != shown_text
+                ):
+                    if pending_edit is not None:
+                        await pending_edit
+                    pending_edit = asyncio.create_task(
+                        self._edit_with_parse_mode_fallback(message, text, None, reply_markup)
+                    )
+                    shown_text = text
+                    last_edit = loop.time()
+            if pending_edit is not None:
+                await pending_edit
+                pending_edit = None
+        finally:
+            if next_piece is not None:
+                next_piece.cancel()
+            if pending_edit is not None:
+                pending_edit.cancel()
+
+        if not text.strip():
+            if len(messages) == 1:
+                # nothing was generated
+                await self._scheduled_send(chat_id, self.bot.delete_message, chat_id, message.message_id)
+                return []
+            return messages
+        if parse_mode is not None or text != shown_text:
+            await self._edit_with_parse_mode_fallback(message, text, parse_mode, reply_markup)
+        return messages
+
+    async def _edit_with_parse_mode_fallback(self, message: Message, text: str, parse_mode=None, reply_markup=None):
+        """
+        Edit message text with parse_mode=None if parse_mode is not supported
+        """
+        chat_id = message.chat.id
+        if not self._parse_mode_cache.check(chat_id, text, parse_mode):
+            parse_mode = None
+
+        async def edit(mode):
+            return await self.bot.edit_message_text(
+                text=text,
+                chat_id=chat_id,
+                message_id=message.message_id,
+                parse_mode=mode,
+                reply_markup=reply_markup,
+            )
+
+        async def send():
+            try:
+                return await edit(parse_mode)
+            except TelegramBadRequest as e:
+                if "message is not modified" in e.message:
+                    return message
+                if parse_mode is None:
+                    raise
+                if "can't parse entities" in e.message:
+                    self._parse_mode_cache.mark_failed(chat_id, text, parse_mode)
+                self.logger.throttled(limit=1, period=60).warning(
+                    "Failed to edit message with parse_mode={}. Retrying with parse_mode=None. Error: {}",
+                    parse_mode,
+                    e,
+                )
+                try:
+                    return await edit(None)
+                except TelegramBadRequest as e:
+                    if "message is not modified" in e.message:
+                        return message
+                    raise
+
+        return await self._scheduled_send(chat_id, send)
 
     # endregion
 
@@ -513,29 +948,63 @@ class Handler(OldTelegramBot):  # todo: add abc.ABC back after removing OldTeleg
         A wrapper to convert an application function into a telegram handler
         Extract the text from the message and pass it to the function
         Run the function and send the result as a message
+        Sync functions run off the event loop - see run_app_function
+        :param async_func: deprecated - async functions are detected automatically
         """
         # todo: extract kwargs from the message
         # i think I did this code multiple times already.. - find!
-        message_text = await self.get_message_text(message)
+        message_text = await self.get_message_text(message, send_partial_transcripts=True)
         # parse text into kwargs
         message_text = self.strip_command(message_text)
         result = self._parse_message_text(message_text)
-        if async_func:
-            response_text = await func(**result)
-        else:
-            response_text = func(**result)
+        response_text = await self.run_app_function(func, kwargs=result)
         await self.answer_safe(message, response_text)
 
     # endregion
 
     # region file ops
 
+    BOT_API_DOWNLOAD_LIMIT = 20 * 1024 * 1024
+
     async def download_file(self, message: Message, file_desc, file_path=None):
-        if file_desc.file_size < 20 * 1024 * 1024:
+        """
+        Download the file - using the file cache, if enabled
+        :param file_desc: aiogram file object - e.g. message.voice, message.document
+        :param file_path: where to save the file. If not provided - returns a binary file object
+        """
+        file_unique_id = getattr(file_desc, "file_unique_id", None)
+        if not self.config.file_cache_enabled or not file_unique_id:
+            return await self._download_file(message, file_desc, file_path)
+
+        cached_file = await self.file_cache.open(
+            file_unique_id, lambda path: self._download_file(message, file_desc, path)
+        )
+        if file_path is None:
+            return cached_file
+
+        def copy():
+            with cached_file, open(file_path, "wb") as target:
+                shutil.copyfileobj(cached_file, target)
+
+        await asyncio.to_thread(copy)
+        return file_path
+
+    async def _download_file(self, message: Message, file_desc, file_path=None):
+        if (file_desc.file_size or 0) < self.BOT_API_DOWNLOAD_LIMIT:
             return await self.bot.download(file_desc.file_id, destination=file_path)
         else:
             return await self.download_large_file(message.chat.username, message.message_id, target_path=file_path)
 
+    @property
+    def file_cache(self) -> FileCache:
+        if self._file_cache is None:
+            self._file_cache = FileCache(
+                self.downloads_dir / "cache",
+                max_size_bytes=self.config.file_cache_max_size_mb * 1024 * 1024,
+                max_age_seconds=self.config.file_cache_max_age_days * 24 * 3600,
+            )
+        return self._file_cache
+
     def _check_pyrogram_tokens(self):
         # todo: update, rework self.config, make it per-user
         if not (self.config.api_id.get_secret_value() and self.config.api_hash.get_secret_value()):
@@ -559,47 +1028,57 @@ class Handler(OldTelegramBot):  # todo: add abc.ABC back after removing OldTeleg
     def download_large_file_script_path(self):
         return self.tools_dir / "download_file_with_pyrogram.py"
 
-    async def download_large_file(self, chat_id, message_id, target_path=None):
+    @property
+    def large_file_downloader(self) -> LargeFileDownloader:
+        """Long-lived MTProto downloader - reuses self.pyrogram_client for all large file downloads"""
+        if self._large_file_downloader is None:
+            self._large_file_downloader = LargeFileDownloader(
+                lambda: self.pyrogram_client,
+                max_concurrent_downloads=self.config.max_concurrent_large_downloads,
+            )
+        return self._large_file_downloader
+
+    async def download_large_file(
+        self,
+        chat_id,
+        message_id,
+        target_path=None,
+        progress_callback: ProgressCallback = None,
+        download_id: str = None,
+    ):
+        """
+        Download a file over 20 MB with pyrogram
+        :param target_path: where to save the file. If not provided - returns a DownloadedFile
+            backed by a temp file, which is deleted when the file object is closed
+        :param progress_callback: called with (current, total) bytes
+        :param download_id: id to cancel the download with self.large_file_downloader.cancel(download_id)
+        """
         # todo: troubleshoot chat_id. Only username works for now.
         self._check_pyrogram_tokens()
 
-        script_path = self.download_large_file_script_path
-
-        # todo: update, rework self.config, make it per-user
-        # Construct command to run the download script
-        cmd = [
-            "python",
-            str(script_path),
-            "--chat-id",
-            str(chat_id),
-            "--message-id",
-            str(message_id),
-            "--token",
-            self.config.token.get_secret_value(),
-            "--api-id",
-            self.config.api_id.get_secret_value(),
-            "--api-hash",
-            self.config.api_hash.get_secret_value(),
-        ]
-
         if target_path:
-            cmd.extend(["--target-path", target_path])
+            file_path = target_path
         else:
-            _, file_path = mkstemp(dir=self.downloads_dir)
-            cmd.extend(["--target-path", file_path])
-        self.logger.debug(f"Running command: {' '.join(cmd)}")
-        # Run the command in a separate thread and await its result
-        # todo: check if this actually still works
-        result = await asyncio.to_thread(subprocess.run, cmd, capture_output=True)
-        err = result.stderr.strip().decode("utf-8")
-        if "ERROR" in err:
-            raise Exception(err)
-        file_path = result.stdout.strip().decode("utf-8")
-        self.logger.debug(f"{result.stdout=}\n\n{result.stderr=}")
+            from tempfile import mkstemp
+
+            fd, file_path = mkstemp(dir=self.downloads_dir)
+            os.close(fd)
+        try:
+            file_path = await self.large_file_downloader.download(
+                chat_id,
+                message_id,
+                file_path,
+                progress_callback=progress_callback,
+                download_id=download_id,
+            )
+        except BaseException:
+            if target_path is None:
+                os.unlink(file_path)
+            raise
+        self.logger.debug(f"Downloaded large file to {file_path}")
         if target_path is None:
-            file_data = BytesIO(open(file_path, "rb").read())
-            os.unlink(file_path)
-            return file_data
+            # read from disk on demand, the temp file is removed when the file object is closed
+            return DownloadedFile(file_path, delete=True)
         return file_path
 
     @property
@@ -610,9 +1089,10 @@ class Handler(OldTelegramBot):  # todo: add abc.ABC back after removing OldTeleg
 
     @property
     def downloads_dir(self):
-        if not self.app_data.exists():
-            self.app_data.mkdir(parents=True, exist_ok=True)
-        return self.app_data / "downloads"
+        downloads_dir = self.app_data / "downloads"
+        if not downloads_dir.exists():
+            downloads_dir.mkdir(parents=True, exist_ok=True)
+        return downloads_dir
 
     # endregion file ops
 
@@ -17,6 +17,9 @@ from aiogram.enums import ParseMode
 from aiogram.filters import Command
 from pydantic import BaseModel
 
+from bot_lib.migration_bot_base.utils.audio_utils import split_audio_on_silence
+from bot_lib.migration_bot_base.utils.log_sampling import SampledLogger
+
 if TYPE_CHECKING:
     from bot_lib.migration_bot_base.core import App
 
@@ -51,7 +54,7 @@ class TelegramBotBase(ABC):
     def __init__(self):
         self.start_time = datetime.now()
 
-        self.logger = loguru.logger.bind(component=self.__class__.__name__)
+        self.logger = SampledLogger(loguru.logger.bind(component=self.__class__.__name__))
         # token = config.token.get_secret_value()
 
         # if config.parse_mode is not None:
@@ -168,6 +171,8 @@ class TelegramBot(TelegramBotBase):
         self._multi_message_mode = defaultdict(bool)
         self.messages_stack = defaultdict(list)
         self.errors = defaultdict(lambda: deque(maxlen=128))
+        # shared by all voice messages of the bot - see _transcribe_audio_chunks
+        self._voice_transcription_semaphore = None
 
     # no decorator to control init order and user access
     # @mark_command(commands=["start"], description="Start command")
@@ -240,10 +245,10 @@ class TelegramBot(TelegramBotBase):
         Parse the message as the bot will see it and send it back
         Replace with your own implementation
         """
-        message_text = await self._extract_message_text(message)
-        self.logger.info(
-            f"Received message", user=message.from_user.username, data=message_text
-        )
+        message_text = await self.get_message_text(message, send_partial_transcripts=True)
+        self.logger.info("Received message", user=message.from_user.username)
+        # full text only at debug level - skipped entirely when debug is disabled or sampled out
+        self.logger.debug("Received message text", data=message_text)
         if self._multi_message_mode:
             self.messages_stack[message.chat.id].append(message)
         else:
@@ -273,11 +278,70 @@ class TelegramBot(TelegramBotBase):
         else:
             raise ValueError("No audio file detected")
 
-        file = await self.download_file(message, file_desc)
         if self.app is None:
             self.logger.warning("App not set, skipping audio processing")
             return None
-        return await self.app.parse_audio(file, parallel=parallel)
+        # large files come as a disk-backed file object - close it to clean up the temp file
+        file = await self.download_file(message, file_desc)
+        try:
+            chunks = None
+            if file_desc.duration and file_desc.duration > self.config.voice_chunk_max_length:
+                chunks = await self._split_audio(file)
+            if not chunks:
+                return await self.app.parse_audio(file, parallel=parallel)
+        finally:
+            file.close()
+        return await self._transcribe_audio_chunks(message, chunks, parallel=parallel)
+
+    async def _split_audio(self, file):
+        """Split long audio on silence. Returns None if it can't be split - e.g. pydub or ffmpeg is missing"""
+        try:
+            import pydub  # noqa: F401
+        except ImportError:
+            self.logger.debug("pydub is not installed, transcribing audio in one piece")
+            return None
+        try:
+            return await asyncio.to_thread(
+                split_audio_on_silence,
+                file,
+                max_chunk_length=self.config.voice_chunk_max_length * 1000,
+                min_silence_length=self.config.voice_min_silence_length,
+            )
+        except Exception as e:
+            # no ffmpeg, or a format it can't decode
+            self.logger.warning(f"Failed to split audio, transcribing it in one piece: {e}")
+            file.seek(0)
+            return None
+
+    @property
+    def voice_transcription_semaphore(self) -> asyncio.Semaphore:
+        """Bounds the transcriptions of all voice messages together - not per message"""
+        if self._voice_transcription_semaphore is None:
+            self._voice_transcription_semaphore = asyncio.Semaphore(self.config.voice_transcription_concurrency)
+        return self._voice_transcription_semaphore
+
+    async def _transcribe_audio_chunks(self, message, chunks, parallel=None):
+        """Transcribe audio chunks on a bounded worker pool, shared by all messages"""
+        semaphore = self.voice_transcription_semaphore
+
+        async def transcribe(chunk):
+            async with semaphore:
+                result = await self.app.parse_audio(chunk, parallel=parallel)
+            return [result] if isinstance(result, str) else result
+
+        tasks = [asyncio.create_task(transcribe(chunk)) for chunk in chunks]
+        self._on_voice_chunks(message, tasks)
+        try:
+            results = await asyncio.gather(*tasks)
+        except BaseException:
+            for task in tasks:
+                task.cancel()
+            raise
+        return [text for chunk_texts in results for text in chunk_texts]
+
+    def _on_voice_chunks(self, message, tasks):
+        """Called when a long voice message is split - with one transcription task per chunk, in order"""
+        pass
 
     @mark_command(commands=["multistart"], description="Start multi-message mode")
     async def multi_message_start(self, message: types.Message):
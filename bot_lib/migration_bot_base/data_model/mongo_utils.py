@@ -27,16 +27,72 @@ Items can be deleted by providing their _id or name.
 delete_item(SQDQueueItem, '5ff751482749093351c3e90f')
 delete_item(SQDQueueItem, 'item1')
 
+# Bulk operations
+add_items(SQDQueueItem, [{'name': 'item1', 'url': 'url1'}, {'name': 'item2', 'url': 'url2'}])
+update_many(SQDQueueItem, {'url': 'url1'}, url='new_url1')
+
+# Async
+Each function has an async variant with an "a" prefix - for handlers and other async code.
+They run the same calls in a thread pool, so the event loop is not blocked:
+
+await aadd_item(SQDQueueItem, name='item1', url='url1')
+await aget_item(SQDQueueItem, 'item1')
+
+The pool size is DATABASE_MAX_POOL_SIZE (default 10) - for both the threads and
+the mongo connections - see configure_executor and connect_to_db.
+
+# Lookup cache
+get_item / get_items results can be cached in-process for DATABASE_ITEM_CACHE_TTL seconds
+(default 0 - disabled). Writes through this module drop the cached items of the class.
+Writes from other processes and item.save() calls become visible only when the cached items expire.
+All callers get the same cached Document instance - don't modify it unless you own the cache.
+See configure_item_cache.
 """
+import asyncio
 import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
 from pathlib import Path
+from typing import Dict, List, Optional
 
 import mongoengine
 from bson import ObjectId
 from dotenv import load_dotenv
+from mongoengine import Q
+
+from bot_lib.core.cache import TTLCache
 
 default_database_connected = False
 
+DEFAULT_MAX_POOL_SIZE = 10
+_executor: Optional[ThreadPoolExecutor] = None
+
+
+def get_max_pool_size() -> int:
+    return int(os.getenv("DATABASE_MAX_POOL_SIZE", DEFAULT_MAX_POOL_SIZE))
+
+
+def configure_executor(max_workers: int = None) -> ThreadPoolExecutor:
+    """
+    Set up the thread pool for the async functions
+    More threads than mongo connections (maxPoolSize) only makes the threads wait for a connection
+    """
+    global _executor
+    if _executor is not None:
+        _executor.shutdown(wait=False)
+    if max_workers is None:
+        max_workers = get_max_pool_size()
+    _executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="mongo")
+    return _executor
+
+
+async def _run(func, *args, **kwargs):
+    if _executor is None:
+        configure_executor()
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_executor, partial(func, *args, **kwargs))
+
 
 def connect_to_db(conn_str=None, db_name=None, alias=None, **kwargs):
     global default_database_connected
@@ -56,6 +112,8 @@ def connect_to_db(conn_str=None, db_name=None, alias=None, **kwargs):
         if db_name is None:
             raise ValueError("Database name not provided")
 
+    kwargs.setdefault("maxPoolSize", get_max_pool_size())
+
     if alias is None or alias == "default":
         default_database_connected = True
     return mongoengine.connect(db=db_name, host=conn_str, alias=alias, **kwargs)
@@ -67,31 +125,204 @@ def add_item(cls, **kwargs):
     return item
 
 
+def add_items(cls, items: List[dict]) -> list:
+    """Insert many items in one round trip. :return: ids of the inserted items"""
+    if not items:
+        return []
+    ids = cls.objects.insert([cls(**kwargs) for kwargs in items], load_bulk=False)
+    return ids if isinstance(ids, list) else [ids]
+
+
+def _parse_key(key):
+    """:return: ("id", ObjectId) or ("name", key) - ObjectId-like keys are ids, the rest are names"""
+    if isinstance(key, ObjectId):
+        return "id", key
+    if isinstance(key, str) and ObjectId.is_valid(key):
+        return "id", ObjectId(key)
+    return "name", key
+
+
+# region lookup cache
+
+DEFAULT_ITEM_CACHE_TTL = 0  # opt-in: cached items are shared and may be stale
+DEFAULT_ITEM_CACHE_SIZE = 1024
+_item_cache_ttl = float(os.getenv("DATABASE_ITEM_CACHE_TTL", DEFAULT_ITEM_CACHE_TTL))
+_item_cache_size = DEFAULT_ITEM_CACHE_SIZE
+# class -> (field, value) -> item. Accessed from the executor threads, hence the lock
+_item_caches: Dict[type, TTLCache] = {}
+_item_cache_lock = threading.Lock()
+_MISSING = object()
+
+
+def configure_item_cache(ttl: float = DEFAULT_ITEM_CACHE_TTL, maxsize: int = DEFAULT_ITEM_CACHE_SIZE):
+    """:param ttl: how long lookups are cached, seconds. 0 - disable the cache"""
+    global _item_cache_ttl, _item_cache_size
+    with _item_cache_lock:
+        _item_cache_ttl = ttl
+        _item_cache_size = maxsize
+        _item_caches.clear()
+
+
+def _cache_get(cls, parsed_key):
+    if not _item_cache_ttl:
+        return _MISSING
+    with _item_cache_lock:
+        cache = _item_caches.get(cls)
+        return _MISSING if cache is None else cache.get(parsed_key, _MISSING)
+
+
+def _cache_set(cls, item):
+    if not _item_cache_ttl or item is None:
+        return
+    with _item_cache_lock:
+        cache = _item_caches.get(cls)
+        if cache is None:
+            cache = _item_caches[cls] = TTLCache(maxsize=_item_cache_size, ttl=_item_cache_ttl)
+        cache[("id", item.pk)] = item
+        name = getattr(item, "name", None)
+        if name is not None:
+            cache[("name", name)] = item
+
+
+def invalidate_item_cache(cls=None):
+    """Drop the cached items of the class, or all cached items"""
+    with _item_cache_lock:
+        if cls is None:
+            _item_caches.clear()
+        else:
+            _item_caches.pop(cls, None)
+
+
+# endregion
+
+_indexed_classes = set()
+
+
+def ensure_name_index(cls):
+    """Make sure lookups by name use an index. Runs create_index once per class per process"""
+    if cls in _indexed_classes:
+        return
+    collection = cls._get_collection()
+    collection.create_index(cls._fields["name"].db_field)
+    _indexed_classes.add(cls)
+
+
 def get_item(cls, key):
-    try:
-        # Try finding by ObjectId first
-        return cls.objects(id=ObjectId(key)).first()
-    except:
-        # Fallback to find by name
-        return cls.objects(name=key).first()
+    field, value = parsed_key = _parse_key(key)
+    item = _cache_get(cls, parsed_key)
+    if item is not _MISSING:
+        return item
+    if field == "name":
+        ensure_name_index(cls)
+    item = cls.objects(**{field: value}).first()
+    _cache_set(cls, item)
+    return item
+
+
+def get_items(cls, keys: list) -> list:
+    """
+    Resolve many ids / names in one query
+    :return: items in the order of keys, None for the keys that were not found
+    """
+    parsed_keys = [_parse_key(key) for key in keys]
+    found = {}
+    missing = []
+    for parsed_key in parsed_keys:
+        item = _cache_get(cls, parsed_key)
+        if item is _MISSING:
+            missing.append(parsed_key)
+        else:
+            found[parsed_key] = item
+
+    ids = list({value for field, value in missing if field == "id"})
+    names = list({value for field, value in missing if field == "name"})
+    if ids or names:
+        query = Q(id__in=ids)
+        if names:
+            ensure_name_index(cls)
+            query |= Q(name__in=names)
+        for item in cls.objects(query):
+            _cache_set(cls, item)
+            found[("id", item.pk)] = item
+            if getattr(item, "name", None) is not None:
+                found.setdefault(("name", item.name), item)
+    return [found.get(parsed_key) for parsed_key in parsed_keys]
 
 
 def update_item(cls, key, **kwargs):
-    item = get_item(cls, key)
-    if item:
-        item.update(**kwargs)
+    """
+    Update the item in one round trip (find_one_and_update)
+    :return: the updated item, None if not found
+    """
+    field, value = _parse_key(key)
+    if field == "name":
+        ensure_name_index(cls)
+    item = cls.objects(**{field: value}).modify(new=True, **kwargs)
+    invalidate_item_cache(cls)
+    return item
 
 
-def delete_item(cls, key):
-    item = get_item(cls, key)
-    if item:
-        item.delete()
+def update_many(cls, filters: dict, **kwargs) -> int:
+    """:return: number of updated items"""
+    result = cls.objects(**filters).update(**kwargs)
+    invalidate_item_cache(cls)
+    return result
+
+
+def delete_item(cls, key) -> bool:
+    """
+    Delete the item with Document.delete - mongoengine delete rules and signals are applied
+    :return: True if the item was found and deleted
+    """
+    field, value = _parse_key(key)
+    if field == "name":
+        ensure_name_index(cls)
+    # not from the lookup cache - delete what is in the database now
+    item = cls.objects(**{field: value}).first()
+    if item is None:
+        return False
+    item.delete()
+    invalidate_item_cache(cls)
+    return True
 
 
 def list_items(cls, **filters):
     return cls.objects(**filters).all()
 
 
+async def aadd_item(cls, **kwargs):
+    return await _run(add_item, cls, **kwargs)
+
+
+async def aadd_items(cls, items: List[dict]) -> list:
+    return await _run(add_items, cls, items)
+
+
+async def aget_item(cls, key):
+    return await _run(get_item, cls, key)
+
+
+async def aget_items(cls, keys: list) -> list:
+    return await _run(get_items, cls, keys)
+
+
+async def aupdate_item(cls, key, **kwargs):
+    return await _run(update_item, cls, key, **kwargs)
+
+
+async def aupdate_many(cls, filters: dict, **kwargs) -> int:
+    return await _run(update_many, cls, filters, **kwargs)
+
+
+async def adelete_item(cls, key) -> bool:
+    return await _run(delete_item, cls, key)
+
+
+async def alist_items(cls, **filters) -> list:
+    # the query is lazy - fetch the items in the pool too
+    return await _run(lambda: list(list_items(cls, **filters)))
+
+
 if __name__ == "__main__":
     connect_to_db()
 
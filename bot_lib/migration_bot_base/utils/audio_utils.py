@@ -0,0 +1,64 @@
+from io import BytesIO
+from typing import BinaryIO, List
+
+
+def find_split_points(silences, duration: int, max_chunk_length: int) -> List[int]:
+    """
+    Pick split points so that chunks are at most max_chunk_length long,
+    preferring the middle of the last silence in the second half of each chunk
+    :param silences: list of (start, end) silence ranges, sorted
+    :param duration: total audio length
+    :return: split points, excluding 0 and duration
+    """
+    points = []
+    pos = 0
+    i = 0
+    while duration - pos > max_chunk_length:
+        window_start = pos + max_chunk_length // 2
+        window_end = pos + max_chunk_length
+        cut = window_end
+        while i < len(silences) and (silences[i][0] + silences[i][1]) // 2 <= window_end:
+            middle = (silences[i][0] + silences[i][1]) // 2
+            if middle > window_start:
+                cut = middle
+            i += 1
+        points.append(cut)
+        pos = cut
+    return points
+
+
+def split_audio_on_silence(
+    file: BinaryIO,
+    max_chunk_length: int = 60 * 1000,
+    min_silence_length: int = 500,
+    silence_threshold_offset: float = 16,
+    export_format: str = "mp3",
+) -> List[BytesIO]:
+    """
+    Split audio into chunks of at most max_chunk_length ms, cutting on silence where possible
+    Requires pydub (and ffmpeg)
+    :param silence_threshold_offset: silence is quieter than the average loudness minus this, dBFS
+    :return: chunks as audio files in export_format
+    """
+    from pydub import AudioSegment
+    from pydub.silence import detect_silence
+
+    audio = AudioSegment.from_file(file)
+    if len(audio) <= max_chunk_length:
+        points = []
+    else:
+        silences = detect_silence(
+            audio,
+            min_silence_len=min_silence_length,
+            silence_thresh=audio.dBFS - silence_threshold_offset,
+        )
+        points = find_split_points(silences, len(audio), max_chunk_length)
+
+    chunks = []
+    for i, (start, end) in enumerate(zip([0] + points, points + [len(audio)])):
+        chunk = BytesIO()
+        audio[start:end].export(chunk, format=export_format)
+        chunk.name = f"chunk_{i}.{export_format}"
+        chunk.seek(0)
+        chunks.append(chunk)
+    return chunks
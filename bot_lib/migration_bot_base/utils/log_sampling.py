@@ -0,0 +1,165 @@
+"""
+Cheap logging for hot paths
+
+SampledLogger wraps a loguru logger and skips the log call as early as possible:
+1) level fast path - if no sink accepts the level, nothing is built or formatted
+2) sampling - only a share of the records of the configured levels is kept
+3) per-call-site rate limiting - at most `limit` records per `period` from one line of code,
+   the number of suppressed records is added to the next emitted one
+
+Messages are formatted lazily - pass the arguments instead of an f-string:
+    logger.debug("Recognized hashtag: {}", hashtag)
+
+Configured globally by setup_logger (see logging_utils) or configure_log_sampling()
+"""
+
+import random
+import sys
+import time
+from dataclasses import dataclass, field
+from typing import Dict, Optional
+
+import loguru
+
+
+@dataclass
+class LogSamplingConfig:
+    # level name -> share of records to keep, e.g. {"DEBUG": 0.1}. Levels not listed are not sampled
+    sample_rates: Dict[str, float] = field(default_factory=dict)
+    # max records per call site per period, for all SampledLogger calls. None - no limit
+    limit_per_call_site: Optional[int] = None
+    period: float = 60
+
+
+_config = LogSamplingConfig()
+
+
+def configure_log_sampling(
+    sample_rates: Dict[str, float] = None,
+    limit_per_call_site: Optional[int] = None,
+    period: float = 60,
+):
+    global _config
+    _config = LogSamplingConfig(
+        sample_rates=dict(sample_rates or {}),
+        limit_per_call_site=limit_per_call_site,
+        period=period,
+    )
+
+
+def get_log_sampling_config() -> LogSamplingConfig:
+    return _config
+
+
+_level_numbers: Dict[str, int] = {}
+
+
+def _level_no(level: str) -> int:
+    no = _level_numbers.get(level)
+    if no is None:
+        no = _level_numbers[level] = loguru.logger.level(level).no
+    return no
+
+
+class _CallSiteLimiter:
+    """Fixed-window counter per call site. Not locked - a race may let an extra record through"""
+
+    def __init__(self):
+        # (code, line) -> [window start, count, suppressed]
+        self._windows: Dict[tuple, list] = {}
+
+    def allow(self, call_site: tuple, limit: int, period: float):
+        """:return: None if the record is suppressed, else the number of records suppressed before it"""
+        now = time.monotonic()
+        window = self._windows.get(call_site)
+        if window is None or now - window[0] >= period:
+            suppressed = window[2] if window is not None else 0
+            self._windows[call_site] = [now, 1, 0]
+            return suppressed
+        if window[1] < limit:
+            window[1] += 1
+            suppressed, window[2] = window[2], 0
+            return suppressed
+        window[2] += 1
+        return None
+
+
+_limiter = _CallSiteLimiter()
+
+
+class SampledLogger:
+    """
+    Facade over a loguru logger with sampling, per-call-site rate limiting and a level fast path
+    Everything except the logging methods is delegated to the wrapped logger
+
+    Usage:
+        logger = SampledLogger(loguru.logger.bind(component="MyBot"))
+        logger.debug("Parsed {} attributes", len(attributes))
+        logger.throttled(limit=1, period=60).warning("Fallback to plain text: {}", error)
+    """
+
+    def __init__(self, logger=None, limit: Optional[int] = None, period: Optional[float] = None):
+        """
+        :param logger: loguru logger, e.g. a bound one. Defaults to loguru.logger
+        :param limit: max records per call site per period. Overrides the global limit
+        :param period: rate limit period, seconds
+        """
+        self._logger = loguru.logger if logger is None else logger
+        self._limit = limit
+        self._period = period
+
+    def throttled(self, limit: int = 1, period: float = 60) -> "SampledLogger":
+        """Same logger, with at most `limit` records per `period` seconds from each call site"""
+        return SampledLogger(self._logger, limit=limit, period=period)
+
+    def bind(self, **kwargs) -> "SampledLogger":
+        return SampledLogger(self._logger.bind(**kwargs), limit=self._limit, period=self._period)
+
+    def is_enabled_for(self, level: str) -> bool:
+        # loguru keeps the lowest level accepted by any sink - the same check its own fast path uses
+        return _level_no(level) >= getattr(self._logger._core, "min_level", 0)
+
+    def _log(self, level: str, message, args, kwargs, exception=False):
+        if not self.is_enabled_for(level):
+            return
+        rate = _config.sample_rates.get(level)
+        if rate is not None and random.random() >= rate:
+            return
+        limit = self._limit if self._limit is not None else _config.limit_per_call_site
+        if limit is not None:
+            frame = sys._getframe(2)
+            period = self._period if self._period is not None else _config.period
+            suppressed = _limiter.allow((frame.f_code, frame.f_lineno), limit, period)
+            if suppressed is None:
+                return
+            if suppressed:
+                message = f"{message} ({suppressed} similar records suppressed)"
+        # depth=2: report the caller of SampledLogger, not this method
+        self._logger.opt(depth=2, exception=exception or None).log(level, message, *args, **kwargs)
+
+    def trace(self, message, *args, **kwargs):
+        self._log("TRACE", message, args, kwargs)
+
+    def debug(self, message, *args, **kwargs):
+        self._log("DEBUG", message, args, kwargs)
+
+    def info(self, message, *args, **kwargs):
+        self._log("INFO", message, args, kwargs)
+
+    def success(self, message, *args, **kwargs):
+        self._log("SUCCESS", message, args, kwargs)
+
+    def warning(self, message, *args, **kwargs):
+        self._log("WARNING", message, args, kwargs)
+
+    def error(self, message, *args, **kwargs):
+        self._log("ERROR", message, args, kwargs)
+
+    def critical(self, message, *args, **kwargs):
+        self._log("CRITICAL", message, args, kwargs)
+
+    def exception(self, message, *args, **kwargs):
+        self._log("ERROR", message, args, kwargs, exception=True)
+
+    def __getattr__(self, name):
+        return getattr(self._logger, name)
@@ -1,8 +1,24 @@
 import os
+import random
 import sys
+import threading
+import traceback
+from collections import deque
+from datetime import datetime, timezone
+from typing import Dict, Iterator, List, NamedTuple, Optional, Tuple
 
 import loguru
 import mongoengine
+from bson import ObjectId
+from mongoengine import Q
+
+from bot_lib.migration_bot_base.utils.log_sampling import configure_log_sampling
+
+
+# opt-in retention: with LOG_RETENTION_DAYS > 0 a TTL index makes mongo delete older log items -
+# including the ones already stored. Default 0 - logs are kept forever.
+# Note: mongo won't replace an existing plain timestamp index with a TTL one - drop it first
+LOG_RETENTION_SECONDS = int(float(os.getenv("LOG_RETENTION_DAYS", 0)) * 24 * 3600)
 
 
 class LogItem(mongoengine.Document):
@@ -17,7 +33,21 @@ class LogItem(mongoengine.Document):
     user = mongoengine.StringField()
     data = mongoengine.StringField()
 
-    meta = {"collection": os.getenv("LOG_MONGO_COLLECTION", "logs")}
+    meta = {
+        "collection": os.getenv("LOG_MONGO_COLLECTION", "logs"),
+        "indexes": [
+            # retention: mongo deletes the items older than LOG_RETENTION_DAYS. 0 - keep forever
+            # the same index serves sorting by timestamp
+            {"fields": ["timestamp"], "expireAfterSeconds": LOG_RETENTION_SECONDS}
+            if LOG_RETENTION_SECONDS
+            else {"fields": ["timestamp"]},
+            # filters of load_logs, sorted by time
+            ("level", "-timestamp", "-_id"),
+            ("component", "-timestamp", "-_id"),
+            ("user", "-timestamp", "-_id"),
+            ("component", "level", "-timestamp"),
+        ],
+    }
 
 
 def mongo_sink(message):
@@ -36,6 +66,180 @@ def mongo_sink(message):
     log_item.save()
 
 
+class MongoLogSink:
+    """
+    Non-blocking loguru sink for LogItem
+
+    write() only appends the record to a bounded ring buffer. A background thread
+    saves the buffered records with insert_many - when batch_size records are
+    accumulated or every flush_interval seconds, whichever comes first.
+
+    Overflow policy, when the buffer is full:
+    - "drop_oldest" - new records replace the oldest ones
+    - "drop_newest" - new records are dropped
+    - "sample" - like drop_oldest, but once the buffer is half full only sample_rate
+      of the records below WARNING are kept
+    The number of dropped records is saved as a separate WARNING log item.
+
+    stop() (called by loguru on logger.remove() and at exit) saves all buffered records.
+
+    Usage:
+        logger.add(MongoLogSink(), level="INFO")
+    """
+
+    OVERFLOW_POLICIES = ("drop_oldest", "drop_newest", "sample")
+
+    def __init__(
+        self,
+        max_buffer_size: int = 10_000,
+        batch_size: int = 500,
+        flush_interval: float = 1.0,
+        overflow_policy: str = "sample",
+        sample_rate: float = 0.1,
+        stop_timeout: float = 10,
+    ):
+        """
+        :param max_buffer_size: max records waiting to be saved
+        :param batch_size: max records per insert_many
+        :param flush_interval: max time a record waits in the buffer, seconds
+        :param overflow_policy: what to drop when the buffer is full - see OVERFLOW_POLICIES
+        :param sample_rate: share of records below WARNING kept under overload, for "sample" policy
+        :param stop_timeout: max time to wait for the buffered records to be saved on stop, seconds
+        """
+        if overflow_policy not in self.OVERFLOW_POLICIES:
+            raise ValueError(f"Unknown overflow policy: {overflow_policy}, expected one of {self.OVERFLOW_POLICIES}")
+        self.max_buffer_size = max_buffer_size
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.overflow_policy = overflow_policy
+        self.sample_rate = sample_rate
+        self.stop_timeout = stop_timeout
+        self._warning_level_no = loguru.logger.level("WARNING").no
+
+        self._buffer = deque(maxlen=max_buffer_size)
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._stopping = False
+        self._thread: Optional[threading.Thread] = None
+
+        self.written = 0
+        self.dropped = 0
+        self.failed = 0
+        self._dropped_unreported = 0
+
+    @property
+    def buffer_size(self) -> int:
+        return len(self._buffer)
+
+    def write(self, message):
+        record = message.record
+        # keep only plain values - the rest is done in the background thread
+        item = dict(
+            level=record["level"].name,
+            level_no=record["level"].no,
+            message=record["message"],
+            timestamp=record["time"],
+            exception=record["exception"],
+            component=record["extra"].get("component", None),
+            user=record["extra"].get("user", None),
+            data=record["extra"].get("data", None),
+        )
+        with self._lock:
+            if self._thread is None and not self._stopping:
+                self._thread = threading.Thread(target=self._run, name="mongo-log-sink", daemon=True)
+                self._thread.start()
+            if not self._accept(item):
+                self.dropped += 1
+                self._dropped_unreported += 1
+                return
+            self._buffer.append(item)
+            if len(self._buffer) >= self.batch_size:
+                self._wakeup.set()
+
+    def _accept(self, item: dict) -> bool:
+        size = len(self._buffer)
+        if self.overflow_policy == "sample" and size >= self.max_buffer_size // 2:
+            if item["level_no"] < self._warning_level_no and random.random() >= self.sample_rate:
+                return False
+        if size >= self.max_buffer_size:
+            if self.overflow_policy == "drop_newest":
+                return False
+            # the deque drops the oldest record on append
+            self.dropped += 1
+            self._dropped_unreported += 1
+        return True
+
+    def stop(self):
+        """Save all buffered records and stop the background thread"""
+        with self._lock:
+            self._stopping = True
+            thread = self._thread
+        self._wakeup.set()
+        if thread is not None:
+            thread.join(self.stop_timeout)
+            if thread.is_alive():
+                print(
+                    f"MongoLogSink: {len(self._buffer)} log records were not saved in {self.stop_timeout}s",
+                    file=sys.stderr,
+                )
+
+    def _run(self):
+        while True:
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            while self._buffer:
+                if not self._save(self._take_batch()):
+                    break
+            if self._stopping:
+                with self._lock:
+                    if not self._buffer:
+                        # stopped - the next write() starts a new thread, e.g. after the sink is re-added
+                        self._stopping = False
+                        self._thread = None
+                        return
+
+    def _take_batch(self) -> list:
+        with self._lock:
+            batch = [self._buffer.popleft() for _ in range(min(self.batch_size, len(self._buffer)))]
+            if self._dropped_unreported:
+                batch.append(
+                    dict(
+                        level="WARNING",
+                        message=f"MongoLogSink: dropped {self._dropped_unreported} log records - buffer overflow",
+                        timestamp=datetime.now(timezone.utc),
+                        component="logging",
+                    )
+                )
+                self._dropped_unreported = 0
+        return batch
+
+    def _save(self, batch: list) -> bool:
+        try:
+            documents = [LogItem(**self._to_fields(item)).to_mongo() for item in batch]
+            LogItem._get_collection().insert_many(documents, ordered=False)
+            self.written += len(batch)
+            return True
+        except Exception as e:
+            # can't log this with loguru - it would come back to this sink
+            print(f"MongoLogSink: failed to save {len(batch)} log records: {e}", file=sys.stderr)
+            with self._lock:
+                # put the batch back - it's retried after flush_interval
+                room = self.max_buffer_size - len(self._buffer)
+                self._buffer.extendleft(reversed(batch[:room]))
+                self.failed += max(len(batch) - room, 0)
+            return False
+
+    @staticmethod
+    def _to_fields(item: dict) -> dict:
+        item = dict(item)
+        item.pop("level_no", None)
+        exception = item.pop("exception", None)
+        if exception:
+            item["exception"] = repr(exception.value)
+            item["traceback"] = "".join(traceback.format_exception(exception.type, exception.value, exception.traceback))
+        return item
+
+
 DATA_CUTOFF = 100
 
 # Customized formatter
@@ -76,6 +280,9 @@ def setup_logger(
     log_to_db: bool = None,
     file_path: str = None,
     remove_existing_handlers: bool = True,
+    sample_rates: Dict[str, float] = None,
+    limit_per_call_site: Optional[int] = None,
+    limit_period: float = 60,
 ):
     """
     Setup logger to
@@ -89,6 +296,12 @@ def setup_logger(
     For now, let's make this explicit:
     2) if log_to_file=True - log to file
     3) if log_to_db=True - log to db
+
+    Also configures SampledLogger (see log_sampling) - used by bots for hot-path logging
+    :param sample_rates: level name -> share of records to keep, e.g. {"DEBUG": 0.1}.
+        Defaults to LOG_DEBUG_SAMPLE_RATE env var for DEBUG, if set
+    :param limit_per_call_site: max records per line of code per limit_period.
+        Defaults to LOG_LIMIT_PER_CALL_SITE env var, if set
     :return:
     """
     global logger_initialized
@@ -122,16 +335,101 @@ def setup_logger(
     if log_to_db is None:
         log_to_db = os.getenv("LOG_TO_DB", False)
     if log_to_db:
-        logger.add(mongo_sink, level="INFO")
+        logger.add(MongoLogSink(), level="INFO")
+
+    if sample_rates is None:
+        sample_rates = {}
+        if os.getenv("LOG_DEBUG_SAMPLE_RATE"):
+            sample_rates["DEBUG"] = float(os.getenv("LOG_DEBUG_SAMPLE_RATE"))
+    if limit_per_call_site is None and os.getenv("LOG_LIMIT_PER_CALL_SITE"):
+        limit_per_call_site = int(os.getenv("LOG_LIMIT_PER_CALL_SITE"))
+    configure_log_sampling(sample_rates, limit_per_call_site=limit_per_call_site, period=limit_period)
 
     # return logger
     logger_initialized = True
 
 
-def load_logs(limit=100, **filters):
-    result = LogItem.objects
-    result = result.filter(**filters)
-    return result.order_by("-timestamp").limit(limit).as_pymongo()
+class LogCursor(NamedTuple):
+    """Position in the logs - the last returned item. Items are sorted by (timestamp, _id), newest first"""
+
+    timestamp: datetime
+    id: ObjectId
+
+    @classmethod
+    def from_item(cls, item: dict) -> "LogCursor":
+        return cls(item["timestamp"], item["_id"])
+
+
+def load_logs(limit=100, cursor: Optional[LogCursor] = None, **filters):
+    """
+    Newest log items matching the filters, as raw dicts. The query is lazy - items are fetched on iteration
+    :param cursor: return only the items after this one - see LogCursor and load_logs_page
+    :param filters: mongoengine filters, e.g. level="ERROR", component="MyBot", timestamp__gte=...
+    """
+    result = LogItem.objects.filter(**filters)
+    if cursor is not None:
+        result = result.filter(
+            Q(timestamp__lt=cursor.timestamp) | Q(timestamp=cursor.timestamp, id__lt=cursor.id)
+        )
+    return result.order_by("-timestamp", "-id").limit(limit).as_pymongo()
+
+
+def load_logs_page(limit=100, cursor: Optional[LogCursor] = None, **filters) -> Tuple[List[dict], Optional[LogCursor]]:
+    """
+    One page of logs
+    :return: items and the cursor of the next page (None if this page is the last one)
+
+    Usage:
+        items, cursor = load_logs_page(level="ERROR")
+        while cursor is not None:
+            items, cursor = load_logs_page(level="ERROR", cursor=cursor)
+    """
+    items = list(load_logs(limit=limit, cursor=cursor, **filters))
+    next_cursor = LogCursor.from_item(items[-1]) if len(items) == limit else None
+    return items, next_cursor
+
+
+def iter_logs(batch_size=1000, cursor: Optional[LogCursor] = None, **filters) -> Iterator[dict]:
+    """
+    Stream all matching logs, newest first, without loading them into memory
+    Each batch is a separate query, so no server-side cursor is kept open between batches
+    """
+    while True:
+        items, cursor = load_logs_page(limit=batch_size, cursor=cursor, **filters)
+        yield from items
+        if cursor is None:
+            return
+
+
+def count_logs_per_minute(
+    since: datetime,
+    until: Optional[datetime] = None,
+    levels=("ERROR", "CRITICAL"),
+    bucket_minutes: int = 1,
+) -> List[dict]:
+    """
+    Count of log items per component per time bucket - e.g. errors per minute for dashboards
+    Requires MongoDB 5.0+ ($dateTrunc)
+    :return: [{"component": ..., "time": bucket start, "count": ...}], sorted by time
+    """
+    match = {"timestamp": {"$gte": since}, "level": {"$in": list(levels)}}
+    if until is not None:
+        match["timestamp"]["$lt"] = until
+    pipeline = [
+        {"$match": match},
+        {
+            "$group": {
+                "_id": {
+                    "component": "$component",
+                    "time": {"$dateTrunc": {"date": "$timestamp", "unit": "minute", "binSize": bucket_minutes}},
+                },
+                "count": {"$sum": 1},
+            }
+        },
+        {"$project": {"_id": 0, "component": "$_id.component", "time": "$_id.time", "count": 1}},
+        {"$sort": {"time": 1, "component": 1}},
+    ]
+    return list(LogItem.objects.aggregate(pipeline))
 
 
 # Test the logger
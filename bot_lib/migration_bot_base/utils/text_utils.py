@@ -1,22 +1,212 @@
 import re
+from typing import Iterator, List
+
+from bot_lib.core.cache import TTLCache
 
 MAX_TELEGRAM_MESSAGE_LENGTH = 4096
 
 
-def split_long_message(text, max_length=MAX_TELEGRAM_MESSAGE_LENGTH, sep="\n"):
-    chunks = []
-    while len(text) > max_length:
-        chunk = text[:max_length]
-        if sep:
-            # split the text on the last sep character, if it exists
-            last_sep = chunk.rfind(sep)
-            if last_sep != -1:
-                chunk = chunk[: last_sep + 1]
-        text = text[len(chunk) :]
-        chunks.append(chunk)
-    if text:
-        chunks.append(text)  # add the remaining text as the last chunk
-    return chunks
+astral_re = re.compile("[\U00010000-\U0010FFFF]")
+
+
+def utf16_len(text: str) -> int:
+    """Text length in UTF-16 code units - the way Telegram counts message length"""
+    return len(text.encode("utf-16-le")) // 2
+
+
+def _find_cut(text: str, start: int, limit: int, has_astral: bool) -> int:
+    """Max end such that text[start:end] fits into limit UTF-16 code units"""
+    end = min(start + limit, len(text))
+    if not has_astral:
+        return end
+    units = end - start + len(astral_re.findall(text, start, end))
+    while units > limit:
+        end -= 1
+        units -= 2 if ord(text[end]) > 0xFFFF else 1
+    return end
+
+
+class _MarkdownState:
+    """Open markdown entities (code blocks, bold, italic, ...) at the current position"""
+
+    FENCE = "```"
+
+    def __init__(self, token_re):
+        self.token_re = token_re
+        self.markers = []  # open toggle markers, in order
+        self.fence_lang = None  # not None - inside a code block
+        self.inline_code = False
+
+    def copy(self) -> "_MarkdownState":
+        state = _MarkdownState(self.token_re)
+        state.markers = list(self.markers)
+        state.fence_lang = self.fence_lang
+        state.inline_code = self.inline_code
+        return state
+
+    def feed(self, chunk: str):
+        for match in self.token_re.finditer(chunk):
+            token = match.group()
+            if token[0] == "\\":
+                continue
+            if self.fence_lang is not None:
+                if token == self.FENCE:
+                    self.fence_lang = None
+            elif self.inline_code:
+                if token == "`":
+                    self.inline_code = False
+            elif token == self.FENCE:
+                line_end = chunk.find("\n", match.end())
+                self.fence_lang = chunk[match.end() : line_end] if line_end != -1 else ""
+            elif token == "`":
+                self.inline_code = True
+            elif token in self.markers:
+                self.markers.remove(token)
+            else:
+                self.markers.append(token)
+
+    def closers(self, chunk: str) -> str:
+        result = ""
+        if self.fence_lang is not None:
+            result += ("" if chunk.endswith("\n") else "\n") + self.FENCE
+        elif self.inline_code:
+            result += "`"
+        return result + "".join(reversed(self.markers))
+
+    def openers(self) -> str:
+        result = "".join(self.markers)
+        if self.fence_lang is not None:
+            result += f"{self.FENCE}{self.fence_lang}\n"
+        elif self.inline_code:
+            result += "`"
+        return result
+
+    @staticmethod
+    def adjust_cut(text: str, start: int, end: int) -> int:
+        # don't split multi-character markers (```, ||, __)
+        while end - 1 > start and text[end - 1] == text[end] and text[end] in "`|_~*":
+            end -= 1
+        # don't split escape sequences
+        backslashes = 0
+        while end - backslashes - 1 >= start and text[end - backslashes - 1] == "\\":
+            backslashes += 1
+        if backslashes % 2 and end - 1 > start:
+            end -= 1
+        return end
+
+
+class _HtmlState:
+    """Open html tags at the current position"""
+
+    tag_re = re.compile(r"<(/?)([a-zA-Z][\w-]*)[^<>]*>")
+
+    def __init__(self):
+        self.tags = []  # (tag name, opening tag text)
+
+    def copy(self) -> "_HtmlState":
+        state = _HtmlState()
+        state.tags = list(self.tags)
+        return state
+
+    def feed(self, chunk: str):
+        for match in self.tag_re.finditer(chunk):
+            closing, tag = match.group(1), match.group(2).lower()
+            if not closing:
+                self.tags.append((tag, match.group()))
+            elif self.tags and self.tags[-1][0] == tag:
+                self.tags.pop()
+
+    def closers(self, chunk: str) -> str:
+        return "".join(f"</{tag}>" for tag, _ in reversed(self.tags))
+
+    def openers(self) -> str:
+        return "".join(opening for _, opening in self.tags)
+
+    @staticmethod
+    def adjust_cut(text: str, start: int, end: int) -> int:
+        # don't split tags and html entities
+        for opening, closing in (("<", ">"), ("&", ";")):
+            last_open = text.rfind(opening, start, end)
+            if last_open > start and text.rfind(closing, last_open, end) == -1:
+                end = last_open
+        return end
+
+
+markdown_v2_token_re = re.compile(r"\\[\s\S]|```|`|\|\||__|[*_~]")
+markdown_token_re = re.compile(r"\\[\s\S]|```|`|[*_]")
+
+# space first reserved in each chunk for closing the open entities - grows if the closers don't fit
+MARKUP_RESERVE = 16
+
+
+def _get_markup_state(parse_mode):
+    if parse_mode is None:
+        return None
+    parse_mode = str(getattr(parse_mode, "value", parse_mode)).lower()
+    if parse_mode == "markdownv2":
+        return _MarkdownState(markdown_v2_token_re)
+    if parse_mode == "markdown":
+        return _MarkdownState(markdown_token_re)
+    if parse_mode == "html":
+        return _HtmlState()
+    return None
+
+
+def iter_message_chunks(text, max_length=MAX_TELEGRAM_MESSAGE_LENGTH, sep="\n", parse_mode=None) -> Iterator[str]:
+    """
+    Split the text into chunks that fit into a telegram message - lazily, in linear time
+    :param max_length: max chunk length, in UTF-16 code units (the way Telegram counts)
+    :param sep: prefer splitting after the last sep in the chunk (e.g. on a new line)
+    :param parse_mode: if set - code blocks and formatting open at the chunk boundary
+        are closed at the end of the chunk and reopened at the start of the next one
+    """
+    state = _get_markup_state(parse_mode)
+    has_astral = astral_re.search(text) is not None
+    prefix = ""
+    start = 0
+    while start < len(text):
+        reserve = MARKUP_RESERVE if state is not None else 0
+        while True:
+            limit = max_length - reserve - utf16_len(prefix)
+            if limit <= 0:
+                raise ValueError(f"max_length={max_length} is too small to fit the formatting")
+            end = _find_cut(text, start, limit, has_astral)
+            if end == start:
+                raise ValueError(f"max_length={max_length} is too small to fit a single character")
+            if end < len(text):
+                if sep:
+                    # split the text on the last sep, if it exists
+                    last_sep = text.rfind(sep, start, end)
+                    if last_sep != -1:
+                        end = last_sep + len(sep)
+                if state is not None:
+                    end = state.adjust_cut(text, start, end)
+            chunk = text[start:end]
+            if state is None:
+                break
+            # the closers depend on the cut - check they fit, cut earlier if they don't
+            new_state = state.copy()
+            new_state.feed(chunk)
+            closers = new_state.closers(chunk) if end < len(text) else ""
+            overflow = utf16_len(prefix) + utf16_len(chunk) + utf16_len(closers) - max_length
+            if overflow <= 0:
+                state = new_state
+                break
+            reserve += overflow
+
+        start = end
+        if state is None:
+            yield chunk
+        elif start < len(text):
+            yield prefix + chunk + closers
+            prefix = state.openers()
+        else:
+            yield prefix + chunk
+
+
+def split_long_message(text, max_length=MAX_TELEGRAM_MESSAGE_LENGTH, sep="\n", parse_mode=None) -> List[str]:
+    """Split the text into chunks that fit into a telegram message. See iter_message_chunks"""
+    return list(iter_message_chunks(text, max_length=max_length, sep=sep, parse_mode=parse_mode))
 
 
 SPECIAL_CHARS = r"\\_\*\[\]\(\)~`><&#+\-=\|\{\}\.\!"
@@ -28,3 +218,201 @@ escape_re = re.compile(f"[{SPECIAL_CHARS}]")
 def escape_md(text: str) -> str:
     """Escape markdown special characters in the text."""
     return escape_re.sub(r"\\\g<0>", text)
+
+
+# region parse mode checks - predict "can't parse entities" errors locally
+
+MARKDOWN_V2_RESERVED_CHARS = set("_*[]()~`>#+-=|{}.!")
+MARKDOWN_V2_TOGGLE_MARKERS = ("||", "__", "*", "_", "~")
+MARKDOWN_MARKERS = ("*", "_")
+
+SUPPORTED_HTML_TAGS = {
+    "b",
+    "strong",
+    "i",
+    "em",
+    "u",
+    "ins",
+    "s",
+    "strike",
+    "del",
+    "span",
+    "tg-spoiler",
+    "a",
+    "code",
+    "pre",
+    "blockquote",
+    "tg-emoji",
+}
+html_tag_re = re.compile(r"<(/?)([a-zA-Z][\w-]*)(\s[^<>]*)?>")
+html_entity_re = re.compile(r"&(?:#\d+|#x[0-9a-fA-F]+|lt|gt|amp|quot);")
+
+
+def _find_unescaped(text: str, sub: str, start: int) -> int:
+    """Find sub in text starting from start, skipping backslash-escaped characters"""
+    i = start
+    n = len(text)
+    while i < n:
+        if text[i] == "\\":
+            i += 2
+            continue
+        if text.startswith(sub, i):
+            return i
+        i += 1
+    return -1
+
+
+def _check_markdown_v2(text: str) -> bool:
+    open_markers = set()
+    link_depth = 0
+    i = 0
+    n = len(text)
+    while i < n:
+        c = text[i]
+        if c == "\\":
+            i += 2
+            continue
+        if c == "`":
+            fence = "```" if text.startswith("```", i) else "`"
+            end = _find_unescaped(text, fence, i + len(fence))
+            if end == -1:
+                return False
+            i = end + len(fence)
+            continue
+        marker = next((m for m in MARKDOWN_V2_TOGGLE_MARKERS if text.startswith(m, i)), None)
+        if marker is not None:
+            open_markers ^= {marker}
+            i += len(marker)
+            continue
+        if c == "[" or (c == "!" and text.startswith("![", i)):
+            link_depth += 1
+            i += 2 if c == "!" else 1
+            continue
+        if c == "]":
+            if not link_depth or not text.startswith("(", i + 1):
+                return False
+            end = _find_unescaped(text, ")", i + 2)
+            if end == -1:
+                return False
+            link_depth -= 1
+            i = end + 1
+            continue
+        if c == ">" and (i == 0 or text[i - 1] == "\n"):
+            # block quotation
+            i += 1
+            continue
+        if c in MARKDOWN_V2_RESERVED_CHARS:
+            return False
+        i += 1
+    return not open_markers and not link_depth
+
+
+def _check_markdown(text: str) -> bool:
+    open_marker = None
+    i = 0
+    n = len(text)
+    while i < n:
+        c = text[i]
+        if c == "\\":
+            i += 2
+            continue
+        if open_marker is None and c == "`":
+            fence = "```" if text.startswith("```", i) else "`"
+            end = text.find(fence, i + len(fence))
+            if end == -1:
+                return False
+            i = end + len(fence)
+            continue
+        if c in MARKDOWN_MARKERS:
+            # legacy markdown entities can't be nested
+            if open_marker is None:
+                open_marker = c
+            elif open_marker == c:
+                open_marker = None
+        elif open_marker is None and c == "[":
+            end = text.find("]", i + 1)
+            if end != -1 and text.startswith("(", end + 1):
+                url_end = text.find(")", end + 2)
+                if url_end == -1:
+                    return False
+                i = url_end + 1
+                continue
+        i += 1
+    return open_marker is None
+
+
+def _check_html(text: str) -> bool:
+    stack = []
+    i = text.find("<")
+    j = text.find("&")
+    while i != -1 or j != -1:
+        if j != -1 and (i == -1 or j < i):
+            if not html_entity_re.match(text, j):
+                return False
+            j = text.find("&", j + 1)
+            continue
+        match = html_tag_re.match(text, i)
+        if match is None:
+            return False
+        closing, tag, _ = match.groups()
+        tag = tag.lower()
+        if tag not in SUPPORTED_HTML_TAGS:
+            return False
+        if closing:
+            if not stack or stack.pop() != tag:
+                return False
+        else:
+            stack.append(tag)
+        i = text.find("<", match.end())
+        if j != -1 and j < match.end():
+            # '&' inside the tag attributes
+            j = text.find("&", match.end())
+    return not stack
+
+
+def check_markup(text: str, parse_mode) -> bool:
+    """
+    Cheap local check if Telegram will be able to parse the text with the given parse_mode.
+    Checks balanced markers / tags, escaped special characters (MarkdownV2)
+    and html entities. False positives are possible - this is a prediction, not a parser.
+    """
+    if parse_mode is None:
+        return True
+    parse_mode = str(getattr(parse_mode, "value", parse_mode)).lower()
+    if parse_mode == "markdownv2":
+        return _check_markdown_v2(text)
+    if parse_mode == "markdown":
+        return _check_markdown(text)
+    if parse_mode == "html":
+        return _check_html(text)
+    return True
+
+
+class ParseModeCache:
+    """
+    Decide if a text should be sent with its parse mode
+    A text predicted (check_markup) or known (mark_failed) to fail is sent in plain mode
+    right away - saving a failing round trip. Failures are remembered per exact text,
+    for a short time - e.g. retries and repeated edits of the same text.
+    """
+
+    def __init__(self, maxsize: int = 10_000, ttl: float = 300):
+        self._failed = TTLCache(maxsize=maxsize, ttl=ttl)
+
+    @staticmethod
+    def _key(chat_id, text: str, parse_mode) -> tuple:
+        return chat_id, str(parse_mode), hash(text)
+
+    def check(self, chat_id, text: str, parse_mode) -> bool:
+        """Should we try sending this text with the parse_mode?"""
+        if parse_mode is None:
+            return True
+        if self._key(chat_id, text, parse_mode) in self._failed:
+            return False
+        return check_markup(text, parse_mode)
+
+    def mark_failed(self, chat_id, text: str, parse_mode):
+        self._failed[self._key(chat_id, text, parse_mode)] = True
+
+
+# endregion parse mode checks
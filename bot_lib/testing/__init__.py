@@ -0,0 +1,35 @@
+"""
+Test and benchmark tools - a local fake Bot API and a load generator
+    from bot_lib.testing import FakeBotAPI, run_load_test
+"""
+
+from typing import TYPE_CHECKING
+
+_LAZY_IMPORTS = {
+    "FakeBotAPI": "bot_lib.testing.fake_bot_api",
+    "RecordedCall": "bot_lib.testing.fake_bot_api",
+    "EchoHandler": "bot_lib.testing.load_testing",
+    "LoadTestResult": "bot_lib.testing.load_testing",
+    "generate_updates": "bot_lib.testing.load_testing",
+    "run_load_test": "bot_lib.testing.load_testing",
+}
+
+__all__ = list(_LAZY_IMPORTS)
+
+if TYPE_CHECKING:
+    from .fake_bot_api import FakeBotAPI, RecordedCall
+    from .load_testing import EchoHandler, LoadTestResult, generate_updates, run_load_test
+
+
+def __getattr__(name: str):
+    if name not in _LAZY_IMPORTS:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    import importlib
+
+    value = getattr(importlib.import_module(_LAZY_IMPORTS[name]), name)
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted({*globals(), *__all__})
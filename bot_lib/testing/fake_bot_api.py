@@ -0,0 +1,286 @@
+"""
+Local stand-in for the Telegram Bot API - for tests and benchmarks
+
+An aiohttp server running in the same event loop. It answers the methods bot_lib
+uses, records every call and can simulate a slow or unhappy Telegram:
+- latency - every response is delayed
+- retry_after_every - every N-th send gets a 429 "Too Many Requests"
+- reject_parse_mode - sends with a parse_mode fail with "can't parse entities"
+- fail_next - one-off errors for a method
+Updates added with push_update are returned by getUpdates.
+
+Usage:
+    async with FakeBotAPI(latency=0.05) as api:
+        bot = api.create_bot()
+        await bot.send_message(1, "hello")
+        assert api.count("sendMessage") == 1
+        await bot.session.close()
+"""
+
+import asyncio
+import itertools
+import json
+import time
+from collections import Counter, defaultdict, deque
+from dataclasses import dataclass, field
+from typing import Any, Deque, Dict, List, Optional
+
+from aiohttp import web
+
+TEST_TOKEN = "42:FAKE-TOKEN"
+BOT_USER = {"id": 42, "is_bot": True, "first_name": "Fake Bot", "username": "fake_bot"}
+
+# methods returning the sent / edited message
+MESSAGE_METHODS = {
+    "sendMessage",
+    "sendDocument",
+    "sendPhoto",
+    "sendAudio",
+    "sendVoice",
+    "sendVideo",
+    "editMessageText",
+    "editMessageCaption",
+}
+# subject to the simulated flood limits
+SEND_METHODS = MESSAGE_METHODS - {"editMessageText", "editMessageCaption"}
+
+
+@dataclass
+class RecordedCall:
+    method: str
+    params: Dict[str, Any]
+    status: int
+    time: float = field(default_factory=time.monotonic)
+
+
+@dataclass
+class _InjectedError:
+    error_code: int
+    description: str
+    retry_after: Optional[int] = None
+
+
+class FakeBotAPI:
+    def __init__(
+        self,
+        latency: float = 0.0,
+        retry_after_every: int = 0,
+        retry_after: int = 1,
+        reject_parse_mode: bool = False,
+        host: str = "127.0.0.1",
+        port: int = 0,
+    ):
+        """
+        :param latency: delay of every response, seconds
+        :param retry_after_every: every N-th send call gets a 429 error. 0 - never
+        :param retry_after: retry_after of the 429 errors, seconds
+        :param reject_parse_mode: fail all calls with a parse_mode - "can't parse entities"
+        :param port: 0 - any free port
+        """
+        self.latency = latency
+        self.retry_after_every = retry_after_every
+        self.retry_after = retry_after
+        self.reject_parse_mode = reject_parse_mode
+        self.host = host
+        self.port = port
+
+        self.calls: List[RecordedCall] = []
+        self.files: Dict[str, bytes] = {}  # file_id -> content
+        self.updates: List[dict] = []  # not yet confirmed updates for getUpdates
+        self._injected: Dict[str, Deque[_InjectedError]] = defaultdict(deque)
+        self._message_ids: Dict[int, itertools.count] = defaultdict(lambda: itertools.count(1))
+        self._file_ids = itertools.count(1)
+        self._sends = 0
+        self._runner: Optional[web.AppRunner] = None
+
+    # region server
+    @property
+    def base_url(self) -> str:
+        return f"http://{self.host}:{self.port}"
+
+    def build_app(self) -> web.Application:
+        app = web.Application(client_max_size=64 * 1024 * 1024)
+        app.router.add_post("/bot{token}/{method}", self._handle_method)
+        app.router.add_get("/file/bot{token}/{path:.+}", self._handle_file)
+        return app
+
+    async def start(self) -> str:
+        """:return: base url of the server"""
+        self._runner = web.AppRunner(self.build_app(), access_log=None)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, self.host, self.port)
+        await site.start()
+        self.port = self._runner.addresses[0][1]
+        return self.base_url
+
+    async def stop(self):
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
+
+    async def __aenter__(self) -> "FakeBotAPI":
+        await self.start()
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.stop()
+
+    def create_bot(self, token: str = TEST_TOKEN, **kwargs):
+        """aiogram Bot talking to this server"""
+        from aiogram import Bot
+        from aiogram.client.session.aiohttp import AiohttpSession
+        from aiogram.client.telegram import TelegramAPIServer
+
+        session = AiohttpSession(api=TelegramAPIServer.from_base(self.base_url))
+        return Bot(token, session=session, **kwargs)
+
+    # endregion server
+
+    # region inspection
+    def get_calls(self, method: str = None) -> List[RecordedCall]:
+        if method is None:
+            return list(self.calls)
+        return [call for call in self.calls if call.method == method]
+
+    def count(self, method: str = None) -> int:
+        return len(self.get_calls(method))
+
+    def calls_by_method(self) -> Dict[str, int]:
+        return dict(Counter(call.method for call in self.calls))
+
+    def sent_texts(self, chat_id: int = None) -> List[str]:
+        """Texts of the successful sendMessage calls, in order"""
+        return [
+            call.params.get("text")
+            for call in self.get_calls("sendMessage")
+            if call.status == 200 and (chat_id is None or int(call.params["chat_id"]) == chat_id)
+        ]
+
+    def reset(self):
+        self.calls.clear()
+        self._injected.clear()
+        self._sends = 0
+
+    # endregion inspection
+
+    # region error injection
+    def fail_next(self, method: str, error_code: int = 400, description: str = None, retry_after: int = None, times=1):
+        """Make the next `times` calls of the method fail with the given error"""
+        if description is None:
+            description = "Too Many Requests" if error_code == 429 else "Bad Request: simulated error"
+        if retry_after is not None:
+            description += f": retry after {retry_after}"
+        for _ in range(times):
+            self._injected[method].append(_InjectedError(error_code, description, retry_after))
+
+    def push_update(self, update: dict):
+        """Queue a raw update for getUpdates"""
+        self.updates.append(update)
+
+    def add_file(self, content: bytes, file_id: str = None) -> str:
+        """Make a file available via getFile + download. :return: file_id"""
+        if file_id is None:
+            file_id = f"file{next(self._file_ids)}"
+        self.files[file_id] = content
+        return file_id
+
+    def _get_error(self, method: str, params: dict) -> Optional[_InjectedError]:
+        if self._injected[method]:
+            return self._injected[method].popleft()
+        if method in SEND_METHODS:
+            self._sends += 1
+            if self.retry_after_every and self._sends % self.retry_after_every == 0:
+                return _InjectedError(429, f"Too Many Requests: retry after {self.retry_after}", self.retry_after)
+        if self.reject_parse_mode and params.get("parse_mode"):
+            return _InjectedError(400, "Bad Request: can't parse entities: simulated error")
+        return None
+
+    # endregion error injection
+
+    # region handlers
+    async def _handle_method(self, request: web.Request) -> web.Response:
+        method = request.match_info["method"]
+        params = {}
+        for key, value in (await request.post()).items():
+            if isinstance(value, web.FileField):
+                params[key] = {"filename": value.filename, "size": len(value.file.read())}
+            else:
+                params[key] = value
+
+        if self.latency:
+            await asyncio.sleep(self.latency)
+
+        error = self._get_error(method, params)
+        if error is not None:
+            self.calls.append(RecordedCall(method, params, error.error_code))
+            body = {"ok": False, "error_code": error.error_code, "description": error.description}
+            if error.retry_after is not None:
+                body["parameters"] = {"retry_after": error.retry_after}
+            return web.json_response(body, status=error.error_code)
+
+        self.calls.append(RecordedCall(method, params, 200))
+        return web.json_response({"ok": True, "result": self._result(method, params)})
+
+    async def _handle_file(self, request: web.Request) -> web.Response:
+        file_id = request.match_info["path"].rsplit("/", 1)[-1]
+        if file_id not in self.files:
+            raise web.HTTPNotFound()
+        return web.Response(body=self.files[file_id])
+
+    def _result(self, method: str, params: dict) -> Any:
+        if method == "getMe":
+            return BOT_USER
+        if method in MESSAGE_METHODS:
+            return self._message(method, params)
+        if method == "getFile":
+            file_id = params["file_id"]
+            content = self.files.get(file_id, b"")
+            return {
+                "file_id": file_id,
+                "file_unique_id": file_id,
+                "file_size": len(content),
+                "file_path": f"documents/{file_id}",
+            }
+        if method == "getUpdates":
+            # updates below the offset are confirmed
+            offset = int(params.get("offset") or 0)
+            self.updates = [update for update in self.updates if update["update_id"] >= offset]
+            return self.updates[: int(params.get("limit") or 100)]
+        # setMyCommands, sendChatAction, deleteMessage, ...
+        return True
+
+    def _message(self, method: str, params: dict) -> dict:
+        chat_id = int(params["chat_id"])
+        if method.startswith("edit"):
+            message_id = int(params["message_id"])
+        else:
+            message_id = next(self._message_ids[chat_id])
+        message = {
+            "message_id": message_id,
+            "date": int(time.time()),
+            "chat": {"id": chat_id, "type": "private" if chat_id > 0 else "supergroup"},
+            "from": BOT_USER,
+        }
+        if "text" in params:
+            message["text"] = params["text"]
+        if "caption" in params:
+            message["caption"] = params["caption"]
+        if "document" in params:
+            upload = params["document"] if isinstance(params["document"], dict) else {}
+            file_id = self.add_file(b"")
+            message["document"] = {
+                "file_id": file_id,
+                "file_unique_id": file_id,
+                "file_name": upload.get("filename"),
+                "file_size": upload.get("size"),
+            }
+        if "reply_parameters" in params:
+            reply = json.loads(params["reply_parameters"])
+            message["reply_to_message"] = {
+                "message_id": reply["message_id"],
+                "date": message["date"],
+                "chat": message["chat"],
+            }
+        return message
+
+    # endregion handlers
@@ -0,0 +1,185 @@
+"""
+Load generator - synthetic updates through the full BotManager.setup_dispatcher stack
+
+Updates are fed to the dispatcher directly (as polling / webhook would), the bot
+talks to a FakeBotAPI. Reported: throughput, p50/p99 latency of an update from
+arrival to the end of its processing (including the wait for its chat's turn),
+memory retained per chat and the Bot API calls made.
+
+Usage:
+    result = asyncio.run(run_load_test(BotManager(app=App()), extra_handlers=[EchoHandler()]))
+    print(result.summary())
+"""
+
+import asyncio
+import gc
+import time
+import tracemalloc
+from dataclasses import asdict, dataclass, field
+from typing import Dict, Iterator, List, Optional
+
+from aiogram import Dispatcher
+from aiogram.types import Message
+from calmapp import App
+
+from bot_lib.core.bot_manager import BotManager
+from bot_lib.handlers.handler import Handler, HandlerDisplayMode
+from bot_lib.testing.fake_bot_api import FakeBotAPI
+
+
+class EchoHandler(Handler):
+    """Replies to every private message with its text - through the send_safe pipeline"""
+
+    name = "echo"
+    display_mode = HandlerDisplayMode.HIDDEN
+    commands = {}
+
+    has_chat_handler = True
+
+    async def chat_handler(self, message: Message, app: App, **kwargs):
+        text = await self.get_message_text(message)
+        await self.send_safe(message.chat.id, text)
+
+
+def generate_updates(
+    num_chats: int, messages_per_chat: int, text: str = "hello", first_chat_id: int = 1_000
+) -> Iterator[dict]:
+    """Private text messages, interleaved between the chats - like real traffic"""
+    update_id = 0
+    now = int(time.time())
+    for message_id in range(1, messages_per_chat + 1):
+        for chat_id in range(first_chat_id, first_chat_id + num_chats):
+            update_id += 1
+            yield {
+                "update_id": update_id,
+                "message": {
+                    "message_id": message_id,
+                    "date": now,
+                    "chat": {"id": chat_id, "type": "private", "first_name": "User"},
+                    "from": {"id": chat_id, "is_bot": False, "first_name": "User"},
+                    "text": f"{text} {message_id}",
+                },
+            }
+
+
+def percentile(values: List[float], p: float) -> float:
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(int(len(values) * p), len(values) - 1)]
+
+
+@dataclass
+class LoadTestResult:
+    updates: int
+    chats: int
+    duration: float  # seconds
+    errors: int
+    latency_p50: float  # seconds
+    latency_p99: float
+    latency_max: float
+    memory_per_chat: Optional[float] = None  # bytes, if measured
+    api_calls: Dict[str, int] = field(default_factory=dict)
+
+    @property
+    def throughput(self) -> float:
+        """Updates per second"""
+        return self.updates / self.duration if self.duration else 0.0
+
+    def as_dict(self) -> dict:
+        return {**asdict(self), "throughput": self.throughput}
+
+    def summary(self) -> str:
+        lines = [
+            f"updates: {self.updates} in {self.chats} chats, errors: {self.errors}",
+            f"throughput: {self.throughput:.1f} updates/s ({self.duration:.2f}s)",
+            f"latency: p50 {self.latency_p50 * 1000:.1f}ms, p99 {self.latency_p99 * 1000:.1f}ms, "
+            f"max {self.latency_max * 1000:.1f}ms",
+        ]
+        if self.memory_per_chat is not None:
+            lines.append(f"memory per chat: {self.memory_per_chat / 1024:.1f} KB")
+        lines.append(f"api calls: {self.api_calls}")
+        return "\n".join(lines)
+
+
+async def _timed_feed(dp: Dispatcher, bot, update: dict, latencies: List[float]) -> None:
+    start = time.perf_counter()
+    try:
+        await dp.feed_raw_update(bot, update)
+    finally:
+        latencies.append(time.perf_counter() - start)
+
+
+async def run_load_test(
+    bot_manager: BotManager,
+    num_chats: int = 100,
+    messages_per_chat: int = 3,
+    extra_handlers: list = None,
+    api: FakeBotAPI = None,
+    rate: Optional[float] = None,
+    measure_memory: bool = False,
+) -> LoadTestResult:
+    """
+    :param bot_manager: set up on a fresh Dispatcher. E.g. BotManager(handlers=[]) with extra_handlers=[EchoHandler()]
+    :param api: fake Bot API to use, e.g. with latency or errors. Default - a new one without delays
+    :param rate: arrival rate, updates per second. None - all at once (burst)
+    :param measure_memory: trace allocations to report memory retained per chat.
+        Tracing slows everything down - don't compare throughput of runs with and without it
+    """
+    own_api = api is None
+    if own_api:
+        api = FakeBotAPI()
+        await api.start()
+    bot = api.create_bot()
+    dp = Dispatcher()
+    bot_manager.setup_dispatcher(dp, extra_handlers)
+    workflow_data = {"dispatcher": dp, "bots": [bot], "bot": bot}
+
+    latencies: List[float] = []
+    errors = 0
+    memory_per_chat = None
+    try:
+        await dp.emit_startup(**workflow_data)
+        # startup calls (getMe, setMyCommands) are not part of the load
+        api.reset()
+
+        if measure_memory:
+            gc.collect()
+            tracemalloc.start()
+            baseline = tracemalloc.get_traced_memory()[0]
+
+        tasks = []
+        start = time.perf_counter()
+        for i, update in enumerate(generate_updates(num_chats, messages_per_chat)):
+            if rate:
+                delay = start + i / rate - time.perf_counter()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+            tasks.append(asyncio.create_task(_timed_feed(dp, bot, update, latencies)))
+        results = await asyncio.gather(*tasks, return_exceptions=True)
+        duration = time.perf_counter() - start
+        errors = sum(isinstance(result, BaseException) for result in results)
+
+        if measure_memory:
+            del tasks, results
+            gc.collect()
+            retained = tracemalloc.get_traced_memory()[0] - baseline
+            tracemalloc.stop()
+            memory_per_chat = max(retained, 0) / num_chats
+    finally:
+        await dp.emit_shutdown(**workflow_data)
+        await bot.session.close()
+        if own_api:
+            await api.stop()
+
+    return LoadTestResult(
+        updates=len(latencies),
+        chats=num_chats,
+        duration=duration,
+        errors=errors,
+        latency_p50=percentile(latencies, 0.5),
+        latency_p99=percentile(latencies, 0.99),
+        latency_max=max(latencies, default=0.0),
+        memory_per_chat=memory_per_chat,
+        api_calls=api.calls_by_method(),
+    )
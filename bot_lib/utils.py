@@ -1,7 +1,10 @@
 import asyncio
 import logging
 import os
+import secrets
+import signal
 import sys
+from functools import partial
 from pathlib import Path
 
 from aiogram import Bot
@@ -9,6 +12,7 @@ from aiogram import Dispatcher
 from aiogram.client.default import DefaultBotProperties
 from aiogram.enums import ParseMode
 from dotenv import load_dotenv
+from loguru import logger
 
 
 def create_bot(token=None):
@@ -43,5 +47,105 @@ def run_bot(dp, bot):
     asyncio.run(dp.start_polling(bot))
 
 
+# region webhook
+
+
+async def _set_webhook(bot, url: str, secret_token: str, drop_pending_updates: bool):
+    try:
+        await bot.set_webhook(url, secret_token=secret_token, drop_pending_updates=drop_pending_updates)
+    finally:
+        # the session must not be shared with the forked workers - they open their own
+        await bot.session.close()
+
+
+def run_webhook(
+    dp,
+    bot,
+    webhook_url: str = None,
+    host: str = "0.0.0.0",
+    port: int = None,
+    path: str = "/webhook",
+    secret_token: str = None,
+    workers: int = 1,
+    drain_timeout: float = 30,
+    set_webhook: bool = True,
+    drop_pending_updates: bool = False,
+):
+    """
+    Run the bot with webhook delivery on an aiohttp server - alternative to run_bot (polling)
+
+    Each request is acknowledged right away, the update is processed in the background.
+    Requests without the secret token are rejected.
+    With workers > 1 the process is forked, and all workers listen on the same port (SO_REUSEPORT),
+    the kernel balances the connections. Each worker has its own memory: use a shared FSM storage
+    (e.g. Redis) and keep per-process caches in mind.
+
+    Usage:
+        dp, bot = setup_bot(app)
+        run_webhook(dp, bot, webhook_url="https://example.com/webhook", workers=4)
+
+    :param webhook_url: public url of the webhook. Defaults to TELEGRAM_WEBHOOK_URL env var
+    :param port: defaults to PORT env var or 8080
+    :param path: url path the server listens on
+    :param secret_token: checked in X-Telegram-Bot-Api-Secret-Token header.
+        Defaults to TELEGRAM_WEBHOOK_SECRET env var, or a random one (only with set_webhook)
+    :param workers: number of worker processes
+    :param drain_timeout: on shutdown - max time to wait for the updates in progress, seconds
+    :param set_webhook: register the webhook url with telegram on start
+    """
+    logging.basicConfig(level=logging.INFO, stream=sys.stdout)
+    load_dotenv()
+    if port is None:
+        port = int(os.getenv("PORT", 8080))
+    if secret_token is None:
+        secret_token = os.getenv("TELEGRAM_WEBHOOK_SECRET")
+    if set_webhook:
+        if webhook_url is None:
+            webhook_url = os.getenv("TELEGRAM_WEBHOOK_URL")
+        if webhook_url is None:
+            raise ValueError("Webhook url not provided - pass webhook_url or set TELEGRAM_WEBHOOK_URL")
+        if secret_token is None:
+            secret_token = secrets.token_urlsafe(32)
+        asyncio.run(_set_webhook(bot, webhook_url, secret_token, drop_pending_updates))
+        logger.info(f"Webhook set to {webhook_url}")
+
+    from bot_lib.core.webhook import serve_webhook
+
+    serve = partial(serve_webhook, dp, bot, host, port, path, secret_token, drain_timeout)
+    if workers <= 1:
+        serve(reuse_port=False)
+        return
+    if not hasattr(os, "fork"):
+        raise RuntimeError("Multiple webhook workers require os.fork and SO_REUSEPORT")
+
+    children = []
+    for _ in range(workers):
+        pid = os.fork()
+        if pid == 0:
+            # worker
+            try:
+                serve(reuse_port=True)
+            finally:
+                os._exit(0)
+        children.append(pid)
+    logger.info(f"Started {workers} webhook workers on port {port}: {children}")
+
+    def stop_workers(signum, frame):
+        # the workers ignore repeated signals - e.g. SIGINT from the terminal and this SIGTERM
+        for child in children:
+            try:
+                os.kill(child, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    signal.signal(signal.SIGINT, stop_workers)
+    signal.signal(signal.SIGTERM, stop_workers)
+    for child in children:
+        os.waitpid(child, 0)
+
+
+# endregion
+
+
 # bot_lib/tools
 tools_dir = Path(__file__) / "tools"
@@ -0,0 +1,53 @@
+"""
+Benchmark: update processing through BotManager.setup_dispatcher against a local fake Bot API
+
+Usage:
+    python dev/benchmarks/load_benchmark.py [--chats 1000] [--messages 3] [--latency 0.05] [--rate-limits] [--json out.json]
+"""
+
+import argparse
+import asyncio
+import json
+
+from calmapp import App
+
+from bot_lib import BotManager
+from bot_lib.handlers.handler import HandlerConfig
+from bot_lib.testing import EchoHandler, FakeBotAPI, run_load_test
+
+
+async def run(args):
+    config = HandlerConfig(rate_limit_enabled=args.rate_limits)
+    async with FakeBotAPI(latency=args.latency, retry_after_every=args.retry_after_every) as api:
+        return await run_load_test(
+            BotManager(app=App(), handlers=[]),
+            num_chats=args.chats,
+            messages_per_chat=args.messages,
+            extra_handlers=[EchoHandler(config=config)],
+            api=api,
+            rate=args.rate,
+            measure_memory=args.memory,
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--chats", type=int, default=1000)
+    parser.add_argument("--messages", type=int, default=3, help="messages per chat")
+    parser.add_argument("--rate", type=float, default=None, help="arrival rate, updates/s. Default - burst")
+    parser.add_argument("--latency", type=float, default=0.0, help="fake Bot API response delay, s")
+    parser.add_argument("--retry-after-every", type=int, default=0, help="every N-th send gets a 429")
+    parser.add_argument("--rate-limits", action="store_true", help="enable the outbound rate limiter")
+    parser.add_argument("--memory", action="store_true", help="measure memory per chat (slows the run down)")
+    parser.add_argument("--json", help="save the result to a file")
+    args = parser.parse_args()
+
+    result = asyncio.run(run(args))
+    print(result.summary())
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(result.as_dict(), f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,74 @@
+"""
+Benchmark: split_long_message vs the previous (copying) implementation
+
+Usage:
+    python dev/benchmarks/split_long_message.py [--sizes 1 2 5 10]
+"""
+
+import argparse
+import random
+import string
+import time
+
+from bot_lib.migration_bot_base.utils.text_utils import MAX_TELEGRAM_MESSAGE_LENGTH, split_long_message
+
+
+def split_long_message_legacy(text, max_length=MAX_TELEGRAM_MESSAGE_LENGTH, sep="\n"):
+    # previous implementation - copies the remaining text on every iteration
+    chunks = []
+    while len(text) > max_length:
+        chunk = text[:max_length]
+        if sep:
+            last_sep = chunk.rfind(sep)
+            if last_sep != -1:
+                chunk = chunk[: last_sep + 1]
+        text = text[len(chunk) :]
+        chunks.append(chunk)
+    if text:
+        chunks.append(text)
+    return chunks
+
+
+def generate_text(size_mb: float, seed=42) -> str:
+    """LLM-like output: paragraphs of words with occasional code blocks and formatting"""
+    rng = random.Random(seed)
+    words = ["".join(rng.choices(string.ascii_lowercase, k=rng.randint(2, 9))) for _ in range(1000)]
+    parts = []
+    size = 0
+    target = int(size_mb * 1024 * 1024)
+    while size < target:
+        if rng.random() < 0.1:
+            part = "```python\n" + "\n".join(f"x_{i} = {i}" for i in range(rng.randint(5, 50))) + "\n```\n"
+        else:
+            part = " ".join(rng.choices(words, k=rng.randint(20, 120))) + " *bold* _italic_\n\n"
+        parts.append(part)
+        size += len(part)
+    return "".join(parts)
+
+
+def timeit(func, *args, repeat=3, **kwargs) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func(*args, **kwargs)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sizes", type=float, nargs="+", default=[1, 2, 5, 10], help="text sizes, MB")
+    args = parser.parse_args()
+
+    print(f"{'size, MB':>8} | {'legacy, s':>10} | {'new, s':>10} | {'new md, s':>10} | {'speedup':>8}")
+    for size in args.sizes:
+        text = generate_text(size)
+        assert split_long_message_legacy(text) == split_long_message(text)
+        legacy = timeit(split_long_message_legacy, text)
+        new = timeit(split_long_message, text)
+        new_md = timeit(split_long_message, text, parse_mode="Markdown")
+        print(f"{size:>8} | {legacy:>10.4f} | {new:>10.4f} | {new_md:>10.4f} | {legacy / new:>7.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,148 @@
+import asyncio
+import os
+import threading
+import time
+
+import pytest
+
+from bot_lib.core.app_runner import AppFunctionRunner, cpu_bound
+
+
+@cpu_bound
+def get_pid():
+    return os.getpid()
+
+
+class TestAppFunctionRunner:
+    def test_sync_function_does_not_block_loop(self):
+        async def main():
+            runner = AppFunctionRunner()
+            ticks = []
+
+            async def ticker():
+                for _ in range(5):
+                    ticks.append(time.monotonic())
+                    await asyncio.sleep(0.02)
+
+            await asyncio.gather(runner.run(time.sleep, args=(0.2,)), ticker())
+            runner.shutdown()
+            return ticks
+
+        ticks = asyncio.run(main())
+        assert len(ticks) == 5
+        assert ticks[-1] - ticks[0] < 0.2
+
+    def test_async_function_awaited(self):
+        async def func(x):
+            return threading.current_thread() is threading.main_thread(), x
+
+        assert asyncio.run(AppFunctionRunner().run(func, args=(1,))) == (True, 1)
+
+    def test_command_concurrency(self):
+        running = []
+        peak = []
+
+        def func():
+            running.append(1)
+            peak.append(len(running))
+            time.sleep(0.05)
+            running.pop()
+
+        async def main():
+            runner = AppFunctionRunner(command_concurrency=2)
+            await asyncio.gather(*(runner.run(func, key="command") for _ in range(6)))
+            runner.shutdown()
+
+        asyncio.run(main())
+        assert max(peak) == 2
+
+    def test_timeout(self):
+        async def main():
+            runner = AppFunctionRunner(timeout=0.05)
+            with pytest.raises(asyncio.TimeoutError):
+                await runner.run(time.sleep, args=(0.5,))
+            runner.shutdown()
+
+        asyncio.run(main())
+
+    def test_no_default_timeout(self):
+        async def main():
+            runner = AppFunctionRunner()
+            # e.g. a long transcription - runs to completion
+            await runner.run(time.sleep, args=(0.1,))
+            runner.shutdown()
+            return runner.timeout
+
+        assert asyncio.run(main()) is None
+
+    def test_timed_out_call_keeps_its_slot(self):
+        events = []
+
+        def func(name, duration):
+            events.append(f"{name} start")
+            time.sleep(duration)
+            events.append(f"{name} end")
+
+        async def main():
+            runner = AppFunctionRunner(command_concurrency=1)
+            with pytest.raises(asyncio.TimeoutError):
+                await runner.run(func, args=("first", 0.3), key="command", timeout=0.05)
+            # the first call still runs in its thread - the second one waits for it
+            await runner.run(func, args=("second", 0), key="command")
+            runner.shutdown()
+
+        asyncio.run(main())
+        assert events == ["first start", "first end", "second start", "second end"]
+
+    def test_async_function_no_default_timeout(self):
+        async def main():
+            runner = AppFunctionRunner(timeout=0.01)
+            # e.g. a long LLM call - only limited with an explicit timeout
+            await runner.run(asyncio.sleep, args=(0.05,))
+            with pytest.raises(asyncio.TimeoutError):
+                await runner.run(asyncio.sleep, args=(1,), timeout=0.05)
+
+        asyncio.run(main())
+
+    def test_kwargs_dont_clash_with_runner_parameters(self):
+        def func(**kwargs):
+            return kwargs
+
+        result = asyncio.run(AppFunctionRunner().run(func, kwargs={"key": "x", "timeout": "5"}, key="command"))
+        assert result == {"key": "x", "timeout": "5"}
+
+    def test_cpu_bound_runs_in_process(self):
+        async def main():
+            runner = AppFunctionRunner(max_processes=1)
+            try:
+                return await runner.run(get_pid)
+            finally:
+                runner.shutdown(wait=True)
+
+        assert asyncio.run(main()) != os.getpid()
+
+
+class TestFuncHandler:
+    def test_user_kwargs_passed_to_app_function(self):
+        from types import SimpleNamespace
+
+        from bot_lib.handlers.handler import Handler, HandlerConfig
+
+        handler = Handler(config=HandlerConfig())
+        answers = []
+
+        async def get_message_text(message, **kwargs):
+            return message.text
+
+        async def answer_safe(message, text):
+            answers.append(text)
+
+        handler.get_message_text = get_message_text
+        handler.answer_safe = answer_safe
+
+        def app_function(key, timeout, **kwargs):
+            return f"{key} {timeout}"
+
+        message = SimpleNamespace(text="/command key=x timeout=5")
+        asyncio.run(handler.func_handler(app_function, message))
+        assert answers == ["x 5"]
@@ -0,0 +1,148 @@
+import asyncio
+import io
+import sys
+import types
+
+import pytest
+from aiogram.types import Message
+
+from bot_lib.handlers.handler import Handler, HandlerConfig
+from bot_lib.migration_bot_base.utils.audio_utils import find_split_points
+from bot_lib.testing import FakeBotAPI
+
+
+class TestFindSplitPoints:
+    def test_short_audio_not_split(self):
+        assert find_split_points([(10, 20)], duration=50, max_chunk_length=60) == []
+
+    def test_split_on_last_silence_in_second_half(self):
+        # silences centered at 20, 40, 55 - 40 and 55 are in the second half of the first chunk
+        points = find_split_points([(15, 25), (35, 45), (50, 60)], duration=100, max_chunk_length=60)
+        assert points[0] == 55
+
+    def test_silence_in_first_half_ignored(self):
+        points = find_split_points([(10, 20)], duration=100, max_chunk_length=60)
+        assert points == [60]
+
+    def test_no_silences_hard_cuts(self):
+        assert find_split_points([], duration=250, max_chunk_length=100) == [100, 200]
+
+    @pytest.mark.parametrize("duration", [61, 199, 1000, 12345])
+    def test_chunks_fit(self, duration):
+        silences = [(start, start + 3) for start in range(7, duration, 17)]
+        points = find_split_points(silences, duration=duration, max_chunk_length=60)
+        bounds = [0] + points + [duration]
+        assert all(0 < end - start <= 60 for start, end in zip(bounds, bounds[1:]))
+
+
+class FakeApp:
+    async def parse_audio(self, chunk, parallel=None):
+        await asyncio.sleep(0.01)
+        return chunk.getvalue().decode()
+
+
+def voice_message(bot) -> Message:
+    return Message.model_validate(
+        {
+            "message_id": 1,
+            "date": 0,
+            "chat": {"id": 1, "type": "private"},
+            "from": {"id": 1, "is_bot": False, "first_name": "User"},
+            "voice": {"file_id": "voice", "file_unique_id": "voice", "duration": 600},
+        },
+        context={"bot": bot},
+    )
+
+
+class TestPartialTranscripts:
+    def test_streamed_only_by_replying_handler(self):
+        async def main():
+            async with FakeBotAPI() as api:
+                handler = Handler(
+                    config=HandlerConfig(
+                        send_partial_transcripts=True,
+                        rate_limit_enabled=False,
+                        voice_chunk_max_length=60,
+                        file_cache_enabled=False,
+                    )
+                )
+                handler.bot = api.create_bot()
+                handler.app = FakeApp()
+
+                async def download_file(message, file_desc, file_path=None):
+                    return io.BytesIO(b"audio")
+
+                async def split_audio(file):
+                    return [io.BytesIO(f"part {i}".encode()) for i in range(3)]
+
+                handler.download_file = download_file
+                handler._split_audio = split_audio
+                message = voice_message(handler.bot)
+                try:
+                    # a filter - extracts the text, must not post anything
+                    filter_text = await handler._extract_message_text(message)
+                    calls_after_filter = api.count()
+                    text = await handler.get_message_text(message, send_partial_transcripts=True)
+                finally:
+                    await handler.bot.session.close()
+                return filter_text, calls_after_filter, text, api
+
+        filter_text, calls_after_filter, text, api = asyncio.run(main())
+        assert filter_text == text == "part 0\n\npart 1\n\npart 2"
+        assert calls_after_filter == 0
+        assert api.count("sendMessage") == 1
+        final_text = (api.get_calls("editMessageText") or api.get_calls("sendMessage"))[-1].params["text"]
+        assert final_text.split() == ["part", "0", "part", "1", "part", "2"]
+
+
+class TestTranscriptionConcurrency:
+    def test_bound_shared_by_messages(self):
+        active = []
+        peak = []
+
+        class CountingApp:
+            async def parse_audio(self, chunk, parallel=None):
+                active.append(1)
+                peak.append(len(active))
+                await asyncio.sleep(0.02)
+                active.pop()
+                return chunk.getvalue().decode()
+
+        async def main():
+            handler = Handler(config=HandlerConfig(voice_transcription_concurrency=2))
+            handler.app = CountingApp()
+            messages = [voice_message(None) for _ in range(3)]
+            chunks = [[io.BytesIO(f"part {i}".encode()) for i in range(3)] for _ in messages]
+            return await asyncio.gather(
+                *(handler._transcribe_audio_chunks(message, parts) for message, parts in zip(messages, chunks))
+            )
+
+        results = asyncio.run(main())
+        assert results == [["part 0", "part 1", "part 2"]] * 3
+        assert max(peak) == 2
+
+
+class TestSplitAudio:
+    def test_decode_error_falls_back_to_one_piece(self, monkeypatch):
+        from bot_lib.migration_bot_base.core import telegram_bot
+
+        def split_audio_on_silence(file, **kwargs):
+            file.read()
+            raise FileNotFoundError("ffmpeg")
+
+        # pydub is importable, but ffmpeg is missing
+        monkeypatch.setitem(sys.modules, "pydub", types.ModuleType("pydub"))
+        monkeypatch.setattr(telegram_bot, "split_audio_on_silence", split_audio_on_silence)
+
+        async def main():
+            handler = Handler(config=HandlerConfig(voice_chunk_max_length=60, file_cache_enabled=False))
+            handler.app = FakeApp()
+
+            async def download_file(message, file_desc, file_path=None):
+                return io.BytesIO(b"whole audio")
+
+            handler.download_file = download_file
+            return await handler._process_voice_message(voice_message(None))
+
+        # transcribed in one piece, from the start of the file
+        assert asyncio.run(main()) == "whole audio"
@@ -0,0 +1,24 @@
+import subprocess
+import sys
+
+
+def run_python(code: str) -> str:
+    return subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, check=True).stdout.strip()
+
+
+class TestBetaHandlers:
+    def test_discovery_does_not_import(self):
+        code = (
+            "import sys\n"
+            "from bot_lib.handlers import beta\n"
+            "print(beta.available_handlers(), 'bot_lib.handlers.beta.request_data_from_user' in sys.modules)"
+        )
+        assert run_python(code) == "['request_data_from_user'] False"
+
+    def test_load_handler(self):
+        from bot_lib.handlers.beta import load_handler
+        from bot_lib.handlers.handler import Handler
+
+        handler_class = load_handler("request_data_from_user")
+        assert issubclass(handler_class, Handler)
+        assert load_handler("request_data_from_user") is handler_class
@@ -0,0 +1,29 @@
+import time
+
+from bot_lib.core.cache import TTLCache
+
+
+class TestTTLCache:
+    def test_get_set(self):
+        cache = TTLCache()
+        cache["a"] = 1
+        assert cache["a"] == 1
+        assert "a" in cache
+        assert cache.get("b") is None
+
+    def test_ttl(self):
+        cache = TTLCache(ttl=0.05)
+        cache["a"] = 1
+        cache.set("b", 2, ttl=10)
+        time.sleep(0.1)
+        assert "a" not in cache
+        assert cache["b"] == 2
+
+    def test_maxsize_drops_least_recently_used(self):
+        cache = TTLCache(maxsize=2)
+        cache["a"] = 1
+        cache["b"] = 2
+        cache.get("a")
+        cache["c"] = 3
+        assert "b" not in cache
+        assert cache["a"] == 1 and cache["c"] == 3
@@ -0,0 +1,178 @@
+import asyncio
+
+import pytest
+from aiogram import Bot, Dispatcher
+from loguru import logger
+
+from bot_lib.core.chat_scheduler import ChatScheduler, release_chat_turn
+
+
+def run_all(scheduler, jobs):
+    """jobs: list of (key, coroutine function) started in order"""
+
+    async def main():
+        tasks = [asyncio.create_task(scheduler.run(key, func)) for key, func in jobs]
+        return await asyncio.gather(*tasks)
+
+    return asyncio.run(main())
+
+
+class TestChatScheduler:
+    def test_ordered_per_chat(self):
+        order = []
+
+        def job(key, i, delay):
+            async def func():
+                await asyncio.sleep(delay)
+                order.append((key, i))
+                return i
+
+            return key, func
+
+        # later updates are faster - they'd overtake the earlier ones without the scheduler
+        jobs = [job(chat, i, 0.03 - i * 0.01) for i in range(3) for chat in (1, 2)]
+        results = run_all(ChatScheduler(), jobs)
+        assert results == [0, 0, 1, 1, 2, 2]
+        assert [i for key, i in order if key == 1] == [0, 1, 2]
+        assert [i for key, i in order if key == 2] == [0, 1, 2]
+
+    def test_chats_run_in_parallel_up_to_max_workers(self):
+        running = []
+        peak = []
+
+        async def func():
+            running.append(1)
+            peak.append(len(running))
+            await asyncio.sleep(0.02)
+            running.pop()
+
+        run_all(ChatScheduler(max_workers=3), [(chat, func) for chat in range(10)])
+        assert max(peak) == 3
+
+    @pytest.mark.parametrize("policy, processed", [("drop_oldest", [0, 3, 4]), ("drop_newest", [0, 1, 2])])
+    def test_overflow(self, policy, processed):
+        done = []
+
+        def job(i):
+            async def func():
+                await asyncio.sleep(0.01)
+                done.append(i)
+
+            return 1, func
+
+        warnings = []
+        sink = logger.add(warnings.append, level="WARNING")
+        try:
+            scheduler = ChatScheduler(max_chat_queue=2, overflow_policy=policy)
+            run_all(scheduler, [job(i) for i in range(5)])
+        finally:
+            logger.remove(sink)
+        assert done == processed
+        assert scheduler.get_stats()["dropped"] == 2
+        assert sum("update dropped" in message for message in warnings) == 2
+
+    def test_unbounded_by_default(self):
+        done = []
+
+        async def func():
+            done.append(1)
+
+        scheduler = ChatScheduler()
+        run_all(scheduler, [(1, func)] * 200)
+        assert len(done) == 200 and scheduler.get_stats()["dropped"] == 0
+
+    def test_release_chat_turn(self):
+        async def main():
+            event = asyncio.Event()
+            scheduler = ChatScheduler(max_workers=1)
+
+            async def ask():
+                release_chat_turn()
+                await asyncio.wait_for(event.wait(), 1)
+                return "answered"
+
+            async def reply():
+                event.set()
+                return "reply"
+
+            return await asyncio.gather(scheduler.run(1, ask), scheduler.run(1, reply))
+
+        assert asyncio.run(main()) == ["answered", "reply"]
+
+    def test_stats(self):
+        async def func():
+            pass
+
+        scheduler = ChatScheduler()
+        run_all(scheduler, [(1, func), (1, func)])
+        stats = scheduler.get_stats()
+        assert stats["processed"] == 2
+        assert stats["active_chats"] == 0 and stats["queue_depth"] == 0
+
+    def test_dispatcher_middleware(self):
+        order = []
+
+        async def main():
+            dp = Dispatcher()
+            dp.update.outer_middleware.register(ChatScheduler())
+
+            @dp.message()
+            async def handler(message):
+                await asyncio.sleep(0.03 - int(message.text) * 0.01)
+                order.append(int(message.text))
+
+            bot = Bot("42:TEST")
+            updates = [
+                {
+                    "update_id": i,
+                    "message": {"message_id": i, "date": 0, "chat": {"id": 1, "type": "private"}, "text": str(i)},
+                }
+                for i in range(3)
+            ]
+            await asyncio.gather(*(dp.feed_raw_update(bot, update) for update in updates))
+            await bot.session.close()
+
+        asyncio.run(main())
+        assert order == [0, 1, 2]
+
+
+class CountingScheduler(ChatScheduler):
+    created = 0
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        CountingScheduler.created += 1
+
+
+class TestShardWorker:
+    def test_dispatcher_scheduler_not_doubled(self, monkeypatch):
+        import queue
+
+        from bot_lib.core import sharding
+
+        monkeypatch.setattr(sharding, "ChatScheduler", CountingScheduler)
+        CountingScheduler.created = 0
+        processed = []
+        dispatcher_scheduler = CountingScheduler()
+
+        def setup(shard):
+            dp = Dispatcher()
+            dp.update.outer_middleware.register(dispatcher_scheduler)
+
+            @dp.message()
+            async def handler(message):
+                processed.append(message.text)
+
+            return dp, Bot("42:TEST")
+
+        updates = queue.Queue()
+        for i in range(3):
+            updates.put(
+                {"update_id": i, "message": {"message_id": i, "date": 0, "chat": {"id": 1, "type": "private"}, "text": str(i)}}
+            )
+        updates.put(sharding._STOP)
+        asyncio.run(sharding._worker_loop(setup, 0, updates, max_concurrent_updates=10))
+        assert processed == ["0", "1", "2"]
+        # only the dispatcher's scheduler - the worker didn't add its own
+        assert CountingScheduler.created == 1
+        assert dispatcher_scheduler.get_stats()["processed"] == 3
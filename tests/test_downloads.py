@@ -0,0 +1,293 @@
+import asyncio
+import gc
+import os
+import time
+
+import pytest
+
+from bot_lib.core.downloads import DownloadedFile, DownloadError, FileCache, LargeFileDownloader
+
+
+def writer(content: bytes, calls: list = None, delay: float = 0):
+    async def download(path):
+        if calls is not None:
+            calls.append(path)
+        await asyncio.sleep(delay)
+        path.write_bytes(content)
+
+    return download
+
+
+@pytest.fixture
+def data_file(tmp_path):
+    path = tmp_path / "file.bin"
+    path.write_bytes(bytes(range(256)) * 40)  # 10240 bytes
+    return path
+
+
+class TestDownloadedFile:
+    def test_deleted_on_close(self, data_file):
+        with DownloadedFile(data_file) as file:
+            assert file.read(4) == bytes(range(4))
+        assert not data_file.exists()
+
+    def test_deleted_on_gc(self, data_file):
+        file = DownloadedFile(data_file)
+        file.read(1)
+        del file
+        gc.collect()
+        assert not data_file.exists()
+
+    def test_keep_file(self, data_file):
+        # as returned by FileCache.open - the cached file stays
+        file = DownloadedFile(data_file, delete=False)
+        file.close()
+        file.close()
+        assert data_file.exists()
+
+    def test_iter_chunks(self, data_file):
+        with DownloadedFile(data_file, delete=False, chunk_size=4096) as file:
+            assert file.read(240) == data_file.read_bytes()[:240]
+            # from the current position
+            chunks = list(file.iter_chunks())
+        assert [len(chunk) for chunk in chunks] == [4096, 4096, 1808]
+        assert b"".join(chunks) == data_file.read_bytes()[240:]
+
+    def test_aiter_chunks(self, data_file):
+        async def main():
+            with DownloadedFile(data_file, delete=False) as file:
+                chunks = [chunk async for chunk in file.aiter_chunks(1000)]
+                file.seek(0)
+                return chunks, [chunk async for chunk in file]
+
+        chunks, default_chunks = asyncio.run(main())
+        assert len(chunks) == 11 and b"".join(chunks) == data_file.read_bytes()
+        assert default_chunks == [data_file.read_bytes()]
+
+    def test_mmap(self, data_file):
+        with DownloadedFile(data_file) as file:
+            with file.mmap() as view:
+                assert len(view) == 10240
+                assert view[256:260] == bytes(range(4))
+                with pytest.raises(TypeError):
+                    view[0] = 1
+
+
+class TestFileCache:
+    def test_hit_after_download(self, tmp_path):
+        cache = FileCache(tmp_path)
+        calls = []
+
+        async def main():
+            with await cache.open("a", writer(b"data", calls)) as file:
+                assert file.read() == b"data"
+            with await cache.open("a", writer(b"other", calls)) as file:
+                return file.read()
+
+        assert asyncio.run(main()) == b"data"
+        assert len(calls) == 1
+        assert cache.stats.hits == 1 and cache.stats.misses == 1
+
+    def test_single_flight(self, tmp_path):
+        cache = FileCache(tmp_path)
+        calls = []
+
+        async def main():
+            files = await asyncio.gather(*(cache.open("a", writer(b"data", calls, delay=0.05)) for _ in range(5)))
+            contents = [file.read() for file in files]
+            for file in files:
+                file.close()
+            return contents
+
+        assert asyncio.run(main()) == [b"data"] * 5
+        assert len(calls) == 1
+        assert cache.stats.inflight_joins == 4
+
+    def test_cancelled_first_caller_doesnt_cancel_joiners(self, tmp_path):
+        cache = FileCache(tmp_path)
+        calls = []
+
+        async def main():
+            first = asyncio.create_task(cache.open("a", writer(b"data", calls, delay=0.05)))
+            await asyncio.sleep(0)
+            joiner = asyncio.create_task(cache.open("a", writer(b"other", calls)))
+            await asyncio.sleep(0.01)
+            first.cancel()
+            with pytest.raises(asyncio.CancelledError):
+                await first
+            with await joiner as file:
+                return file.read()
+
+        assert asyncio.run(main()) == b"data"
+        assert len(calls) == 1
+        assert (tmp_path / "a").exists() and cache.get_stats()["inflight"] == 0
+
+    def test_file_bigger_than_cache_is_returned(self, tmp_path):
+        cache = FileCache(tmp_path, max_size_bytes=10)
+
+        async def main():
+            with await cache.open("big", writer(b"x" * 100)) as file:
+                return file.read()
+
+        assert asyncio.run(main()) == b"x" * 100
+        # removed by the next eviction, when it's no longer in use
+        cache.evict()
+        assert not (tmp_path / "big").exists()
+
+    def test_get_or_download_keeps_new_file(self, tmp_path):
+        cache = FileCache(tmp_path, max_size_bytes=10)
+        path = asyncio.run(cache.get_or_download("big", writer(b"x" * 100)))
+        assert path.read_bytes() == b"x" * 100
+
+    def test_lru_eviction(self, tmp_path):
+        cache = FileCache(tmp_path, max_size_bytes=25)
+
+        async def main():
+            for key in ["a", "b"]:
+                (await cache.open(key, writer(b"x" * 10))).close()
+            # "a" was used last
+            os.utime(tmp_path / "b", (time.time() - 10, time.time() - 10))
+            (await cache.open("c", writer(b"x" * 10))).close()
+
+        asyncio.run(main())
+        assert sorted(path.name for path in tmp_path.iterdir()) == ["a", "c"]
+        assert cache.stats.evictions == 1
+
+    def test_pinned_file_not_evicted(self, tmp_path):
+        cache = FileCache(tmp_path, max_size_bytes=0)
+        path = tmp_path / "a"
+        path.write_bytes(b"data")
+        with cache._pinned(path):
+            cache.evict()
+            assert path.exists()
+        cache.evict()
+        assert not path.exists()
+
+    def test_open_file_readable_after_eviction(self, tmp_path):
+        cache = FileCache(tmp_path, max_size_bytes=0)
+
+        async def main():
+            file = await cache.open("a", writer(b"data"))
+            cache.evict()
+            with file:
+                return file.read()
+
+        assert asyncio.run(main()) == b"data"
+        assert not (tmp_path / "a").exists()
+
+    def test_failed_download_cleaned_up(self, tmp_path):
+        cache = FileCache(tmp_path)
+
+        async def download(path):
+            path.write_bytes(b"partial")
+            raise ConnectionError("network")
+
+        with pytest.raises(ConnectionError):
+            asyncio.run(cache.open("a", download))
+        assert list(tmp_path.iterdir()) == []
+        assert cache.get_stats()["inflight"] == 0
+
+
+class FakeMessage:
+    empty = False
+    media = "document"
+
+    def __init__(self, client):
+        self.client = client
+
+    async def download(self, file_name, progress=None):
+        self.client.downloads += 1
+        await progress(1, 2)
+        await asyncio.sleep(self.client.delay)
+        if self.client.fail:
+            return None
+        with open(file_name, "wb") as f:
+            f.write(b"data")
+        await progress(2, 2)
+        return file_name
+
+
+class FakeClient:
+    """pyrogram.Client stand-in"""
+
+    def __init__(self, delay: float = 0, fail: bool = False):
+        self.delay = delay
+        self.fail = fail
+        self.is_connected = False
+        self.starts = 0
+        self.downloads = 0
+
+    async def start(self):
+        self.starts += 1
+        self.is_connected = True
+
+    async def stop(self):
+        self.is_connected = False
+
+    async def get_messages(self, chat_id, message_ids):
+        return FakeMessage(self)
+
+
+class TestLargeFileDownloader:
+    def test_download(self, tmp_path):
+        client = FakeClient()
+        downloader = LargeFileDownloader(lambda: client)
+        progress = []
+
+        def on_progress(current, total):
+            progress.append((current, total))
+
+        async def main():
+            paths = [
+                await downloader.download("chat", 1, tmp_path / "a", progress_callback=on_progress),
+                await downloader.download("chat", 2, tmp_path / "b"),
+            ]
+            await downloader.stop()
+            return paths
+
+        paths = asyncio.run(main())
+        assert [open(path, "rb").read() for path in paths] == [b"data", b"data"]
+        assert progress == [(1, 2), (2, 2)]
+        # one client for all downloads
+        assert client.starts == 1
+        assert not client.is_connected
+        assert downloader.active_downloads == 0 and downloader.progress == {}
+
+    def test_failed_download_raises(self, tmp_path):
+        downloader = LargeFileDownloader(lambda: FakeClient(fail=True))
+        with pytest.raises(DownloadError):
+            asyncio.run(downloader.download("chat", 1, tmp_path / "a"))
+        assert downloader.active_downloads == 0
+
+    def test_cancel(self, tmp_path):
+        client = FakeClient(delay=10)
+        downloader = LargeFileDownloader(lambda: client)
+
+        async def main():
+            task = asyncio.create_task(downloader.download("chat", 1, tmp_path / "a", download_id="x"))
+            while not client.downloads:
+                await asyncio.sleep(0.01)
+            assert downloader.progress["x"].current == 1
+            assert downloader.cancel("x")
+            with pytest.raises(asyncio.CancelledError):
+                await task
+            assert not downloader.cancel("x")
+
+        asyncio.run(main())
+        assert downloader.active_downloads == 0
+
+    def test_concurrency_limit(self, tmp_path):
+        client = FakeClient(delay=0.05)
+        downloader = LargeFileDownloader(lambda: client, max_concurrent_downloads=2)
+        active = []
+
+        async def main():
+            tasks = [asyncio.create_task(downloader.download("chat", i, tmp_path / str(i))) for i in range(5)]
+            while not all(task.done() for task in tasks):
+                active.append(client.downloads - sum(task.done() for task in tasks))
+                await asyncio.sleep(0.01)
+            await asyncio.gather(*tasks)
+
+        asyncio.run(main())
+        assert client.downloads == 5
+        assert max(active) <= 2
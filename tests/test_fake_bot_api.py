@@ -0,0 +1,92 @@
+import asyncio
+import os
+
+import pytest
+from aiogram.exceptions import TelegramBadRequest, TelegramRetryAfter
+
+from bot_lib.testing import FakeBotAPI
+
+# wall-clock upper bounds are flaky on shared CI runners
+CHECK_TIMINGS = os.getenv("BOT_LIB_BENCHMARKS") == "1"
+
+
+def run_with_bot(scenario, **api_kwargs):
+    async def main():
+        async with FakeBotAPI(**api_kwargs) as api:
+            bot = api.create_bot()
+            try:
+                return api, await scenario(api, bot)
+            finally:
+                await bot.session.close()
+
+    return asyncio.run(main())
+
+
+class TestFakeBotAPI:
+    def test_records_calls(self):
+        async def scenario(api, bot):
+            message = await bot.send_message(1, "hello")
+            await bot.edit_message_text("edited", chat_id=1, message_id=message.message_id)
+            await bot.send_message(1, "second")
+            return message
+
+        api, message = run_with_bot(scenario)
+        assert message.text == "hello" and message.chat.id == 1
+        assert api.calls_by_method() == {"sendMessage": 2, "editMessageText": 1}
+        assert api.sent_texts(1) == ["hello", "second"]
+        assert api.get_calls("editMessageText")[0].params["text"] == "edited"
+
+    def test_retry_after_every(self):
+        async def scenario(api, bot):
+            await bot.send_message(1, "first")
+            with pytest.raises(TelegramRetryAfter) as error:
+                await bot.send_message(1, "second")
+            return error.value.retry_after
+
+        api, retry_after = run_with_bot(scenario, retry_after_every=2, retry_after=3)
+        assert retry_after == 3
+        assert [call.status for call in api.calls] == [200, 429]
+
+    def test_parse_errors(self):
+        async def scenario(api, bot):
+            with pytest.raises(TelegramBadRequest, match="can't parse entities"):
+                await bot.send_message(1, "*bold", parse_mode="Markdown")
+            return await bot.send_message(1, "*bold")
+
+        api, message = run_with_bot(scenario, reject_parse_mode=True)
+        assert message.text == "*bold"
+
+    def test_fail_next(self):
+        async def scenario(api, bot):
+            api.fail_next("sendMessage", 400, "Bad Request: chat not found")
+            with pytest.raises(TelegramBadRequest, match="chat not found"):
+                await bot.send_message(1, "hello")
+            await bot.send_message(1, "hello")
+
+        api, _ = run_with_bot(scenario)
+        assert [call.status for call in api.calls] == [400, 200]
+
+    def test_latency(self):
+        async def scenario(api, bot):
+            loop = asyncio.get_running_loop()
+            start = loop.time()
+            await asyncio.gather(*(bot.send_message(chat_id, "hello") for chat_id in range(1, 6)))
+            return loop.time() - start
+
+        _, elapsed = run_with_bot(scenario, latency=0.2)
+        # delayed, but concurrently - one by one it would take 1s
+        assert elapsed >= 0.2
+        if CHECK_TIMINGS:
+            assert elapsed < 0.9
+
+    def test_get_file_and_download(self):
+        async def scenario(api, bot):
+            file_id = api.add_file(b"file content")
+            file = await bot.get_file(file_id)
+            downloaded = await bot.download_file(file.file_path)
+            return file, downloaded.read()
+
+        api, (file, content) = run_with_bot(scenario)
+        assert file.file_size == len(b"file content")
+        assert content == b"file content"
+        assert api.calls_by_method() == {"getFile": 1}
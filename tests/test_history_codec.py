@@ -0,0 +1,116 @@
+import asyncio
+import datetime
+
+import pytest
+from aiogram.types import Update
+
+from bot_lib.core.history_codec import UpdateCodec
+from bot_lib.core.history_writer import MessageHistoryWriter
+
+
+def make_update(update_id=1, first_name="Alice"):
+    user = {"id": 42, "is_bot": False, "first_name": first_name}
+    return Update.model_validate(
+        {
+            "update_id": update_id,
+            "message": {
+                "message_id": update_id,
+                "date": datetime.datetime(2024, 1, 1),
+                "chat": {"id": 42, "type": "private", "first_name": first_name},
+                "from": user,
+                "text": "hello",
+                "reply_to_message": {
+                    "message_id": 0,
+                    "date": datetime.datetime(2024, 1, 1),
+                    "chat": {"id": 42, "type": "private"},
+                    "text": "previous",
+                },
+            },
+        }
+    )
+
+
+class TestUpdateCodec:
+    def test_round_trip(self):
+        codec = UpdateCodec()
+        encoded = codec.encode(make_update())
+        assert encoded.data["message"]["from_user"] == {"id": 42}
+        update = codec.decode(encoded.to_record())
+        assert update.message.text == "hello"
+        assert update.message.from_user.first_name == "Alice"
+        assert update.message.chat.first_name == "Alice"
+        assert update.message.reply_to_message.message_id == 0
+
+    def test_refs_emitted_only_when_new_or_changed(self):
+        codec = UpdateCodec()
+        assert len(codec.encode(make_update(1)).users) == 1
+        assert codec.encode(make_update(2)).users == []
+        changed = codec.encode(make_update(3, first_name="Bob"))
+        assert [user["first_name"] for user in changed.users] == ["Bob"]
+
+    def test_decode_with_ref_tables(self):
+        codec = UpdateCodec()
+        first = codec.encode(make_update(1))
+        second = codec.encode(make_update(2))
+        users = {user["id"]: user for user in first.users}
+        chats = {chat["id"]: chat for chat in first.chats}
+        update = codec.decode(second.to_record(embed_refs=False), users=users, chats=chats)
+        assert update.message.from_user.first_name == "Alice"
+
+    def test_not_projected_types_stored_in_full(self):
+        codec = UpdateCodec(fields={})
+        encoded = codec.encode(make_update())
+        assert encoded.data["message"]["from_user"]["first_name"] == "Alice"
+        assert encoded.users == []
+
+    def test_rollback_re_emits_refs(self):
+        codec = UpdateCodec()
+        first = codec.encode(make_update(1))
+        codec.rollback([first])
+        assert len(codec.encode(make_update(2)).users) == 1
+
+    def test_rollback_restores_previous_record(self):
+        codec = UpdateCodec()
+        codec.encode(make_update(1))
+        changed = codec.encode(make_update(2, first_name="Bob"))
+        codec.rollback([changed])
+        assert [user["first_name"] for user in codec.encode(make_update(3, first_name="Bob")).users] == ["Bob"]
+        assert codec.encode(make_update(4, first_name="Bob")).users == []
+
+    def test_decode_strict(self):
+        codec = UpdateCodec()
+        codec.encode(make_update(1))
+        second = codec.encode(make_update(2))
+        # on its own the record has only id stubs
+        assert codec.decode(second.to_record()).message.from_user.first_name == ""
+        with pytest.raises(KeyError):
+            codec.decode(second.to_record(), strict=True)
+
+    def test_writer_re_emits_refs_after_failed_write(self):
+        class Store:
+            def __init__(self):
+                self.fail = True
+                self.users = []
+
+            async def save_users(self, users):
+                if self.fail:
+                    raise ConnectionError("mongo is down")
+                self.users += users
+
+            async def save_chats(self, chats):
+                pass
+
+            async def save_updates(self, records):
+                pass
+
+        async def main():
+            store = Store()
+            writer = MessageHistoryWriter(store, codec=UpdateCodec())
+            await writer._write([make_update(1)])
+            store.fail = False
+            await writer._write([make_update(2)])
+            return store.users, writer.failed
+
+        users, failed = asyncio.run(main())
+        assert failed == 1
+        assert [user["id"] for user in users] == [42]
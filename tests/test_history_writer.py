@@ -0,0 +1,103 @@
+import asyncio
+import datetime
+import time
+
+from aiogram.types import Update
+
+from bot_lib.core.history_writer import MessageHistoryWriter
+
+
+def make_update(update_id: int) -> Update:
+    return Update.model_validate(
+        {
+            "update_id": update_id,
+            "message": {
+                "message_id": update_id,
+                "date": datetime.datetime(2024, 1, 1),
+                "chat": {"id": 42, "type": "private"},
+                "text": "hello",
+            },
+        }
+    )
+
+
+class Store:
+    def __init__(self, delay: float = 0):
+        self.delay = delay
+        self.batches = []
+
+    async def save_updates(self, records):
+        await asyncio.sleep(self.delay)
+        self.batches.append([record["update_id"] for record in records])
+
+
+class TestMessageHistoryWriter:
+    def test_batches_by_size(self):
+        store = Store()
+
+        async def main():
+            writer = MessageHistoryWriter(store, batch_size=3, flush_interval=60)
+            for update_id in range(7):
+                await writer.put(make_update(update_id))
+            await writer.stop()
+            return writer
+
+        writer = asyncio.run(main())
+        assert store.batches == [[0, 1, 2], [3, 4, 5], [6]]
+        assert writer.written == 7 and writer.failed == 0
+
+    def test_flush_by_time(self):
+        store = Store()
+
+        async def main():
+            writer = MessageHistoryWriter(store, batch_size=100, flush_interval=0.05)
+            await writer.put(make_update(1))
+            await asyncio.sleep(0.3)
+            written = list(store.batches)
+            await writer.stop()
+            return written
+
+        assert asyncio.run(main()) == [[1]]
+
+    def test_flush_on_stop(self):
+        store = Store(delay=0.05)
+
+        async def main():
+            writer = MessageHistoryWriter(store, batch_size=2, flush_interval=60)
+            for update_id in range(5):
+                await writer.put(make_update(update_id))
+            await writer.stop()
+            return writer.queue_size
+
+        assert asyncio.run(main()) == 0
+        assert sum(store.batches, []) == list(range(5))
+
+    def test_save_update_fallback(self):
+        saved = []
+
+        class SingleStore:
+            async def save_update(self, record):
+                saved.append(record["update_id"])
+
+        async def main():
+            writer = MessageHistoryWriter(SingleStore(), flush_interval=0.01)
+            for update_id in range(3):
+                await writer.put(make_update(update_id))
+            await writer.stop()
+
+        asyncio.run(main())
+        assert saved == [0, 1, 2]
+
+    def test_stop_with_stuck_store(self):
+        store = Store(delay=3600)
+
+        async def main():
+            writer = MessageHistoryWriter(store, flush_interval=0.01, stop_timeout=0.1)
+            await writer.put(make_update(1))
+            start = time.monotonic()
+            await writer.stop()
+            return time.monotonic() - start, writer
+
+        elapsed, writer = asyncio.run(main())
+        assert elapsed < 5
+        assert store.batches == [] and writer.written == 0
@@ -0,0 +1,76 @@
+"""
+Startup budget for `import bot_lib` - cold start of serverless / webhook workers
+Measured in a fresh interpreter with `python -X importtime`
+
+A webhook worker imports BotManager and Handler, which need aiogram and calmapp.
+Importing them takes most of the cold start and depends on the machine,
+so the worker budget covers only what bot_lib adds on top of them.
+"""
+
+import os
+import subprocess
+import sys
+
+IMPORT_BUDGET_MS = float(os.getenv("BOT_LIB_IMPORT_BUDGET_MS", 100))
+# must not be imported until used
+WORKER_IMPORT_BUDGET_MS = float(os.getenv("BOT_LIB_WORKER_IMPORT_BUDGET_MS", 500))
+# required by BotManager / Handler - imported before the measurement
+WORKER_DEPENDENCIES = ["aiogram", "aiogram.types", "aiogram.client.bot", "calmapp"]
+# optional - must not be imported by a worker until used
+WORKER_LAZY_MODULES = ["mongoengine", "pyrogram", "pydub", "bot_lib.migration_bot_base.data_model.mongo_utils"]
+HEAVY_MODULES = ["aiogram", "calmapp", "pydantic_settings", "mongoengine", "pyrogram", "bot_lib.migration_bot_base"]
+
+
+def run_python(code: str, *args) -> subprocess.CompletedProcess:
+    return subprocess.run(
+        [sys.executable, *args, "-c", code], capture_output=True, text=True, check=True, env=os.environ.copy()
+    )
+
+
+def import_time_ms(module: str) -> float:
+    """Cumulative import time of the module, ms"""
+    stderr = run_python(f"import {module}", "-X", "importtime").stderr
+    for line in stderr.splitlines():
+        # import time: self [us] | cumulative | imported package
+        parts = [part.strip() for part in line.split("|")]
+        if len(parts) == 3 and parts[2] == module:
+            return int(parts[1]) / 1000
+    raise AssertionError(f"{module} not found in importtime output:\n{stderr}")
+
+
+def worker_import_ms() -> tuple:
+    """:return: time of `from bot_lib import BotManager, Handler` after its dependencies, ms; loaded lazy modules"""
+    code = (
+        f"import sys, time\n"
+        f"import {', '.join(WORKER_DEPENDENCIES)}\n"
+        f"start = time.perf_counter()\n"
+        f"from bot_lib import BotManager, Handler\n"
+        f"print((time.perf_counter() - start) * 1000)\n"
+        f"print([m for m in {WORKER_LAZY_MODULES!r} if m in sys.modules])"
+    )
+    elapsed, loaded = run_python(code).stdout.splitlines()
+    return float(elapsed), loaded
+
+
+class TestImportTime:
+    def test_heavy_modules_not_imported(self):
+        code = f"import sys, bot_lib; print([m for m in {HEAVY_MODULES!r} if m in sys.modules])"
+        assert run_python(code).stdout.strip() == "[]"
+
+    def test_import_budget(self):
+        # best of 3 - the first run may include cold disk cache
+        elapsed = min(import_time_ms("bot_lib") for _ in range(3))
+        assert elapsed < IMPORT_BUDGET_MS, f"import bot_lib took {elapsed:.1f}ms, budget {IMPORT_BUDGET_MS}ms"
+
+    def test_worker_import_budget(self):
+        elapsed, loaded = min(worker_import_ms() for _ in range(3))
+        assert loaded == "[]"
+        assert elapsed < WORKER_IMPORT_BUDGET_MS, (
+            f"from bot_lib import BotManager, Handler took {elapsed:.1f}ms on top of aiogram and calmapp, "
+            f"budget {WORKER_IMPORT_BUDGET_MS}ms"
+        )
+
+    def test_lazy_names(self):
+        code = "import bot_lib; print(bot_lib.BotManager.__name__, bot_lib.Handler.__name__, bot_lib.__version__)"
+        names = run_python(code).stdout.split()
+        assert names[:2] == ["BotManager", "Handler"]
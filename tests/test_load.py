@@ -0,0 +1,105 @@
+"""
+Load benchmarks - synthetic updates through BotManager.setup_dispatcher against a fake Bot API
+Wall-clock thresholds are checked only with BOT_LIB_BENCHMARKS=1 - set by the non-blocking "benchmarks" CI job,
+the main test job skips them: shared runners are too noisy to fail the build on.
+They are loose defaults - tighten them with env variables.
+Set BOT_LIB_BENCHMARK_JSON to a file path to save the results, e.g. to compare runs.
+"""
+
+import asyncio
+import json
+import os
+
+import pytest
+from calmapp import App
+
+from bot_lib import BotManager
+from bot_lib.handlers.handler import HandlerConfig
+from bot_lib.testing import EchoHandler, FakeBotAPI, run_load_test
+
+CHECK_TIMINGS = os.getenv("BOT_LIB_BENCHMARKS") == "1"
+MIN_THROUGHPUT = float(os.getenv("BOT_LIB_LOAD_MIN_THROUGHPUT", 50))  # updates per second
+MAX_P99_LATENCY_MS = float(os.getenv("BOT_LIB_LOAD_MAX_P99_MS", 5000))
+MAX_MEMORY_PER_CHAT_KB = float(os.getenv("BOT_LIB_LOAD_MAX_MEMORY_PER_CHAT_KB", 200))
+BENCHMARK_JSON = os.getenv("BOT_LIB_BENCHMARK_JSON")
+
+_results = {}
+
+
+@pytest.fixture(scope="module", autouse=True)
+def save_results():
+    yield
+    if BENCHMARK_JSON and _results:
+        with open(BENCHMARK_JSON, "w") as f:
+            json.dump(_results, f, indent=2)
+
+
+def load_test(name, config: HandlerConfig = None, api: FakeBotAPI = None, **kwargs):
+    # outbound rate limits are real-Telegram pacing, not bot_lib overhead - off unless the config enables them
+    config = config or HandlerConfig(rate_limit_enabled=False)
+
+    async def main():
+        if api is None:
+            return await run_load_test(
+                BotManager(app=App(), handlers=[]), extra_handlers=[EchoHandler(config=config)], **kwargs
+            )
+        async with api:
+            return await run_load_test(
+                BotManager(app=App(), handlers=[]), extra_handlers=[EchoHandler(config=config)], api=api, **kwargs
+            )
+
+    result = asyncio.run(main())
+    _results[name] = result.as_dict()
+    print(f"\n{name}:\n{result.summary()}")
+    return result
+
+
+class TestLoad:
+    def test_throughput_and_latency(self):
+        result = load_test("burst", num_chats=100, messages_per_chat=3)
+        assert result.errors == 0
+        assert result.updates == 300
+        assert result.api_calls == {"sendMessage": 300}
+        if CHECK_TIMINGS:
+            assert result.throughput > MIN_THROUGHPUT, f"{result.throughput:.1f} updates/s"
+            assert result.latency_p99 * 1000 < MAX_P99_LATENCY_MS, f"p99 {result.latency_p99 * 1000:.1f}ms"
+
+    def test_memory_per_chat(self):
+        result = load_test("memory", num_chats=100, messages_per_chat=2, measure_memory=True)
+        assert result.errors == 0
+        assert result.memory_per_chat / 1024 < MAX_MEMORY_PER_CHAT_KB, f"{result.memory_per_chat / 1024:.1f} KB"
+
+    def test_slow_api_doesnt_serialize_chats(self):
+        # each reply takes 0.1s - chats must be served concurrently
+        result = load_test("slow_api", api=FakeBotAPI(latency=0.1), num_chats=50, messages_per_chat=1)
+        assert result.errors == 0
+        assert result.api_calls == {"sendMessage": 50}
+        if CHECK_TIMINGS:
+            assert result.duration < 50 * 0.1 / 2
+
+    def test_replies_in_order_under_parse_errors(self):
+        # every Markdown send fails - the parse mode fallback resends as plain text, keeping the order
+        api = FakeBotAPI(reject_parse_mode=True)
+        result = load_test(
+            "parse_errors",
+            config=HandlerConfig(rate_limit_enabled=False, parse_mode="Markdown"),
+            api=api,
+            num_chats=20,
+            messages_per_chat=3,
+        )
+        assert result.errors == 0
+        assert api.sent_texts(1_000) == ["hello 1", "hello 2", "hello 3"]
+
+    def test_retry_after_with_rate_limiter(self):
+        # every 10th send is rejected with a 429 - the scheduler waits and retries
+        api = FakeBotAPI(retry_after_every=10, retry_after=1)
+        result = load_test(
+            "retry_after",
+            config=HandlerConfig(rate_limit_global=1000, rate_limit_private_chat=100),
+            api=api,
+            num_chats=10,
+            messages_per_chat=2,
+        )
+        assert result.errors == 0
+        assert len(api.sent_texts()) == 20
+        assert result.api_calls["sendMessage"] == 22
@@ -0,0 +1,55 @@
+import time
+
+import loguru
+import pytest
+
+from bot_lib.migration_bot_base.utils.log_sampling import (
+    SampledLogger,
+    _CallSiteLimiter,
+    configure_log_sampling,
+)
+
+
+@pytest.fixture
+def records():
+    records = []
+    logger = loguru.logger
+    logger.remove()
+    logger.add(lambda message: records.append(message.record), level="INFO")
+    yield records
+    logger.remove()
+    configure_log_sampling()
+
+
+class TestSampledLogger:
+    def test_disabled_level_is_skipped(self, records):
+        logger = SampledLogger()
+        logger.debug("not formatted {}", object())
+        logger.info("hello {}", "world")
+        assert [record["message"] for record in records] == ["hello world"]
+
+    def test_call_site_is_reported(self, records):
+        SampledLogger().info("hello")
+        assert records[0]["function"] == "test_call_site_is_reported"
+
+    def test_sampling(self, records):
+        configure_log_sampling(sample_rates={"INFO": 0})
+        logger = SampledLogger()
+        logger.info("sampled out")
+        logger.warning("kept")
+        assert [record["message"] for record in records] == ["kept"]
+
+    def test_throttled_per_call_site(self, records):
+        logger = SampledLogger().throttled(limit=2, period=60)
+        for i in range(5):
+            logger.warning("first {}", i)
+        logger.warning("second")
+        assert [record["message"] for record in records] == ["first 0", "first 1", "second"]
+
+    def test_suppressed_count_reported(self):
+        limiter = _CallSiteLimiter()
+        assert limiter.allow("site", limit=1, period=0.05) == 0
+        assert limiter.allow("site", limit=1, period=0.05) is None
+        assert limiter.allow("site", limit=1, period=0.05) is None
+        time.sleep(0.1)
+        assert limiter.allow("site", limit=1, period=0.05) == 2
@@ -0,0 +1,82 @@
+from datetime import datetime
+from unittest import mock
+
+import loguru
+import pytest
+
+mongoengine = pytest.importorskip("mongoengine")
+
+from bson import ObjectId  # noqa: E402
+
+from bot_lib.migration_bot_base.utils import logging_utils  # noqa: E402
+from bot_lib.migration_bot_base.utils.logging_utils import LogItem, MongoLogSink  # noqa: E402
+
+
+@pytest.fixture
+def saved():
+    documents = []
+    collection = mock.Mock()
+    collection.insert_many.side_effect = lambda batch, ordered: documents.extend(batch)
+    with mock.patch.object(LogItem, "_get_collection", return_value=collection):
+        yield documents
+
+
+@pytest.fixture
+def logger():
+    logger = loguru.logger
+    logger.remove()
+    yield logger
+    logger.remove()
+
+
+class TestMongoLogSink:
+    def test_all_records_saved_on_stop(self, saved, logger):
+        logger.add(MongoLogSink(batch_size=10, flush_interval=10), level="INFO")
+        for i in range(25):
+            logger.info("message {}", i)
+        logger.remove()
+        assert [document["message"] for document in saved] == [f"message {i}" for i in range(25)]
+
+    def test_restart_after_stop(self, saved, logger):
+        sink = MongoLogSink(flush_interval=10)
+        for run in range(2):
+            logger.add(sink, level="INFO")
+            logger.info("run {}", run)
+            # stop() is called on remove
+            logger.remove()
+        assert [document["message"] for document in saved] == ["run 0", "run 1"]
+        assert sink.buffer_size == 0
+
+    def test_exception_saved(self, saved, logger):
+        logger.add(MongoLogSink(), level="INFO")
+        try:
+            1 / 0
+        except ZeroDivisionError:
+            logger.exception("failed")
+        logger.remove()
+        assert "ZeroDivisionError" in saved[0]["traceback"]
+
+    def test_drop_newest_on_overflow(self, saved, logger):
+        sink = MongoLogSink(max_buffer_size=5, flush_interval=10, overflow_policy="drop_newest")
+        with mock.patch.object(sink, "_run"):
+            logger.add(sink, level="INFO")
+            for i in range(10):
+                logger.info("message {}", i)
+        assert sink.dropped == 5
+        assert [item["message"] for item in sink._buffer] == [f"message {i}" for i in range(5)]
+
+
+class TestLoadLogs:
+    def test_iter_logs_follows_cursor(self):
+        items = [{"_id": ObjectId(), "timestamp": datetime(2024, 1, 1, 0, i), "message": str(i)} for i in range(5)]
+        cursors = []
+
+        def load_logs(limit, cursor, **filters):
+            cursors.append(cursor)
+            start = 0 if cursor is None else next(i for i, item in enumerate(items) if item["_id"] == cursor.id) + 1
+            return items[start : start + limit]
+
+        with mock.patch.object(logging_utils, "load_logs", side_effect=load_logs):
+            assert [item["message"] for item in logging_utils.iter_logs(batch_size=2)] == ["0", "1", "2", "3", "4"]
+        assert cursors[0] is None
+        assert [cursor.id for cursor in cursors[1:]] == [items[1]["_id"], items[3]["_id"]]
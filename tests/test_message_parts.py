@@ -0,0 +1,150 @@
+import asyncio
+
+import pytest
+from aiogram.types import Message
+
+from bot_lib.handlers.handler import Handler, HandlerConfig
+
+
+def audio_message(message_id=1, caption=None, reply_text=None) -> Message:
+    data = {
+        "message_id": message_id,
+        "date": 0,
+        "chat": {"id": 1, "type": "private"},
+        "voice": {"file_id": f"voice{message_id}", "file_unique_id": f"voice{message_id}", "duration": 5},
+    }
+    if caption is not None:
+        data["caption"] = caption
+    if reply_text is not None:
+        data["reply_to_message"] = {"message_id": 0, "date": 0, "chat": data["chat"], "text": reply_text}
+    return Message.model_validate(data)
+
+
+class FakeExtractor:
+    """Stands in for the audio transcription - records the calls and the peak concurrency"""
+
+    def __init__(self, delay: float = 0.02, fail_times: int = 0):
+        self.delay = delay
+        self.fail_times = fail_times
+        self.calls = 0
+        self.active = 0
+        self.peak = 0
+
+    async def __call__(self, message: Message) -> str:
+        self.calls += 1
+        self.active += 1
+        self.peak = max(self.peak, self.active)
+        try:
+            await asyncio.sleep(self.delay)
+            if self.calls <= self.fail_times:
+                raise ConnectionError("transcription failed")
+            return f"transcript {message.message_id}"
+        finally:
+            self.active -= 1
+
+
+def make_handler(extractor: FakeExtractor, **config) -> Handler:
+    handler = Handler(config=HandlerConfig(**config))
+    handler._extract_audio_text = extractor
+    return handler
+
+
+class TestMessagePartsCache:
+    def test_filter_and_handler_share_extraction(self):
+        extractor = FakeExtractor()
+        message = audio_message()
+
+        async def main():
+            handler = make_handler(extractor)
+            # a filter checks the text first, then the handler gets it
+            filter_text = await handler._extract_message_text(message)
+            handler_text = await handler.get_message_text(message)
+            return filter_text, handler_text
+
+        assert asyncio.run(main()) == ("transcript 1", "transcript 1")
+        assert extractor.calls == 1
+
+    def test_concurrent_callers_share_extraction(self):
+        extractor = FakeExtractor(delay=0.05)
+        message = audio_message()
+
+        async def main():
+            handler = make_handler(extractor)
+            return await asyncio.gather(*(handler._extract_message_text(message) for _ in range(5)))
+
+        assert asyncio.run(main()) == ["transcript 1"] * 5
+        assert extractor.calls == 1
+
+    def test_failure_retried(self):
+        extractor = FakeExtractor(fail_times=1)
+        message = audio_message()
+
+        async def main():
+            handler = make_handler(extractor)
+            with pytest.raises(ConnectionError):
+                await handler._extract_message_text(message)
+            return await handler._extract_message_text(message)
+
+        assert asyncio.run(main()) == "transcript 1"
+        assert extractor.calls == 2
+
+    def test_late_waiter_keeps_retry(self):
+        extractor = FakeExtractor(fail_times=1)
+        message = audio_message()
+
+        async def main():
+            handler = make_handler(extractor)
+
+            def get_part():
+                return handler._get_message_part(message, "audio", extractor)
+
+            async def retrying_caller():
+                try:
+                    return await get_part()
+                except ConnectionError:
+                    # retried right away - before the other waiter of the failed extraction wakes up
+                    return await get_part()
+
+            async def waiter():
+                try:
+                    return await get_part()
+                except ConnectionError:
+                    return None
+
+            results = await asyncio.gather(retrying_caller(), waiter())
+            # the retry result is still cached - no third extraction
+            return results, await get_part()
+
+        (retried, failed), cached = asyncio.run(main())
+        assert retried == cached == "transcript 1"
+        assert failed is None
+        assert extractor.calls == 2
+
+
+class TestExtractMessageText:
+    def test_extraction_concurrency_bounded(self):
+        extractor = FakeExtractor(delay=0.02)
+
+        async def main():
+            handler = make_handler(extractor, message_extraction_concurrency=2)
+            messages = [audio_message(message_id) for message_id in range(1, 9)]
+            return await asyncio.gather(*(handler._extract_message_text(message) for message in messages))
+
+        results = asyncio.run(main())
+        assert results == [f"transcript {message_id}" for message_id in range(1, 9)]
+        assert extractor.calls == 8
+        assert extractor.peak == 2
+
+    def test_parts_order_stable(self):
+        # the reply is ready long before the transcription - the keys keep the fixed order
+        extractor = FakeExtractor(delay=0.05)
+        message = audio_message(caption="caption", reply_text="previous")
+
+        async def main():
+            handler = make_handler(extractor)
+            return await handler._extract_message_text(message, include_reply=True, as_dict=True)
+
+        result = asyncio.run(main())
+        assert list(result) == ["caption", "audio", "reply_to"]
+        assert result["audio"] == "transcript 1"
+        assert result["reply_to"].strip() == "previous"
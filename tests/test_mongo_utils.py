@@ -0,0 +1,143 @@
+import asyncio
+import threading
+from unittest import mock
+
+import pytest
+
+mongoengine = pytest.importorskip("mongoengine")
+
+from bson import ObjectId  # noqa: E402
+
+from bot_lib.migration_bot_base.data_model import mongo_utils  # noqa: E402
+
+
+class Item(mongoengine.Document):
+    name = mongoengine.StringField()
+
+
+class FakeQuerySet(list):
+    def first(self):
+        return self[0] if self else None
+
+    def modify(self, new=False, **kwargs):
+        item = self.first()
+        if item is not None:
+            for name, value in kwargs.items():
+                setattr(item, name, value)
+        return item
+
+
+@pytest.fixture
+def items():
+    items = [Item(id=ObjectId(), name="a"), Item(id=ObjectId(), name="b")]
+    queries = []
+    deleted = []
+
+    def objects(*args, **kwargs):
+        queries.append(args[0].to_query(Item) if args else kwargs)
+        if args:
+            return FakeQuerySet(items)
+        return FakeQuerySet(item for item in items if all(getattr(item, k) == v for k, v in kwargs.items()))
+
+    def delete(item):
+        deleted.append(item)
+        items.remove(item)
+
+    mongo_utils.invalidate_item_cache()
+    with mock.patch.object(Item, "_get_collection"), mock.patch.object(Item, "objects", side_effect=objects):
+        with mock.patch.object(Item, "delete", autospec=True, side_effect=delete):
+            yield items, queries, deleted
+    mongo_utils.configure_item_cache()
+
+
+class TestLookup:
+    def test_parse_key(self):
+        oid = ObjectId()
+        assert mongo_utils._parse_key(str(oid)) == ("id", oid)
+        assert mongo_utils._parse_key(oid) == ("id", oid)
+        assert mongo_utils._parse_key("item1") == ("name", "item1")
+
+    def test_get_items_single_query(self, items):
+        items, queries, _ = items
+        result = mongo_utils.get_items(Item, ["a", str(items[1].id), "missing"])
+        assert result == [items[0], items[1], None]
+        assert len(queries) == 1
+
+    def test_cache_disabled_by_default(self, items):
+        items, queries, _ = items
+        mongo_utils.get_item(Item, "a")
+        mongo_utils.get_item(Item, "a")
+        assert len(queries) == 2
+
+    def test_get_item_cached(self, items):
+        items, queries, _ = items
+        mongo_utils.configure_item_cache(ttl=10)
+        assert mongo_utils.get_item(Item, "a") is items[0]
+        assert mongo_utils.get_item(Item, str(items[0].id)) is items[0]
+        assert len(queries) == 1
+        mongo_utils.invalidate_item_cache(Item)
+        mongo_utils.get_item(Item, "a")
+        assert len(queries) == 2
+
+
+class TestWrites:
+    def test_delete_item_applies_document_delete(self, items):
+        items, _, deleted = items
+        item = items[0]
+        assert mongo_utils.delete_item(Item, "a") is True
+        # Document.delete - with delete rules and signals
+        assert deleted == [item]
+        assert mongo_utils.delete_item(Item, "a") is False
+        assert deleted == [item]
+
+    def test_delete_item_drops_cached_item(self, items):
+        items, queries, _ = items
+        mongo_utils.configure_item_cache(ttl=10)
+        item_id = str(items[0].id)
+        assert mongo_utils.get_item(Item, item_id) is items[0]
+        mongo_utils.delete_item(Item, item_id)
+        assert mongo_utils.get_item(Item, item_id) is None
+
+    def test_update_item(self, items):
+        items, _, _ = items
+        updated = mongo_utils.update_item(Item, str(items[1].id), name="c")
+        assert updated is items[1] and updated.name == "c"
+
+    def test_update_by_name_uses_index(self, items):
+        items, _, _ = items
+        mongo_utils._indexed_classes.discard(Item)
+        mongo_utils.update_item(Item, "a", name="c")
+        Item._get_collection().create_index.assert_called_once()
+        assert Item in mongo_utils._indexed_classes
+
+
+class TestAsync:
+    def test_async_variants_match_sync(self, items):
+        items, _, deleted = items
+
+        async def main():
+            return (
+                await mongo_utils.aget_item(Item, "a"),
+                await mongo_utils.aget_items(Item, ["b", "missing"]),
+                await mongo_utils.aupdate_item(Item, "b", name="c"),
+                await mongo_utils.adelete_item(Item, "a"),
+                await mongo_utils.adelete_item(Item, "missing"),
+            )
+
+        item_a, item_b = items
+        assert asyncio.run(main()) == (item_a, [item_b, None], item_b, True, False)
+        assert deleted == [item_a]
+
+    def test_runs_in_executor(self, items):
+        threads = []
+
+        def current_thread(*args):
+            threads.append(threading.current_thread().name)
+
+        async def main():
+            with mock.patch.object(mongo_utils, "get_item", side_effect=current_thread):
+                await mongo_utils.aget_item(Item, "a")
+
+        asyncio.run(main())
+        assert threads[0].startswith("mongo")
+        assert threads[0] != threading.main_thread().name
@@ -0,0 +1,106 @@
+import asyncio
+import time
+
+import pytest
+from aiogram.exceptions import TelegramRetryAfter
+from aiogram.methods import SendMessage
+
+from bot_lib.core.rate_limiter import OutboundScheduler, TokenBucket
+
+
+class TestTokenBucket:
+    def test_burst_then_rate(self):
+        async def run():
+            bucket = TokenBucket(rate=20, capacity=2)
+            start = time.monotonic()
+            for _ in range(4):
+                await bucket.acquire()
+            return time.monotonic() - start
+
+        # 2 tokens from the burst, 2 more at 20/s
+        assert 0.08 <= asyncio.run(run()) < 0.5
+
+
+class TestOutboundScheduler:
+    def test_keeps_per_chat_order(self):
+        async def run():
+            scheduler = OutboundScheduler(private_chat_rate=100, private_chat_burst=100)
+            sent = []
+
+            async def send(i):
+                await asyncio.sleep(0.01 * (5 - i))
+                sent.append(i)
+                return i
+
+            results = await asyncio.gather(*[scheduler.submit(1, lambda i=i: send(i)) for i in range(5)])
+            return sent, results, scheduler.get_stats()
+
+        sent, results, stats = asyncio.run(run())
+        assert sent == results == [0, 1, 2, 3, 4]
+        assert stats["sent"] == 5
+        assert stats["queue_depth"] == 0
+
+    def test_retry_after(self):
+        async def run():
+            scheduler = OutboundScheduler(max_retries=1)
+            calls = []
+
+            async def send():
+                calls.append(time.monotonic())
+                if len(calls) == 1:
+                    raise TelegramRetryAfter(SendMessage(chat_id=1, text="hi"), "Too Many Requests", retry_after=0.2)
+                return "ok"
+
+            return await scheduler.submit(1, send), calls, scheduler.stats
+
+        result, calls, stats = asyncio.run(run())
+        assert result == "ok"
+        assert calls[1] - calls[0] >= 0.2
+        assert stats.retries == 1
+
+    def test_retries_exhausted(self):
+        async def run():
+            scheduler = OutboundScheduler(max_retries=0)
+
+            async def send():
+                raise TelegramRetryAfter(SendMessage(chat_id=1, text="hi"), "Too Many Requests", retry_after=1)
+
+            await scheduler.submit(1, send)
+
+        with pytest.raises(TelegramRetryAfter):
+            asyncio.run(run())
+
+    def test_channel_username(self):
+        async def run():
+            scheduler = OutboundScheduler()
+
+            async def send():
+                return "ok"
+
+            return await scheduler.submit("@channelname", send)
+
+        assert asyncio.run(run()) == "ok"
+        assert not OutboundScheduler.is_private_chat("@channelname")
+
+    def test_retry_after_pauses_other_chats(self):
+        async def run():
+            scheduler = OutboundScheduler(max_retries=1)
+            calls = []
+
+            async def flooded():
+                calls.append(("flooded", time.monotonic()))
+                if len(calls) == 1:
+                    raise TelegramRetryAfter(SendMessage(chat_id=1, text="hi"), "Too Many Requests", retry_after=0.2)
+
+            async def other():
+                calls.append(("other", time.monotonic()))
+
+            start = time.monotonic()
+            task = asyncio.create_task(scheduler.submit(1, flooded))
+            await asyncio.sleep(0.05)
+            await scheduler.submit(2, other)
+            await task
+            return start, dict(calls[1:])
+
+        start, calls = asyncio.run(run())
+        assert calls["other"] - start >= 0.2
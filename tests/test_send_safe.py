@@ -0,0 +1,65 @@
+import asyncio
+
+import pytest
+from aiogram.exceptions import TelegramBadRequest
+
+from bot_lib.handlers.handler import Handler, HandlerConfig
+from bot_lib.migration_bot_base.utils.text_utils import split_long_message
+from bot_lib.testing import FakeBotAPI
+
+CHAT_ID = 1
+LONG_TEXT = "\n".join(f"line {i:04d} of a long message" for i in range(400))  # ~12000 characters
+
+
+def run_send(api: FakeBotAPI, rate_limit_enabled=True, on_send=None, **kwargs):
+    async def main():
+        async with api:
+            config = HandlerConfig(send_long_messages_as_files=False, rate_limit_enabled=rate_limit_enabled)
+            handler = Handler(config=config)
+            handler.bot = api.create_bot()
+            if on_send is not None:
+                send_message = handler.bot.send_message
+
+                async def patched_send_message(*args, **kwargs):
+                    on_send()
+                    return await send_message(*args, **kwargs)
+
+                handler.bot.send_message = patched_send_message
+            try:
+                return await handler.send_safe(CHAT_ID, LONG_TEXT, **kwargs)
+            finally:
+                await handler.bot.session.close()
+
+    return asyncio.run(main())
+
+
+class TestSendChunks:
+    @pytest.mark.parametrize("rate_limit_enabled", [True, False])
+    def test_chunks_in_order(self, rate_limit_enabled):
+        api = FakeBotAPI()
+        messages = run_send(api, rate_limit_enabled=rate_limit_enabled)
+        chunks = split_long_message(LONG_TEXT)
+        assert len(chunks) > 2
+        assert api.sent_texts(CHAT_ID) == chunks
+        assert [message.message_id for message in messages] == list(range(1, len(chunks) + 1))
+
+    def test_reply_chunks_to_first(self):
+        api = FakeBotAPI()
+        messages = run_send(api, reply_to_message_id=100, reply_chunks_to_first=True)
+        replies = [int(call.params["reply_to_message_id"]) for call in api.get_calls("sendMessage")]
+        assert replies == [100] + [messages[0].message_id] * (len(messages) - 1)
+
+    def test_failure_in_the_middle_stops_the_message(self):
+        api = FakeBotAPI()
+        sends = []
+
+        def on_send():
+            sends.append(1)
+            if len(sends) == 2:
+                # the second chunk fails - with the plain-text retry too
+                api.fail_next("sendMessage", 400, "Bad Request: chat not found", times=2)
+
+        with pytest.raises(TelegramBadRequest, match="chat not found"):
+            run_send(api, on_send=on_send)
+        # the rest of the message is not sent after the gap
+        assert api.sent_texts(CHAT_ID) == split_long_message(LONG_TEXT)[:1]
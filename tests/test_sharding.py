@@ -0,0 +1,90 @@
+import asyncio
+import multiprocessing
+import os
+import random
+
+from aiogram import Bot, Dispatcher
+from aiogram.utils.backoff import BackoffConfig
+
+from bot_lib.core.sharding import ShardedDispatcher, get_shard, get_update_chat_id, polling_source
+from bot_lib.testing import FakeBotAPI
+
+# filled in the worker processes, inherited with fork
+results = None
+
+
+def make_update(update_id: int, chat_id: int, text: str) -> dict:
+    return {
+        "update_id": update_id,
+        "message": {
+            "message_id": update_id,
+            "date": 0,
+            "chat": {"id": chat_id, "type": "private"},
+            "from": {"id": chat_id, "is_bot": False, "first_name": "User"},
+            "text": text,
+        },
+    }
+
+
+def setup(shard: int):
+    dp = Dispatcher()
+
+    @dp.message()
+    async def handler(message):
+        # random delays - later updates would overtake earlier ones without per-chat ordering
+        await asyncio.sleep(random.random() / 100)
+        results.put((message.chat.id, int(message.text), os.getpid()))
+
+    return dp, Bot("42:TEST")
+
+
+async def fake_source(updates):
+    for update in updates:
+        yield update
+
+
+class TestShardedDispatcher:
+    def test_chat_id(self):
+        assert get_update_chat_id(make_update(1, 5, "x")) == 5
+        callback = {"update_id": 2, "callback_query": {"id": "1", "from": {"id": 7}, "message": {"chat": {"id": 8}}}}
+        assert get_update_chat_id(callback) == 8
+        assert get_shard(make_update(1, 5, "x"), 4) == get_shard(make_update(2, 5, "y"), 4)
+
+    def test_per_chat_order_and_affinity(self):
+        global results
+        context = multiprocessing.get_context("fork")
+        results = context.Queue()
+        chats = [100 + i for i in range(8)]
+        updates = [make_update(i, chats[i % len(chats)], str(i)) for i in range(200)]
+
+        sharded = ShardedDispatcher(setup, num_workers=3, start_method="fork")
+        asyncio.run(sharded.run(fake_source(updates)))
+
+        received = [results.get(timeout=5) for _ in updates]
+        by_chat = {}
+        pids = {}
+        for chat_id, number, pid in received:
+            by_chat.setdefault(chat_id, []).append(number)
+            pids.setdefault(chat_id, set()).add(pid)
+        for chat_id in chats:
+            assert by_chat[chat_id] == sorted(by_chat[chat_id])
+            assert len(pids[chat_id]) == 1
+        assert len({pid for chat_pids in pids.values() for pid in chat_pids}) == 3
+        assert sum(sharded.routed) == len(updates)
+
+    def test_polling_source_retries_errors(self):
+        async def main():
+            async with FakeBotAPI() as api:
+                api.fail_next("getUpdates", 502, "Bad Gateway", times=2)
+                api.push_update(make_update(1, 5, "first"))
+                api.push_update(make_update(2, 5, "second"))
+                source = polling_source(
+                    api.create_bot(), timeout=0, backoff_config=BackoffConfig(0.01, 0.05, factor=2, jitter=0)
+                )
+                texts = [(await source.__anext__())["message"]["text"] for _ in range(2)]
+                await source.aclose()
+                return texts, [call.status for call in api.get_calls("getUpdates")]
+
+        texts, statuses = asyncio.run(main())
+        assert texts == ["first", "second"]
+        assert statuses == [502, 502, 200]
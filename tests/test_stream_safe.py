@@ -0,0 +1,107 @@
+import asyncio
+import json
+import time
+
+from aiogram.types import InlineKeyboardButton, InlineKeyboardMarkup
+
+from bot_lib.handlers.handler import Handler, HandlerConfig
+from bot_lib.migration_bot_base.utils.text_utils import MAX_TELEGRAM_MESSAGE_LENGTH
+from bot_lib.testing import FakeBotAPI
+
+CHAT_ID = 1
+
+
+async def pieces(*texts):
+    for text in texts:
+        yield text
+
+
+def run_stream(stream, api: FakeBotAPI = None, config: HandlerConfig = None, **kwargs):
+    api = api or FakeBotAPI()
+    config = config or HandlerConfig(rate_limit_enabled=False, stream_edit_interval=0)
+
+    async def main():
+        async with api:
+            handler = Handler(config=config)
+            handler.bot = api.create_bot()
+            try:
+                return await handler.stream_safe(CHAT_ID, stream, **kwargs)
+            finally:
+                await handler.bot.session.close()
+
+    return asyncio.run(main()), api
+
+
+def final_texts(api: FakeBotAPI) -> dict:
+    """message_id -> the last text shown in it"""
+    texts = {}
+    message_ids = iter(range(1, 1000))
+    for call in api.get_calls():
+        if call.status != 200:
+            continue
+        if call.method == "sendMessage":
+            texts[next(message_ids)] = call.params["text"]
+        elif call.method == "editMessageText":
+            texts[int(call.params["message_id"])] = call.params["text"]
+    return texts
+
+
+class TestStreamSafe:
+    def test_final_edit_with_parse_mode(self):
+        messages, api = run_stream(pieces("Hello", ", <b>world</b>"), parse_mode="HTML")
+        assert len(messages) == 1
+        edits = api.get_calls("editMessageText")
+        assert edits[-1].params["text"] == "Hello, <b>world</b>"
+        assert edits[-1].params["parse_mode"] == "HTML"
+        # intermediate edits are plain text
+        assert all("parse_mode" not in call.params for call in edits[:-1])
+
+    def test_edits_throttled(self):
+        config = HandlerConfig(rate_limit_enabled=False, stream_edit_interval=60)
+        messages, api = run_stream(pieces(*[f"word{i} " for i in range(20)]), config=config, parse_mode="HTML")
+        assert len(messages) == 1
+        # the first piece and the final text
+        assert api.count("editMessageText") == 2
+        assert api.get_calls("editMessageText")[-1].params["text"].split()[-1] == "word19"
+
+    def test_buffered_text_shown_while_stream_pauses(self):
+        resumed = []
+
+        async def paused_stream():
+            yield "Hello"
+            yield " there"  # buffered - the interval is not up yet
+            await asyncio.sleep(0.5)  # e.g. a tool call
+            resumed.append(time.monotonic())
+            yield " world"
+
+        config = HandlerConfig(rate_limit_enabled=False, stream_edit_interval=0.1)
+        messages, api = run_stream(paused_stream(), config=config, parse_mode="HTML")
+        edits = api.get_calls("editMessageText")
+        paused_edit = [call for call in edits if call.params["text"] == "Hello there"]
+        assert paused_edit and paused_edit[0].time < resumed[0]
+        assert edits[-1].params["text"] == "Hello there world"
+
+    def test_rollover(self):
+        words = [f"word{i:04d} " for i in range(1200)]  # ~12000 characters
+        messages, api = run_stream(pieces(*words), parse_mode="HTML")
+        assert len(messages) > 1
+        texts = final_texts(api)
+        assert len(texts) == len(messages)
+        assert all(len(text) <= MAX_TELEGRAM_MESSAGE_LENGTH for text in texts.values())
+        # chunks may split a word - compare without whitespace
+        shown = "".join(texts[message.message_id] for message in messages)
+        assert shown.replace(" ", "") == "".join(words).replace(" ", "")
+
+    def test_empty_stream_deletes_placeholder(self):
+        messages, api = run_stream(pieces("", " "))
+        assert messages == []
+        assert api.count("sendMessage") == 1
+        assert api.count("deleteMessage") == 1
+
+    def test_reply_markup_kept_on_all_messages(self):
+        markup = InlineKeyboardMarkup(inline_keyboard=[[InlineKeyboardButton(text="Stop", callback_data="stop")]])
+        words = [f"word{i:04d} " for i in range(600)]  # two messages
+        messages, api = run_stream(pieces(*words), parse_mode="HTML", reply_markup=markup)
+        assert len(messages) == 2
+        calls = api.get_calls("sendMessage") + api.get_calls("editMessageText")
+        assert all(json.loads(call.params["reply_markup"]) == markup.model_dump(exclude_none=True) for call in calls)
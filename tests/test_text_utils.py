@@ -0,0 +1,109 @@
+import time
+
+import pytest
+from aiogram.enums import ParseMode
+
+from bot_lib.migration_bot_base.utils.text_utils import (
+    ParseModeCache,
+    check_markup,
+    escape_md,
+    iter_message_chunks,
+    split_long_message,
+    utf16_len,
+)
+
+
+class TestSplitLongMessage:
+    def test_split_on_separator(self):
+        text = "\n".join(["a" * 30] * 10)
+        chunks = split_long_message(text, max_length=100)
+        assert "".join(chunks) == text
+        assert all(len(chunk) <= 100 for chunk in chunks)
+        assert all(chunk.endswith("\n") for chunk in chunks[:-1])
+
+    def test_no_separator(self):
+        chunks = split_long_message("a" * 250, max_length=100)
+        assert chunks == ["a" * 100, "a" * 100, "a" * 50]
+
+    def test_generator(self):
+        chunks = iter_message_chunks("a" * 250, max_length=100)
+        assert next(chunks) == "a" * 100
+
+    def test_utf16_length(self):
+        text = "😀" * 100
+        chunks = split_long_message(text, max_length=50)
+        assert "".join(chunks) == text
+        assert all(utf16_len(chunk) <= 50 for chunk in chunks)
+        assert len(chunks) == 4
+
+    def test_code_block_reopened(self):
+        text = "intro\n```python\n" + "\n".join(f"x = {i}" for i in range(100)) + "\n```\ndone"
+        chunks = split_long_message(text, max_length=200, parse_mode=ParseMode.MARKDOWN)
+        assert len(chunks) > 1
+        for chunk in chunks:
+            assert utf16_len(chunk) <= 200
+            assert chunk.count("```") % 2 == 0
+        assert all(chunk.startswith("```python\n") for chunk in chunks[1:-1])
+
+    def test_html_tags_reopened(self):
+        text = "<b>" + "bold text " * 50 + "</b>"
+        chunks = split_long_message(text, max_length=100, parse_mode=ParseMode.HTML)
+        assert len(chunks) > 1
+        assert all(check_markup(chunk, ParseMode.HTML) for chunk in chunks)
+
+    def test_nested_html_closers_fit(self):
+        text = "<blockquote><b><i><u><s>" + "nested text 😀 " * 40 + "</s></u></i></b></blockquote>"
+        chunks = split_long_message(text, max_length=100, parse_mode=ParseMode.HTML)
+        assert len(chunks) > 1
+        for chunk in chunks:
+            assert utf16_len(chunk) <= 100
+            assert check_markup(chunk, ParseMode.HTML)
+
+
+class TestCheckMarkup:
+    @pytest.mark.parametrize(
+        "text, parse_mode, expected",
+        [
+            ("Hello *world*", ParseMode.MARKDOWN_V2, True),
+            ("Hello world.", ParseMode.MARKDOWN_V2, False),
+            (escape_md("Hello world. (1 + 1 = 2)!"), ParseMode.MARKDOWN_V2, True),
+            ("*bold", ParseMode.MARKDOWN_V2, False),
+            ("[link](http://example.com)", ParseMode.MARKDOWN_V2, True),
+            ("```python\nprint(1.0)\n```", ParseMode.MARKDOWN_V2, True),
+            ("*bold* _italic_ `code.py`", ParseMode.MARKDOWN, True),
+            ("*bold", ParseMode.MARKDOWN, False),
+            ("<b>bold</b> &amp; <i>italic</i>", ParseMode.HTML, True),
+            ("<b>bold", ParseMode.HTML, False),
+            ("1 < 2", ParseMode.HTML, False),
+            ("<div>unsupported</div>", ParseMode.HTML, False),
+            ("anything. goes!", None, True),
+        ],
+    )
+    def test_check_markup(self, text, parse_mode, expected):
+        assert check_markup(text, parse_mode) is expected
+
+
+class TestParseModeCache:
+    def test_check_and_mark_failed(self):
+        cache = ParseModeCache()
+        assert not cache.check(1, "broken *markdown", ParseMode.MARKDOWN)
+        assert cache.check(1, "fine *markdown*", ParseMode.MARKDOWN)
+
+        cache.mark_failed(1, "fine *markdown*", ParseMode.MARKDOWN)
+        # known to fail in this chat - only this exact text
+        assert not cache.check(1, "fine *markdown*", ParseMode.MARKDOWN)
+        assert cache.check(1, "other *text*", ParseMode.MARKDOWN)
+        assert cache.check(2, "fine *markdown*", ParseMode.MARKDOWN)
+
+    def test_failure_expires(self):
+        cache = ParseModeCache(ttl=0.05)
+        cache.mark_failed(1, "*text*", ParseMode.MARKDOWN)
+        assert not cache.check(1, "*text*", ParseMode.MARKDOWN)
+        time.sleep(0.1)
+        assert cache.check(1, "*text*", ParseMode.MARKDOWN)
+
+    def test_maxsize(self):
+        cache = ParseModeCache(maxsize=2)
+        for i in range(5):
+            cache.mark_failed(i, "text", ParseMode.HTML)
+        assert len(cache._failed) == 2
@@ -0,0 +1,126 @@
+import asyncio
+import json
+import os
+import signal
+import socket
+import subprocess
+import sys
+import time
+import urllib.request
+
+import pytest
+from aiogram import Bot, Dispatcher
+from aiohttp.test_utils import TestClient, TestServer
+
+from bot_lib.core.webhook import build_webhook_app
+
+SECRET = "secret"
+UPDATE = {
+    "update_id": 1,
+    "message": {
+        "message_id": 1,
+        "date": 0,
+        "chat": {"id": 1, "type": "private"},
+        "from": {"id": 1, "is_bot": False, "first_name": "User"},
+        "text": "hello",
+    },
+}
+
+
+def make_app(processed: list):
+    dp = Dispatcher()
+
+    @dp.message()
+    async def handler(message):
+        await asyncio.sleep(0.2)
+        processed.append(message.text)
+
+    bot = Bot("42:TEST")
+    return build_webhook_app(dp, bot, path="/webhook", secret_token=SECRET, drain_timeout=5)
+
+
+class TestWebhook:
+    def test_secret_token_checked(self):
+        async def main():
+            async with TestClient(TestServer(make_app([]))) as client:
+                response = await client.post("/webhook", json=UPDATE, headers={"X-Telegram-Bot-Api-Secret-Token": "x"})
+                return response.status
+
+        assert asyncio.run(main()) == 401
+
+    def test_acknowledged_before_processing_and_drained_on_shutdown(self):
+        processed = []
+
+        async def main():
+            async with TestClient(TestServer(make_app(processed))) as client:
+                response = await client.post(
+                    "/webhook", json=UPDATE, headers={"X-Telegram-Bot-Api-Secret-Token": SECRET}
+                )
+                assert response.status == 200
+                assert processed == []
+            # server shutdown waits for the update in progress
+
+        asyncio.run(main())
+        assert processed == ["hello"]
+
+
+WORKERS_SCRIPT = """
+import asyncio, sys
+from aiogram import Bot, Dispatcher
+from bot_lib.utils import run_webhook
+
+dp = Dispatcher()
+
+@dp.message()
+async def handler(message):
+    await asyncio.sleep(1)
+    with open(sys.argv[2], "a") as f:
+        f.write(message.text + "\\n")
+
+run_webhook(dp, Bot("42:TEST"), port=int(sys.argv[1]), secret_token="secret", workers=2, set_webhook=False)
+"""
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def wait_for_port(port: int, timeout: float = 20):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            socket.create_connection(("127.0.0.1", port), timeout=1).close()
+            return
+        except OSError:
+            time.sleep(0.1)
+    raise TimeoutError(f"port {port} is not open")
+
+
+@pytest.mark.skipif(not hasattr(os, "fork"), reason="multiple workers require fork")
+class TestWebhookWorkers:
+    def test_ctrl_c_drains_updates_in_progress(self, tmp_path):
+        script = tmp_path / "bot.py"
+        script.write_text(WORKERS_SCRIPT)
+        output = tmp_path / "processed.txt"
+        port = free_port()
+        process = subprocess.Popen(
+            [sys.executable, str(script), str(port), str(output)], start_new_session=True, env=os.environ.copy()
+        )
+        try:
+            wait_for_port(port)
+            request = urllib.request.Request(
+                f"http://127.0.0.1:{port}/webhook",
+                data=json.dumps(UPDATE).encode(),
+                headers={"Content-Type": "application/json", "X-Telegram-Bot-Api-Secret-Token": SECRET},
+            )
+            assert urllib.request.urlopen(request, timeout=5).status == 200
+            time.sleep(0.3)
+            # Ctrl+C: SIGINT to the whole process group, then the parent forwards SIGTERM to the workers
+            os.killpg(process.pid, signal.SIGINT)
+            assert process.wait(timeout=20) == 0
+        finally:
+            if process.poll() is None:
+                os.killpg(process.pid, signal.SIGKILL)
+        assert output.read_text() == "hello\n"